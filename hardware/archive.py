@@ -0,0 +1,65 @@
+import argparse
+import sqlite3
+import time
+
+from parking_db import ARCHIVE_BATCH, DB_FILE, ParkingDB
+
+RETENTION_DAYS = 180  # paid sessions and violations older than this leave parking.db
+DAY = 24 * 3600
+
+
+def archive(db, before_ts, batch=ARCHIVE_BATCH, pause=0.0):
+    """Move everything older than `before_ts` into the archive, a batch at a time.
+
+    Each batch holds the write lock for a few milliseconds only, so the
+    gates keep logging while a large backlog drains; `pause` spaces the
+    batches out further.
+    """
+    moved = {'sessions': 0, 'violations': 0}
+    for kind, move in (('sessions', db.archive_sessions), ('violations', db.archive_violations)):
+        while True:
+            count = move(before_ts, batch)
+            moved[kind] += count
+            if count < batch:
+                break
+            time.sleep(pause)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move old closed sessions and violations to the archive database')
+    parser.add_argument('--days', type=float, default=RETENTION_DAYS, help='retention horizon in days')
+    parser.add_argument('--batch', type=int, default=ARCHIVE_BATCH, help='rows moved per transaction')
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds to wait between batches')
+    parser.add_argument('--full-vacuum', action='store_true',
+                        help='one-off VACUUM to enable incremental vacuum on an older database (blocks writers)')
+    parser.add_argument('--db', default=DB_FILE, help='SQLite database')
+    args = parser.parse_args()
+    if args.days < 1:
+        parser.error('--days must be at least 1 (the gates read recent exits)')
+
+    db = ParkingDB(args.db)
+    try:
+        before_ts = time.time() - args.days * DAY
+        started = time.perf_counter()
+        try:
+            moved = archive(db, before_ts, args.batch, args.pause)
+        except sqlite3.IntegrityError as e:
+            # An id already archived with different content: nothing was deleted
+            print(f"[ERROR] Archive stopped, {db.archive_file} already holds a different row: {e}")
+            return
+        print(f"[ARCHIVE] Moved {moved['sessions']} sessions and {moved['violations']} violations "
+              f"to {db.archive_file} in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        freed = db.compact(full=args.full_vacuum)
+        if freed is None:
+            print("[ARCHIVE] auto_vacuum is not incremental; run once with --full-vacuum to let the file shrink")
+        else:
+            print(f"[ARCHIVE] Released {freed} pages and ran ANALYZE in {time.perf_counter() - started:.2f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
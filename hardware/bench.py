@@ -0,0 +1,225 @@
+import argparse
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+
+from ocr_engine import BACKENDS, DEFAULT_TESSERACT_CONFIG, OcrEnginePool, otsu_threshold
+from parking_db import ParkingDB
+from replay import ReplaySource
+from tracker import PlateTracker
+
+DEFAULT_MODEL = '../model_dev/runs/detect/train/weights/best.pt'
+DEFAULT_SOURCE = '../model_dev/dataset/images'
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class StageTimer:
+    """Collects wall-clock latencies per pipeline stage."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def time(self, stage):
+        return _Timing(self.samples[stage])
+
+    def report(self):
+        stages = {}
+        for stage, values in self.samples.items():
+            values = sorted(values)
+            stages[stage] = {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 50), 3),
+                'p95_ms': round(percentile(values, 95), 3),
+                'p99_ms': round(percentile(values, 99), 3),
+            }
+        return stages
+
+
+class _Timing:
+    def __init__(self, samples):
+        self.samples = samples
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.samples.append((time.perf_counter() - self.start) * 1000)
+
+
+class YoloDetector:
+    """Plate boxes from the trained YOLO model."""
+
+    def __init__(self, model_path):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+
+    def detect(self, frame, source):
+        results = self.model(frame, verbose=False)[0]
+        return [tuple(map(int, box.xyxy[0])) for box in results.boxes]
+
+
+class LabelDetector:
+    """Plate boxes from the YOLO label files next to a replayed image folder.
+
+    Lets the rest of the pipeline be benchmarked without model weights.
+    """
+
+    def __init__(self, labels_dir):
+        self.labels_dir = labels_dir
+
+    def detect(self, frame, source):
+        if not source.name:
+            return []
+        stem = os.path.splitext(os.path.basename(source.name))[0]
+        path = os.path.join(self.labels_dir, f'{stem}.txt')
+        if not os.path.exists(path):
+            return []
+
+        height, width = frame.shape[:2]
+        boxes = []
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 5:
+                    continue
+                cx, cy, bw, bh = (float(p) for p in parts[1:])
+                boxes.append((
+                    max(int((cx - bw / 2) * width), 0), max(int((cy - bh / 2) * height), 0),
+                    min(int((cx + bw / 2) * width), width), min(int((cy + bh / 2) * height), height)
+                ))
+        return boxes
+
+
+class EntryDecision:
+    """The entry gate's DB decision, run against a scratch copy of the database."""
+
+    def __init__(self, db_file):
+        self.db = ParkingDB(db_file)
+
+    def decide(self, plate):
+        if self.db.has_unpaid_record(plate):
+            return 'denied'
+        self.db.add_entry(plate)
+        return 'granted'
+
+    def close(self):
+        self.db.close()
+
+
+def run_bench(source, detector, ocr, tracker, decision):
+    """Replay every frame through the pipeline and return the JSON report."""
+    timer = StageTimer()
+    frames = decisions = ocr_calls = vehicles = 0
+    current = object()
+    started = time.perf_counter()
+
+    while True:
+        with timer.time('capture'):
+            ok, frame = source.read()
+        if not ok:
+            break
+        frames += 1
+
+        # Each still image is a different vehicle: start it with no tracks,
+        # as the gates do on the sensor's arrival event
+        if source.name != current:
+            current = source.name
+            tracker.reset()
+            vehicles += 1
+
+        with timer.time('detect'):
+            boxes = detector.detect(frame, source)
+
+        with timer.time('track'):
+            tracks = tracker.update(boxes)
+
+        for track, (x1, y1, x2, y2) in zip(tracks, boxes):
+            if track.decided or x2 <= x1 or y2 <= y1:
+                continue
+
+            with timer.time('preprocess'):
+                processed = otsu_threshold(frame[y1:y2, x1:x2])
+
+            with timer.time('ocr'):
+                chars = ocr.recognize_chars(processed)
+            ocr_calls += 1
+
+            with timer.time('validate'):
+                plate = track.vote(chars)
+
+            if plate:
+                with timer.time('decision'):
+                    decision.decide(plate)
+                decisions += 1
+
+    elapsed = time.perf_counter() - started
+    return {
+        'frames': frames,
+        'vehicles': vehicles,
+        'ocr_calls': ocr_calls,
+        'decisions': decisions,
+        'elapsed_s': round(elapsed, 3),
+        'fps': round(frames / elapsed, 2) if elapsed else 0.0,
+        'decisions_per_s': round(decisions / elapsed, 2) if elapsed else 0.0,
+        'ocr_backend': ocr.backend,
+        'stages': timer.report(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless replay benchmark of the recognition pipeline')
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help='Video file or image directory')
+    parser.add_argument('--repeat', type=int, default=3, help='Frames per still image')
+    parser.add_argument('--detector', choices=('yolo', 'labels'), default='yolo')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='YOLO weights for --detector yolo')
+    parser.add_argument('--labels', default=None, help='Label directory for --detector labels')
+    parser.add_argument('--ocr-backend', choices=BACKENDS, default='auto')
+    parser.add_argument('--db', default='parking.db', help='Database copied to a scratch file')
+    parser.add_argument('--output', default=None, help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    source = ReplaySource(args.source, repeat=args.repeat)
+    if not source.isOpened():
+        print(f"[ERROR] Cannot open replay source {args.source}")
+        return
+
+    if args.detector == 'labels':
+        labels = args.labels or os.path.join(os.path.dirname(os.path.abspath(args.source)), 'labels')
+        detector = LabelDetector(labels)
+    else:
+        detector = YoloDetector(args.model)
+
+    scratch_dir = tempfile.mkdtemp(prefix='parking-bench-')
+    scratch_db = os.path.join(scratch_dir, 'parking.db')
+    shutil.copy(args.db, scratch_db)
+    decision = EntryDecision(scratch_db)
+
+    try:
+        with OcrEnginePool(DEFAULT_TESSERACT_CONFIG, backend=args.ocr_backend) as ocr:
+            report = run_bench(source, detector, ocr, PlateTracker(), decision)
+    finally:
+        source.release()
+        decision.close()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    report['source'] = args.source
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
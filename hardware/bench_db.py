@@ -0,0 +1,188 @@
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import string
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import parking_db
+from parking_db import TIME_FORMAT, ParkingDB
+
+LOOKUPS = 2000
+EXIT_WINDOW = 5 * 60  # seconds
+
+# The gate queries as they ran before the indexed schema: text timestamps,
+# every paid row fetched and parsed in Python for the exit window.
+LEGACY_HAS_UNPAID = 'SELECT * FROM entries WHERE car_plate = ? AND payment_status = 0'
+LEGACY_PAID_EXITS = '''
+    SELECT no, entry_time, exit_time, payment_status FROM entries
+    WHERE car_plate = ? AND payment_status = 1 AND exit_time != ''
+    ORDER BY exit_time DESC
+'''
+LEGACY_OPEN_SESSION = '''
+    SELECT no, entry_time FROM entries
+    WHERE car_plate = ? AND payment_status = 0 AND exit_time = ''
+    ORDER BY entry_time DESC LIMIT 1
+'''
+LEGACY_NEXT_ENTRY_NO = 'SELECT MAX(no) FROM entries'
+
+
+def random_plate(rng):
+    letters = string.ascii_uppercase
+    return f"RA{rng.choice(letters)}{rng.randint(0, 999):03d}{rng.choice(letters)}"
+
+
+def synthetic_rows(count, seed=42):
+    """Yield `count` historical sessions: mostly closed and paid, a few still inside."""
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=3 * 365)
+    step = (3 * 365 * 24 * 3600) / count
+    for no in range(1, count + 1):
+        entry = start + timedelta(seconds=no * step)
+        inside = rng.random() < 0.001
+        exit_time = '' if inside else (entry + timedelta(minutes=rng.randint(5, 600))).strftime(TIME_FORMAT)
+        yield (
+            no,
+            entry.strftime(TIME_FORMAT),
+            exit_time,
+            random_plate(rng),
+            None if inside else round(rng.uniform(50, 5000), 2),
+            0 if inside else 1,
+        )
+
+
+def build_database(path, count):
+    """Create the pre-index (migration 1, rollback journal) schema filled with `count` rows."""
+    conn = sqlite3.connect(path)
+    parking_db.migrate(conn, target=1)
+    conn.executemany(
+        'INSERT INTO entries (no, entry_time, exit_time, car_plate, due_payment, payment_status) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        synthetic_rows(count)
+    )
+    conn.commit()
+    conn.close()
+
+
+def legacy_queries(conn):
+    def recent_paid_exit(plate):
+        now = datetime.now()
+        return [row for row in conn.execute(LEGACY_PAID_EXITS, (plate,))
+                if (now - datetime.strptime(row[2], TIME_FORMAT)).total_seconds() <= EXIT_WINDOW]
+
+    return {
+        'has_unpaid_record': lambda plate: conn.execute(LEGACY_HAS_UNPAID, (plate,)).fetchall(),
+        'recent_paid_exit': recent_paid_exit,
+        'open_session': lambda plate: conn.execute(LEGACY_OPEN_SESSION, (plate,)).fetchone(),
+        'next_entry_no': lambda: conn.execute(LEGACY_NEXT_ENTRY_NO).fetchone(),
+    }
+
+
+def current_queries(db):
+    return {
+        'has_unpaid_record': db.has_unpaid_record,
+        'recent_paid_exit': lambda plate: db.recent_paid_exit(plate, time.time() - EXIT_WINDOW),
+        'open_session': db.open_session,
+        'next_entry_no': db.next_entry_no,
+    }
+
+
+def time_queries(queries, plates):
+    """Latency (ms) of each gate-decision query over the sample plates."""
+    queries = dict(queries)
+    next_entry_no = queries.pop('next_entry_no')
+    report = {}
+    for name, query in queries.items():
+        latencies = []
+        for plate in plates:
+            start = time.perf_counter()
+            query(plate)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        report[name] = {
+            'p50_ms': round(latencies[len(latencies) // 2], 4),
+            'p95_ms': round(latencies[math.ceil(len(latencies) * 0.95) - 1], 4),  # nearest rank
+        }
+
+    start = time.perf_counter()
+    for _ in range(len(plates)):
+        next_entry_no()
+    report['next_entry_no'] = {'mean_ms': round((time.perf_counter() - start) * 1000 / len(plates), 4)}
+    return report
+
+
+def time_payments(db, plates):
+    """Latency (ms) of a card payment: open-session lookup plus the settle transaction."""
+    for plate in plates:
+        db.add_entry(plate)
+    latencies = []
+    for plate in plates:
+        start = time.perf_counter()
+        session = db.open_session(plate)
+        db.record_payment(session['no'], plate, 10.0, 100, 90)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'p50_ms': round(latencies[len(latencies) // 2], 4),
+        'p95_ms': round(latencies[math.ceil(len(latencies) * 0.95) - 1], 4),  # nearest rank
+    }
+
+
+def time_pages(db, plates, pages=20):
+    """Latency (ms) of dashboard pages: the first page, and walking `pages` deep by cursor."""
+    report = {}
+    for name in ('entries', 'exits', 'payments', 'violations'):
+        start = time.perf_counter()
+        _, cursor = db.page(name)
+        first = (time.perf_counter() - start) * 1000
+        walked, start = 0, time.perf_counter()
+        while cursor and walked < pages:
+            _, cursor = db.page(name, before=cursor)
+            walked += 1
+        report[name] = {'first_ms': round(first, 3),
+                        'next_ms': round((time.perf_counter() - start) * 1000 / max(walked, 1), 3)}
+    start = time.perf_counter()
+    for plate in plates[:200]:
+        db.page('exits', plate=plate)
+    report['exits_by_plate'] = {'mean_ms': round((time.perf_counter() - start) * 1000 / len(plates[:200]), 3)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gate-decision query latency before/after the indexed schema')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Synthetic entries to generate')
+    parser.add_argument('--lookups', type=int, default=LOOKUPS, help='Plates queried per measurement')
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    plates = [random_plate(rng) for _ in range(args.lookups)]
+
+    with tempfile.TemporaryDirectory(prefix='parking-bench-db-') as tmp:
+        path = os.path.join(tmp, 'parking.db')
+        started = time.perf_counter()
+        build_database(path, args.rows)
+        print(f"[BENCH] Built {args.rows} entries in {time.perf_counter() - started:.1f}s")
+
+        # Before: original schema and queries, no secondary indexes, default journal
+        conn = sqlite3.connect(path)
+        report = {'rows': args.rows, 'before': time_queries(legacy_queries(conn), plates)}
+        conn.close()
+
+        # After: migrated schema with indexes, epoch columns, WAL and cached statements
+        started = time.perf_counter()
+        after = ParkingDB(path)
+        report['migration_s'] = round(time.perf_counter() - started, 2)
+        report['after'] = time_queries(current_queries(after), plates)
+        report['after']['payment'] = time_payments(after, plates)
+        report['after']['pages'] = time_pages(after, plates)
+        after.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import statistics
+import time
+
+import cv2
+
+from bench import percentile
+from ocr_engine import DEFAULT_TESSERACT_CONFIG, OcrEnginePool, otsu_threshold
+
+DATASET_DIR = '../model_dev/dataset'
+
+
+def load_plate_crops(dataset_dir, limit=None):
+    """Crop every labelled plate (YOLO txt labels) out of the dataset images."""
+    images_dir = os.path.join(dataset_dir, 'images')
+    labels_dir = os.path.join(dataset_dir, 'labels')
+    crops = []
+
+    for name in sorted(os.listdir(images_dir)):
+        stem = os.path.splitext(name)[0]
+        label_path = os.path.join(labels_dir, f'{stem}.txt')
+        if not os.path.exists(label_path):
+            continue
+
+        image = cv2.imread(os.path.join(images_dir, name))
+        if image is None:
+            continue
+        height, width = image.shape[:2]
+
+        with open(label_path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 5:
+                    continue
+                cx, cy, bw, bh = (float(p) for p in parts[1:])
+                x1 = max(int((cx - bw / 2) * width), 0)
+                y1 = max(int((cy - bh / 2) * height), 0)
+                x2 = min(int((cx + bw / 2) * width), width)
+                y2 = min(int((cy + bh / 2) * height), height)
+                if x2 > x1 and y2 > y1:
+                    crops.append(otsu_threshold(image[y1:y2, x1:x2]))
+
+        if limit and len(crops) >= limit:
+            return crops[:limit]
+
+    return crops
+
+
+def bench_backend(backend, crops, config):
+    """Time OCR over every crop with one backend; returns latency stats in ms."""
+    try:
+        pool = OcrEnginePool(config, size=1, backend=backend)
+    except RuntimeError as e:
+        return {'backend': backend, 'error': str(e)}
+
+    with pool:
+        try:
+            pool.recognize(crops[0])  # warm-up
+        except Exception as e:
+            return {'backend': pool.backend, 'error': str(e)}
+
+        latencies = []
+        for crop in crops:
+            start = time.perf_counter()
+            pool.recognize(crop)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    return {
+        'backend': backend,
+        'crops': len(latencies),
+        'mean_ms': round(statistics.mean(latencies), 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-crop OCR latency for each backend')
+    parser.add_argument('--dataset', default=DATASET_DIR, help='Dataset with images/ and labels/')
+    parser.add_argument('--limit', type=int, default=None, help='Max number of crops')
+    args = parser.parse_args()
+
+    crops = load_plate_crops(args.dataset, args.limit)
+    if not crops:
+        print("[ERROR] No plate crops found")
+        return
+
+    print(f"[BENCH] {len(crops)} plate crops from {args.dataset}")
+    for backend in ('tesserocr', 'pytesseract'):
+        print(json.dumps(bench_backend(backend, crops, DEFAULT_TESSERACT_CONFIG)))
+
+
+if __name__ == "__main__":
+    main()
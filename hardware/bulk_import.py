@@ -0,0 +1,259 @@
+import argparse
+import csv
+import hashlib
+import os
+import re
+import time
+from itertools import islice
+
+from parking_db import DB_FILE, SQL_LOT_STATUS, connect
+
+DEFAULT_FILES = ('db.csv', 'violations.csv', 'plates_log.csv')
+BATCH = 50000             # rows per transaction
+CACHE_KB = 200000         # page cache for the import connection (index inserts on big tables)
+REPORT_INTERVAL = 5.0     # seconds between progress lines
+MAX_REPORTED = 20         # rejected rows printed per file (all are counted)
+TIME_RE = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+
+
+def normalize(name):
+    """Header as a column name: 'due payment' and 'Payment Status' become 'due_payment' and 'payment_status'."""
+    return '_'.join(name.strip().lower().split())
+
+
+# Field converters; a ValueError rejects the row
+def as_time(value):
+    value = value.strip()
+    if not TIME_RE.match(value):
+        raise ValueError(f"bad time '{value}'")
+    return value
+
+
+def as_optional_time(value):
+    return as_time(value) if value.strip() else ''
+
+
+def as_plate(value):
+    plate = value.strip().upper()
+    if not plate:
+        raise ValueError('missing plate')
+    return plate
+
+
+def as_status(value):
+    status = int(value.strip() or 0)
+    if status not in (0, 1):
+        raise ValueError(f"bad payment status '{value}'")
+    return status
+
+
+def as_amount(value):
+    value = value.strip()
+    return float(value) if value else None
+
+
+def as_text(value):
+    return value.strip()
+
+
+# File kinds, told apart by their (normalized) header. `columns` are the CSV
+# columns read, in staging-table order; `insert` moves the new rows of a
+# batch from the staging table into parking.db. Besides the hash check, rows
+# already in the database (e.g. loaded by the old migrate_to_db.py) are
+# recognised by content, so an import never double-counts a session.
+SOURCES = {
+    'entries': {
+        'header': {'entry_time', 'car_plate'},
+        'columns': {'entry_time': as_time, 'exit_time': as_optional_time, 'car_plate': as_plate,
+                    'due_payment': as_amount, 'payment_status': as_status},
+        'insert': '''
+            INSERT INTO entries (entry_time, exit_time, car_plate, due_payment, payment_status, entry_ts, exit_ts)
+            SELECT entry_time, exit_time, car_plate, due_payment, payment_status,
+                   CAST(strftime('%s', entry_time, 'utc') AS INTEGER),
+                   CAST(strftime('%s', NULLIF(exit_time, ''), 'utc') AS INTEGER)
+            FROM staging_entries AS s
+            WHERE NOT EXISTS (SELECT 1 FROM import_hashes AS h WHERE h.hash = s.hash)
+              AND NOT EXISTS (SELECT 1 FROM entries AS e WHERE e.car_plate = s.car_plate
+                              AND e.entry_ts = CAST(strftime('%s', s.entry_time, 'utc') AS INTEGER))
+            ORDER BY s.rowid
+        ''',
+    },
+    'violations': {
+        'header': {'timestamp', 'gate_location'},
+        'columns': {'timestamp': as_time, 'car_plate': as_plate, 'gate_location': as_text, 'reason': as_text},
+        'insert': '''
+            INSERT INTO violations (timestamp, car_plate, gate_location, reason)
+            SELECT timestamp, car_plate, gate_location, reason
+            FROM staging_violations AS s
+            WHERE NOT EXISTS (SELECT 1 FROM import_hashes AS h WHERE h.hash = s.hash)
+              AND NOT EXISTS (SELECT 1 FROM violations AS v WHERE v.car_plate = s.car_plate
+                              AND v.timestamp = s.timestamp AND v.gate_location IS s.gate_location
+                              AND v.reason IS s.reason)
+            ORDER BY s.rowid
+        ''',
+    },
+    'plate_log': {
+        'header': {'plate_number', 'timestamp'},
+        'columns': {'timestamp': as_time, 'plate_number': as_plate, 'payment_status': as_status},
+        'insert': '''
+            INSERT INTO plate_log (timestamp, car_plate, payment_status)
+            SELECT timestamp, plate_number, payment_status
+            FROM staging_plate_log AS s
+            WHERE NOT EXISTS (SELECT 1 FROM import_hashes AS h WHERE h.hash = s.hash)
+            ORDER BY s.rowid
+        ''',
+    },
+}
+SQL_PROGRESS = 'SELECT offset, lines, imported FROM import_progress WHERE path = ?'
+SQL_SAVE_PROGRESS = '''
+    INSERT INTO import_progress (path, offset, lines, imported, updated_ts) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (path) DO UPDATE SET
+        offset = excluded.offset, lines = excluded.lines, imported = excluded.imported, updated_ts = excluded.updated_ts
+'''
+
+
+def detect(header):
+    """The SOURCES kind whose identifying columns are all in `header`."""
+    for kind, spec in SOURCES.items():
+        if spec['header'] <= set(header):
+            return kind
+    raise ValueError(f"unrecognised header {header}")
+
+
+def row_hash(kind, values):
+    return hashlib.blake2b('\x1f'.join([kind, *map(str, values)]).encode(), digest_size=16).digest()
+
+
+def parse_batches(f, kind, fields, batch, line):
+    """Yield (bytes, lines, valid, rows, rejects) for each `batch` lines of `f`.
+
+    `valid` counts the rows that passed validation; `rows` are those rows as
+    (hash, *values) with repeats inside the batch dropped; `rejects` are
+    (line number, reason). `line` is the number of the line before the
+    first one read. A batch never ends inside a quoted field that spans
+    lines (an odd number of quotes so far), so each committed offset is a
+    record boundary.
+    """
+    while True:
+        raw = list(islice(f, batch))
+        if not raw:
+            return
+        quotes = sum(l.count(b'"') for l in raw)
+        while quotes % 2:
+            more = f.readline()
+            if not more:
+                break
+            raw.append(more)
+            quotes += more.count(b'"')
+
+        rows, rejects, seen, valid = [], [], set(), 0
+        reader = csv.reader(l.decode('utf-8', 'replace') for l in raw)
+        number = line + 1
+        for record in reader:
+            if record:
+                try:
+                    values = [convert(record[i] if i < len(record) else '') for i, convert in fields]
+                except ValueError as e:
+                    rejects.append((number, e))
+                else:
+                    valid += 1
+                    digest = row_hash(kind, values)
+                    if digest not in seen:
+                        seen.add(digest)
+                        rows.append((digest, *values))
+            number = line + reader.line_num + 1
+        line += len(raw)
+        yield sum(map(len, raw)), len(raw), valid, rows, rejects
+
+
+def import_file(conn, path, batch=BATCH, restart=False):
+    """Import one CSV file, resuming after the last committed batch; returns its counts.
+
+    The file is read as raw lines so the byte offset after each batch can be
+    committed with the batch itself: an interrupted import picks up at the
+    first uncommitted line, and a file that has only grown since (db.csv is
+    appended to) imports just the new lines. A file that shrank is read
+    again from the start, its rows recognised by their hashes.
+    """
+    key = os.path.abspath(path)
+    counts = {'read': 0, 'imported': 0, 'rejected': 0}
+    with open(path, 'rb') as f:
+        header = [normalize(name) for name in next(csv.reader([f.readline().decode('utf-8-sig')]), [])]
+        kind = detect(header)
+        spec = SOURCES[kind]
+        # A column missing from the header reads as '' (index past the end of every row)
+        fields = [(header.index(column) if column in header else len(header), convert)
+                  for column, convert in spec['columns'].items()]
+        columns = ', '.join(spec['columns'])
+        conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS staging_{kind} (hash BLOB, {columns})")
+        stage = f"INSERT INTO staging_{kind} (hash, {columns}) VALUES (?{', ?' * len(spec['columns'])})"
+
+        offset, lines, imported = f.tell(), 0, 0
+        saved = conn.execute(SQL_PROGRESS, (key,)).fetchone()
+        if saved and not restart and saved[0] <= os.fstat(f.fileno()).st_size:
+            offset, lines, imported = saved
+        if lines:
+            print(f"[IMPORT] {path}: resuming after line {lines + 1}")
+        f.seek(offset)
+
+        started = reported = time.perf_counter()
+        for size, count, valid, rows, rejects in parse_batches(f, kind, fields, batch, lines + 1):
+            for number, reason in rejects[:max(0, MAX_REPORTED - counts['rejected'])]:
+                print(f"[SKIP] {path}:{number}: {reason}")
+            counts['rejected'] += len(rejects)
+            counts['read'] += valid
+            offset += size
+            lines += count
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(stage, rows)
+                added = conn.execute(spec['insert']).rowcount
+                conn.execute(f"INSERT OR IGNORE INTO import_hashes (hash) SELECT hash FROM staging_{kind}")
+                conn.execute(f"DELETE FROM staging_{kind}")
+                imported += added
+                conn.execute(SQL_SAVE_PROGRESS, (key, offset, lines, imported, int(time.time())))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            counts['imported'] += added
+
+            now = time.perf_counter()
+            if now - reported >= REPORT_INTERVAL:
+                print(f"[IMPORT] {path}: {lines} lines, {counts['read'] / (now - started):,.0f} rows/s")
+                reported = now
+
+    elapsed = time.perf_counter() - started
+    print(f"[IMPORT] {path} ({kind}): {counts['read']} rows, {counts['imported']} new, "
+          f"{counts['read'] - counts['imported']} already present, {counts['rejected']} rejected "
+          f"in {elapsed:.2f}s ({counts['read'] / max(elapsed, 1e-9):,.0f} rows/s)")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import legacy CSV logs into parking.db')
+    parser.add_argument('files', nargs='*', help=f"CSV files (default: {', '.join(DEFAULT_FILES)})")
+    parser.add_argument('--db', default=DB_FILE, help='SQLite database')
+    parser.add_argument('--batch', type=int, default=BATCH, help='rows per transaction')
+    parser.add_argument('--restart', action='store_true', help='ignore saved progress and read files from the start')
+    args = parser.parse_args()
+
+    files = args.files or [path for path in DEFAULT_FILES if os.path.exists(path)]
+    conn = connect(args.db)
+    conn.execute(f'PRAGMA cache_size = -{CACHE_KB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    try:
+        for path in files:
+            try:
+                import_file(conn, path, args.batch, args.restart)
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] {path}: {e}")
+        inside, capacity = conn.execute(SQL_LOT_STATUS).fetchone()
+        print(f"[LOT] {inside} open sessions counted as inside, capacity {capacity}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
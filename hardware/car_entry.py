@@ -1,102 +1,79 @@
-import platform
 import cv2
 from ultralytics import YOLO
-import pytesseract
+import logging
 import os
 import time
-import serial
-import sqlite3
-from collections import Counter
-from datetime import datetime
+
+from db_writer import DbWriter
+from device_manager import open_role
+from gate_actuator import GateActuator
+from ocr_engine import DEFAULT_TESSERACT_CONFIG, OcrEnginePool
+from parking_db import ParkingDB
+from sensor import UltrasonicSampler
+from serial_transport import SerialTransport
+from session_cache import ActiveSessions
+from tracker import PlateTracker
+
+# Show sensor/gate thread logs alongside the prints below
+logging.basicConfig(level=logging.INFO, format='[%(name)s] %(message)s')
 
 # Load YOLOv8 model
 model = YOLO('../model_dev/runs/detect/train/weights/best.pt')
 
+# Long-lived OCR engine (initialised once, fed numpy buffers)
+ocr = OcrEnginePool(DEFAULT_TESSERACT_CONFIG)
+
 # Configurations
 SAVE_DIR = 'plates'
 DB_FILE = 'parking.db'
 ENTRY_COOLDOWN = 300  # seconds
 MAX_DISTANCE = 20     # cm
-MIN_DISTANCE = 0      # cm
-CAPTURE_THRESHOLD = 6 # number of consistent reads before logging
+DEPART_MARGIN = 10    # cm of hysteresis before a vehicle counts as gone
+CONSENSUS_CONFIDENCE = 0.99  # per-character confidence needed to decide
+MAX_CONSENSUS_FRAMES = 12    # reads before a vehicle's vote starts over
 GATE_OPEN_TIME = 10   # seconds
+LOT_CAPACITY = None   # parking spaces to store at startup; None keeps the database's (stats.py capacity N)
 
 # Ensure plates directory exists
 os.makedirs(SAVE_DIR, exist_ok=True)
 
-# SQLite connection (single instance)
-conn = sqlite3.connect(DB_FILE)
-conn.row_factory = sqlite3.Row
-cursor = conn.cursor()
+# Shared data-access layer (WAL, indexes, cached statements); writes are
+# group-committed on a background thread so the frame loop never waits on fsync
+writer = DbWriter(DB_FILE)
+db = ParkingDB(DB_FILE, writer=writer)
+
+# Unpaid/active sessions held in memory, synced with the exit gate via change_log
+sessions = ActiveSessions(db)
+
+# Occupancy is counted by triggers on every entry/exit; the cache re-reads it on refresh()
+if LOT_CAPACITY is not None:
+    db.set_capacity(LOT_CAPACITY)
+    sessions.refresh()
+print(f"[LOT] {sessions.lot['inside']} inside, capacity {sessions.lot['capacity']}")
 
 # Log violation to violations table
 def log_violation(plate_number, gate_location, reason):
-    cursor.execute('''
-        INSERT INTO violations (timestamp, car_plate, gate_location, reason)
-        VALUES (?, ?, ?, ?)
-    ''', (
-        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        plate_number,
-        gate_location,
-        reason
-    ))
-    conn.commit()
+    db.log_violation(plate_number, gate_location, reason)
     print(f"[LOGGED] Violation for {plate_number} at {gate_location}: {reason}")
 
-# Check for existing unpaid entry in database
-def has_unpaid_record(plate):
-    cursor.execute('SELECT 1 FROM entries WHERE car_plate = ? AND payment_status = 0', (plate,))
-    return cursor.fetchone() is not None
-
-# Get next entry number
-def get_next_entry_no():
-    cursor.execute('SELECT COALESCE(MAX(no), 0) + 1 AS next_no FROM entries')
-    return cursor.fetchone()['next_no']
-
-# Auto-detect Arduino Serial Port
-def detect_arduino_port():
-    for port in serial.tools.list_ports.comports():
-        dev = port.device
-        if platform.system() == 'Linux' and 'ttyACM' in dev:
-            return dev
-        if platform.system() == 'Darwin' and ('usbmodem' in dev or 'usbserial' in dev):
-            return dev
-        if platform.system() == 'Windows' and 'COM' in dev:
-            return dev
-    return None
-
-# Read distance from Arduino (returns float or None)
-def read_distance(arduino):
-    if not arduino or arduino.in_waiting == 0:
-        return None
-    try:
-        val = arduino.readline().decode('utf-8').strip()
-        return float(val)
-    except (UnicodeDecodeError, ValueError):
-        return None
-
-# Wait for Arduino response
-def wait_for_arduino_response(arduino, expected, timeout=2.0):
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        if arduino.in_waiting:
-            response = arduino.readline().decode('utf-8').strip()
-            if expected in response:
-                return True
-        time.sleep(0.01)
-    return False
-
-# Initialize Arduino
-arduino_port = detect_arduino_port()
-arduino = None
-if arduino_port:
+# Open the entry gate board by role: the device manager's warm pty when it
+# is running, otherwise the board itself (see device_manager.py)
+arduino, arduino_port = open_role('entry_gate')
+transport = None
+if arduino:
     print(f"[CONNECTED] Arduino on {arduino_port}")
-    arduino = serial.Serial(arduino_port, 115200, timeout=1)  # Increased baud rate
-    time.sleep(2)
-    arduino.flush()  # Clear serial buffer
+    transport = SerialTransport(arduino, name=arduino_port).start()
 else:
     print("[ERROR] Arduino not detected.")
 
+# Background distance sampler: median filter + arrival/departure hysteresis
+sensor = UltrasonicSampler(transport, arrive_distance=MAX_DISTANCE,
+                           depart_distance=MAX_DISTANCE + DEPART_MARGIN)
+sensor.start()
+
+# Gate actuator: commands and acks on its own thread, one auto-close timer
+gate = GateActuator(transport, open_time=GATE_OPEN_TIME)
+
 # Initialize Webcam and Windows
 cap = cv2.VideoCapture(0)
 if not cap.isOpened():
@@ -108,11 +85,9 @@ cv2.namedWindow('Processed', cv2.WINDOW_NORMAL)
 cv2.resizeWindow('Webcam Feed', 800, 600)
 
 # State variables
-plate_buffer = []
+tracker = PlateTracker(confidence=CONSENSUS_CONFIDENCE, max_frames=MAX_CONSENSUS_FRAMES)
 last_saved_plate = None
 last_entry_time = 0
-gate_open_until = 0
-gate_is_open = False
 
 print("[SYSTEM] Ready. Press 'q' to exit.")
 
@@ -123,26 +98,23 @@ try:
             print("[ERROR] Frame capture failed.")
             break
 
-        # Get distance reading, default to safe value
-        distance = read_distance(arduino) or (MAX_DISTANCE - 1)
         annotated = frame.copy()
 
-        # Handle gate closing
-        current_time = time.time()
-        if gate_is_open and current_time >= gate_open_until:
-            if arduino:
-                arduino.flush()
-                arduino.write(b'0')
-                if wait_for_arduino_response(arduino, "[GATE] Closed"):
-                    print("[GATE] Closing gate (sent '0')")
-                gate_is_open = False
-
-        if MIN_DISTANCE <= distance <= MAX_DISTANCE:
+        if sensor.consume_arrival():
+            print(f"[SENSOR] Vehicle arrived at {sensor.distance:.1f}cm")
+            tracker.reset()
+
+        # Only run inference while a vehicle is present
+        if sensor.present:
             results = model(frame)[0]
             annotated = results.plot()
 
-            for box in results.boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
+            boxes = [tuple(map(int, box.xyxy[0])) for box in results.boxes]
+            for track, (x1, y1, x2, y2) in zip(tracker.update(boxes), boxes):
+                # Plate already agreed for this vehicle (or gate busy), skip OCR
+                if track.decided or gate.gate_is_open:
+                    continue
+
                 plate_img = frame[y1:y2, x1:x2]
 
                 # OCR preprocess
@@ -151,62 +123,38 @@ try:
                 thresh = cv2.threshold(blur, 0, 255,
                                        cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
 
-                text = pytesseract.image_to_string(
-                    thresh,
-                    config='--psm 8 --oem 3 '
-                           '-c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-                ).strip().replace(' ', '')
-
-                # Validate Rwandan format RAxxxA
-                if text.startswith('RA') and len(text) >= 7:
-                    plate = text[:7]
-                    pr, dg, su = plate[:3], plate[3:6], plate[6]
-                    if pr.isalpha() and dg.isdigit() and su.isalpha():
-                        plate_buffer.append(plate)
-
-                # Once buffer is full, decide
-                if len(plate_buffer) >= CAPTURE_THRESHOLD and not gate_is_open:
-                    common = Counter(plate_buffer).most_common(1)[0][0]
+                # Per-character vote on the RAxxxA format; decides early on clean reads
+                common = track.vote(ocr.recognize_chars(thresh))
+                if common:
+                    print(f"[CONSENSUS] {common} after {track.frames} frames")
                     now = time.time()
 
-                    # Check for unpaid record
-                    if has_unpaid_record(common):
+                    # Check for unpaid record (pick up exits logged by the other gate first)
+                    sessions.refresh()
+                    if sessions.has_unpaid(common):
                         print(f"[ACCESS DENIED] Unpaid record exists for {common}")
                         log_violation(common, "Entry", "Unpaid entry attempt")
+                    elif sessions.is_full():
+                        # A full lot is not the driver's fault: denied, but not logged as a violation
+                        print(f"[ACCESS DENIED] Lot full ({sessions.lot['inside']}/{sessions.lot['capacity']}) for {common}")
                     else:
                         # Apply cooldown logic
                         if common != last_saved_plate or (now - last_entry_time) > ENTRY_COOLDOWN:
-                            entry_count = get_next_entry_no()
-                            cursor.execute('''
-                                INSERT INTO entries (no, entry_time, exit_time, car_plate, due_payment, payment_status)
-                                VALUES (?, ?, ?, ?, ?, ?)
-                            ''', (
-                                entry_count,
-                                time.strftime('%Y-%m-%d %H:%M:%S'),
-                                '',
-                                common,
-                                None,
-                                0
-                            ))
-                            conn.commit()
-                            print(f"[NEW] Logged plate {common}")
-
-                            # Gate actuation
-                            if arduino:
-                                arduino.flush()
-                                arduino.write(b'1')
-                                if wait_for_arduino_response(arduino, "[GATE] Opened"):
-                                    print("[GATE] Opening gate (sent '1')")
-                                gate_open_until = time.time() + GATE_OPEN_TIME
-                                gate_is_open = True
-
-                            last_saved_plate = common
-                            last_entry_time = now
+                            if sessions.add_entry(common) is None:
+                                # Another gate took the last space since our refresh
+                                print(f"[ACCESS DENIED] Lot full for {common}")
+                            else:
+                                print(f"[NEW] Logged plate {common}")
+
+                                # Gate actuation (non-blocking, auto-closes)
+                                gate.open()
+                                print("[GATE] Opening gate")
+
+                                last_saved_plate = common
+                                last_entry_time = now
                         else:
                             print(f"[SKIPPED] Cooldown: {common}")
 
-                    plate_buffer.clear()
-
                 # Show previews
                 cv2.imshow('Plate', plate_img)
                 cv2.imshow('Processed', thresh)
@@ -216,11 +164,13 @@ try:
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 finally:
+    sensor.stop()
     cap.release()
-    if arduino:
-        if gate_is_open:
-            arduino.write(b'0')
-            time.sleep(0.1)
-        arduino.close()
-    conn.close()
+    gate.shutdown()
+    if transport:
+        transport.close()
+    writer.close()
+    print(f"[DB] Writer metrics: {writer.metrics()}")
+    db.close()
+    ocr.close()
     cv2.destroyAllWindows()
\ No newline at end of file
@@ -1,139 +1,86 @@
-import platform
 import cv2
 from ultralytics import YOLO
-import pytesseract
-import os
+import logging
 import time
-import serial
-import serial.tools.list_ports
-import sqlite3
-from collections import Counter
-from datetime import datetime
+
+from db_writer import DbWriter
+from device_manager import open_role
+from gate_actuator import GateActuator
+from ocr_engine import DEFAULT_TESSERACT_CONFIG, OcrEnginePool
+from parking_db import ParkingDB
+from sensor import UltrasonicSampler
+from serial_transport import SerialTransport
+from session_cache import ActiveSessions
+from tracker import PlateTracker
+
+# Show sensor/gate thread logs alongside the prints below
+logging.basicConfig(level=logging.INFO, format='[%(name)s] %(message)s')
 
 # Load YOLOv8 model
 model = YOLO('../model_dev/runs/detect/train/weights/best.pt')
 
+# Long-lived OCR engine (initialised once, fed numpy buffers)
+ocr = OcrEnginePool(DEFAULT_TESSERACT_CONFIG)
+
 # Configurations
 DB_FILE = 'parking.db'
 MAX_DISTANCE = 20     # cm
-MIN_DISTANCE = 0      # cm
-CAPTURE_THRESHOLD = 6 # number of consistent reads
+DEPART_MARGIN = 10    # cm of hysteresis before a vehicle counts as gone
+CONSENSUS_CONFIDENCE = 0.99  # per-character confidence needed to decide
+MAX_CONSENSUS_FRAMES = 12    # reads before a vehicle's vote starts over
 GATE_OPEN_TIME = 10   # seconds
 BUZZER_ON_TIME = 5    # seconds
 EXIT_WINDOW = 5       # minutes
 
-# SQLite connection (single instance)
-conn = sqlite3.connect(DB_FILE)
-conn.row_factory = sqlite3.Row
-cursor = conn.cursor()
+# Shared data-access layer (WAL, indexes, cached statements); writes are
+# group-committed on a background thread so the frame loop never waits on fsync
+writer = DbWriter(DB_FILE)
+db = ParkingDB(DB_FILE, writer=writer)
+
+# Unpaid/active sessions held in memory, synced with the entry gate via change_log
+sessions = ActiveSessions(db)
 
 # Log violation to violations table
 def log_violation(plate_number, gate_location, reason):
-    cursor.execute('''
-        INSERT INTO violations (timestamp, car_plate, gate_location, reason)
-        VALUES (?, ?, ?, ?)
-    ''', (
-        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        plate_number,
-        gate_location,
-        reason
-    ))
-    conn.commit()
+    db.log_violation(plate_number, gate_location, reason)
     print(f"[LOGGED] Violation for {plate_number} at {gate_location}: {reason}")
 
 # Check for valid paid exit
 def handle_exit(plate_number):
-    cursor.execute('''
-        SELECT no, entry_time, exit_time, payment_status
-        FROM entries
-        WHERE car_plate = ? AND exit_time != '' AND payment_status = 1
-        ORDER BY exit_time DESC
-    ''', (plate_number,))
-    valid_entries = []
-    for row in cursor:
-        try:
-            exit_time = datetime.strptime(row['exit_time'], '%Y-%m-%d %H:%M:%S')
-            time_diff = (datetime.now() - exit_time).total_seconds() / 60
-            if time_diff <= EXIT_WINDOW:
-                valid_entries.append((exit_time, row))
-        except Exception as e:
-            print(f"[ERROR] Invalid exit_time for {plate_number}: {e}")
-    return valid_entries
+    return sessions.recently_paid(plate_number, EXIT_WINDOW * 60)
 
 # Log exit in entries table
 def log_exit(plate_number):
-    cursor.execute('''
-        SELECT no, entry_time
-        FROM entries
-        WHERE car_plate = ? AND exit_time = '' AND payment_status = 0
-        ORDER BY entry_time DESC
-        LIMIT 1
-    ''', (plate_number,))
-    row = cursor.fetchone()
-    if not row:
+    session = sessions.open_session(plate_number)
+    if not session:
         return False, "No active entry found"
-    
-    entry_time = datetime.strptime(row['entry_time'], '%Y-%m-%d %H:%M:%S')
-    duration_hours = (datetime.now() - entry_time).total_seconds() / 3600
+
+    no, entry_ts = session
+    duration_hours = (time.time() - entry_ts) / 3600
     due_payment = round(duration_hours * 1.0, 2)  # $1/hour, adjust as needed
-    
-    cursor.execute('''
-        UPDATE entries
-        SET exit_time = ?, due_payment = ?, payment_status = 1
-        WHERE no = ?
-    ''', (
-        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        due_payment,
-        row['no']
-    ))
-    conn.commit()
+
+    sessions.record_exit(no, due_payment)
     print(f"[EXIT] Logged exit for {plate_number}, payment: ${due_payment}")
     return True, "Valid exit"
 
-# Auto-detect Arduino Serial Port
-def detect_arduino_port():
-    for port in serial.tools.list_ports.comports():
-        dev = port.device
-        if platform.system() == 'Linux' and 'ttyACM' in dev:
-            return dev
-        if platform.system() == 'Darwin' and ('usbmodem' in dev or 'usbserial' in dev):
-            return dev
-        if platform.system() == 'Windows' and 'COM' in dev:
-            return dev
-    return None
-
-# Read distance from Arduino
-def read_distance(arduino):
-    if not arduino or arduino.in_waiting == 0:
-        return None
-    try:
-        val = arduino.readline().decode('utf-8').strip()
-        return float(val)
-    except (UnicodeDecodeError, ValueError):
-        return None
-
-# Wait for Arduino response
-def wait_for_arduino_response(arduino, expected, timeout=2.0):
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        if arduino.in_waiting:
-            response = arduino.readline().decode('utf-8').strip()
-            if expected in response:
-                return True
-        time.sleep(0.01)
-    return False
-
-# Initialize Arduino
-arduino_port = detect_arduino_port()
-arduino = None
-if arduino_port:
+# Open the exit gate board by role: the device manager's warm pty when it
+# is running, otherwise the board itself (see device_manager.py)
+arduino, arduino_port = open_role('exit_gate')
+transport = None
+if arduino:
     print(f"[CONNECTED] Arduino on {arduino_port}")
-    arduino = serial.Serial(arduino_port, 115200, timeout=1)  # Increased baud rate
-    time.sleep(2)
-    arduino.flush()
+    transport = SerialTransport(arduino, name=arduino_port).start()
 else:
     print("[ERROR] Arduino not detected.")
 
+# Background distance sampler: median filter + arrival/departure hysteresis
+sensor = UltrasonicSampler(transport, arrive_distance=MAX_DISTANCE,
+                           depart_distance=MAX_DISTANCE + DEPART_MARGIN)
+sensor.start()
+
+# Gate/buzzer actuator: commands and acks on its own thread, one timer loop
+gate = GateActuator(transport, open_time=GATE_OPEN_TIME, buzzer_time=BUZZER_ON_TIME)
+
 # Initialize Webcam
 cap = cv2.VideoCapture(0)
 if not cap.isOpened():
@@ -145,11 +92,7 @@ cv2.namedWindow('Processed', cv2.WINDOW_NORMAL)
 cv2.resizeWindow('Exit Webcam Feed', 800, 600)
 
 # State variables
-plate_buffer = []
-gate_open_until = 0
-buzzer_on_until = 0
-gate_is_open = False
-buzzer_is_on = False
+tracker = PlateTracker(confidence=CONSENSUS_CONFIDENCE, max_frames=MAX_CONSENSUS_FRAMES)
 
 print("[EXIT SYSTEM] Ready. Press 'q' to quit.")
 
@@ -160,36 +103,23 @@ try:
             print("[ERROR] Frame capture failed.")
             break
 
-        current_time = time.time()
-
-        # Handle gate closing
-        if gate_is_open and current_time >= gate_open_until:
-            if arduino:
-                arduino.flush()
-                arduino.write(b'0')
-                if wait_for_arduino_response(arduino, "[GATE] Closed"):
-                    print("[GATE] Closing gate (sent '0')")
-                gate_is_open = False
-
-        # Handle buzzer stopping
-        if buzzer_is_on and current_time >= buzzer_on_until:
-            if arduino:
-                arduino.flush()
-                arduino.write(b'0')
-                if wait_for_arduino_response(arduino, "[ALERT] Cleared"):
-                    print("[ALERT] Buzzer stopped (sent '0')")
-                buzzer_is_on = False
-
-        # Get distance
-        distance = read_distance(arduino) or (MAX_DISTANCE - 1)
         annotated = frame.copy()
 
-        if MIN_DISTANCE <= distance <= MAX_DISTANCE and not (gate_is_open or buzzer_is_on):
+        if sensor.consume_arrival():
+            print(f"[SENSOR] Vehicle arrived at {sensor.distance:.1f}cm")
+            tracker.reset()
+
+        # Only run inference while a vehicle is present
+        if sensor.present and not gate.busy:
             results = model(frame)[0]
             annotated = results.plot()
 
-            for box in results.boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
+            boxes = [tuple(map(int, box.xyxy[0])) for box in results.boxes]
+            for track, (x1, y1, x2, y2) in zip(tracker.update(boxes), boxes):
+                # Plate already agreed for this vehicle, skip OCR
+                if track.decided:
+                    continue
+
                 plate_img = frame[y1:y2, x1:x2]
 
                 # Preprocess image for OCR
@@ -198,58 +128,29 @@ try:
                 thresh = cv2.threshold(blur, 0, 255,
                                        cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
 
-                plate_text = pytesseract.image_to_string(
-                    thresh,
-                    config='--psm 8 --oem 3 '
-                           '-c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-                ).strip().replace(' ', '')
-
-                if 'RA' in plate_text:
-                    start_idx = plate_text.find('RA')
-                    plate_candidate = plate_text[start_idx:start_idx+7]
-                    if len(plate_candidate) == 7:
-                        prefix, digits, suffix = plate_candidate[:3], plate_candidate[3:6], plate_candidate[6]
-                        if prefix.isalpha() and digits.isdigit() and suffix.isalpha():
-                            plate_buffer.append(plate_candidate)
-
-                # Process plate buffer
-                if len(plate_buffer) >= CAPTURE_THRESHOLD:
-                    most_common = Counter(plate_buffer).most_common(1)[0][0]
-                    plate_buffer.clear()
+                # Per-character vote on the RAxxxA format; decides early on clean reads
+                most_common = track.vote(ocr.recognize_chars(thresh))
+                if most_common:
+                    print(f"[CONSENSUS] {most_common} after {track.frames} frames")
 
-                    # Check for existing paid exit
-                    valid_entries = handle_exit(most_common)
-                    if valid_entries:
+                    # Check for existing paid exit (pick up entries logged by the other gate first)
+                    sessions.refresh()
+                    if handle_exit(most_common):
                         print(f"[ACCESS GRANTED] Paid exit found for {most_common}")
-                        if arduino:
-                            arduino.flush()
-                            arduino.write(b'1')
-                            if wait_for_arduino_response(arduino, "[GATE] Opened"):
-                                print("[GATE] Opening gate (sent '1')")
-                            gate_open_until = current_time + GATE_OPEN_TIME
-                            gate_is_open = True
+                        gate.open()
+                        print("[GATE] Opening gate")
                     else:
                         # Try logging a new exit
                         success, reason = log_exit(most_common)
                         if success:
                             print(f"[ACCESS GRANTED] Exit recorded for {most_common}")
-                            if arduino:
-                                arduino.flush()
-                                arduino.write(b'1')
-                                if wait_for_arduino_response(arduino, "[GATE] Opened"):
-                                    print("[GATE] Opening gate (sent '1')")
-                                gate_open_until = current_time + GATE_OPEN_TIME
-                                gate_is_open = True
+                            gate.open()
+                            print("[GATE] Opening gate")
                         else:
                             print(f"[ACCESS DENIED] Exit not allowed for {most_common}")
                             log_violation(most_common, "Exit", reason)
-                            if arduino:
-                                arduino.flush()
-                                arduino.write(b'2')
-                                if wait_for_arduino_response(arduino, "[ALERT] Unpaid vehicle detected"):
-                                    print("[ALERT] Buzzer triggered (sent '2')")
-                                buzzer_on_until = current_time + BUZZER_ON_TIME
-                                buzzer_is_on = True
+                            gate.alarm()
+                            print("[ALERT] Buzzer triggered")
 
                 # Show plates
                 cv2.imshow('Plate', plate_img)
@@ -260,11 +161,13 @@ try:
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 finally:
+    sensor.stop()
     cap.release()
-    if arduino:
-        if gate_is_open or buzzer_is_on:
-            arduino.write(b'0')
-            time.sleep(0.1)
-        arduino.close()
-    conn.close()
+    gate.shutdown()
+    if transport:
+        transport.close()
+    writer.close()
+    print(f"[DB] Writer metrics: {writer.metrics()}")
+    db.close()
+    ocr.close()
     cv2.destroyAllWindows()
\ No newline at end of file
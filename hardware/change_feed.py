@@ -0,0 +1,198 @@
+import json
+import logging
+import queue
+import threading
+from collections import deque
+
+from parking_db import DB_FILE, ParkingDB
+
+logger = logging.getLogger('ChangeFeed')
+
+POLL_INTERVAL = 0.05    # seconds between PRAGMA data_version checks
+MIN_BACKOFF = 0.5       # first retry delay (s) after a failed read, doubled up to MAX_BACKOFF
+MAX_BACKOFF = 8.0
+BACKLOG = 2000          # recent events kept in memory for reconnecting clients
+CLIENT_QUEUE = 1000     # events a client may fall behind before it is dropped
+RESET = object()        # tells a client its position is gone: reload, then resume
+OVERFLOW = object()     # tells a client it fell too far behind: reconnect
+
+
+def event_name(event):
+    """SSE event type for a change: entry, exit, payment, violation or removed."""
+    row = event['row']
+    if row is None:
+        return 'removed'
+    if event['table'] == 'entries':
+        return 'exit' if row['exit_ts'] is not None else 'entry'
+    return {'payments': 'payment', 'violations': 'violation'}.get(event['table'], event['table'])
+
+
+def format_event(event):
+    """One Server-Sent Events message; its id is the change_log id, for Last-Event-ID."""
+    data = json.dumps({'table': event['table'], 'op': event['op'], 'id': event['row_id'], 'row': event['row']})
+    return f"id: {event['id']}\nevent: {event_name(event)}\ndata: {data}\n\n"
+
+
+class Subscription:
+    def __init__(self):
+        self.queue = queue.Queue(CLIENT_QUEUE)
+
+    def get(self, timeout):
+        """Next event, RESET/OVERFLOW, or None after `timeout` seconds of quiet."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ChangeFeed:
+    """One change_log reader fanned out to every stream client.
+
+    A single thread watches PRAGMA data_version (a no-I/O check) and, when
+    another process has committed, reads the new change_log rows with their
+    current row contents and puts them on each subscriber's queue, so the
+    database cost does not grow with the number of open dashboards. The
+    last BACKLOG events are kept for clients resuming with Last-Event-ID;
+    older positions are served from change_log while it still has them.
+    A failed read is retried on a fresh connection with backoff; if the log
+    was pruned past the feed's position meanwhile, clients get RESET.
+    """
+
+    def __init__(self, db_file=DB_FILE, interval=POLL_INTERVAL, backlog=BACKLOG):
+        self.db_file = db_file
+        self.interval = interval
+        self.backlog = deque(maxlen=backlog)
+        self.last_id = 0
+        self.stats = {'polls': 0, 'reads': 0, 'events': 0, 'dropped_clients': 0, 'errors': 0, 'resets': 0}
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        db = ParkingDB(self.db_file, check_same_thread=False)
+        self.last_id = db.change_range()[1]
+        self._thread = threading.Thread(target=self._run, args=(db,), name='change-feed', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self, db):
+        data_version = None  # first pass always reads, covering commits made since start()
+        backoff = MIN_BACKOFF
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    if db is None:
+                        db = ParkingDB(self.db_file, check_same_thread=False)
+                    self.stats['polls'] += 1
+                    version = db.data_version()
+                    if version == data_version:
+                        continue
+                    data_version = version
+                    self.stats['reads'] += 1
+                    self._check_gap(db)
+                    while True:
+                        events = db.change_events(self.last_id)
+                        if not events:
+                            break
+                        self._publish(events)
+                    backoff = MIN_BACKOFF
+                except Exception as e:
+                    # e.g. 'database is locked' or a migration in progress: reopen and retry
+                    self.stats['errors'] += 1
+                    logger.warning(f"Change feed read failed ({e}), retrying in {backoff:.1f}s")
+                    if db is not None:
+                        db.close()
+                    db, data_version = None, None
+                    self._stop.wait(backoff)
+                    backoff = min(backoff * 2, MAX_BACKOFF)
+        finally:
+            if db is not None:
+                db.close()
+
+    def _check_gap(self, db):
+        """If change_log was pruned past our position (e.g. while reads were
+        failing), tell every client to reload and carry on from the end."""
+        first_id, last_id = db.change_range()
+        if first_id <= self.last_id + 1:
+            return
+        logger.warning(f"Change log pruned past event {self.last_id}, resetting clients")
+        with self._lock:
+            self.backlog.clear()
+            self.last_id = last_id
+            self.stats['resets'] += 1
+            for sub in self._subscribers:
+                self._force(sub, RESET)
+
+    def _publish(self, events):
+        with self._lock:
+            self.backlog.extend(events)
+            self.last_id = events[-1]['id']
+            self.stats['events'] += len(events)
+            for sub in list(self._subscribers):
+                try:
+                    for event in events:
+                        sub.queue.put_nowait(event)
+                except queue.Full:
+                    # Slow client: cut it loose; it reconnects with Last-Event-ID
+                    self._subscribers.discard(sub)
+                    self.stats['dropped_clients'] += 1
+                    self._force(sub, OVERFLOW)
+
+    @staticmethod
+    def _force(sub, marker):
+        while True:
+            try:
+                sub.queue.put_nowait(marker)
+                return
+            except queue.Full:
+                sub.queue.get_nowait()
+
+    def subscribe(self, last_id=None, db=None):
+        """Register a client; with `last_id`, first replay what it missed.
+
+        Replay comes from the in-memory backlog, or from change_log through
+        `db` (a connection usable on the caller's thread). If neither reaches
+        back far enough (or the client missed more than its queue holds),
+        the subscription starts with RESET.
+        """
+        sub = Subscription()
+        with self._lock:
+            if last_id is not None and last_id < self.last_id:
+                if self.backlog and self.backlog[0]['id'] <= last_id + 1:
+                    missed = [event for event in self.backlog if event['id'] > last_id]
+                else:
+                    missed = self._from_log(db, last_id)
+                if missed is None or len(missed) >= CLIENT_QUEUE:
+                    sub.queue.put_nowait(RESET)
+                else:
+                    for event in missed:
+                        sub.queue.put_nowait(event)
+            self._subscribers.add(sub)
+        return sub
+
+    def _from_log(self, db, last_id):
+        """Events after `last_id` up to the feed's position, or None if pruned away."""
+        if db is None or db.change_range()[0] > last_id + 1:
+            return None
+        missed = []
+        while len(missed) < CLIENT_QUEUE:
+            events = [e for e in db.change_events(last_id) if e['id'] <= self.last_id]
+            if not events:
+                break
+            missed.extend(events)
+            last_id = events[-1]['id']
+        return missed
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def clients(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
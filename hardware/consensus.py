@@ -0,0 +1,87 @@
+import math
+from collections import defaultdict
+
+# Character classes of a Rwandan plate, position by position: RAxxxA
+PLATE_FORMAT = ('R', 'A', 'alpha', 'digit', 'digit', 'digit', 'alpha')
+PLATE_LENGTH = len(PLATE_FORMAT)
+
+
+def char_fits(char, kind):
+    """Check a character against one position of PLATE_FORMAT."""
+    if kind == 'alpha':
+        return char.isalpha()
+    if kind == 'digit':
+        return char.isdigit()
+    return char == kind
+
+
+def align_plate(chars):
+    """Find the first RAxxxA window in a list of (char, confidence) reads."""
+    for start in range(len(chars) - PLATE_LENGTH + 1):
+        window = chars[start:start + PLATE_LENGTH]
+        if all(char_fits(char, kind) for (char, _), kind in zip(window, PLATE_FORMAT)):
+            return window
+    return None
+
+
+def log_odds(p):
+    p = min(max(p, 0.01), 0.99)
+    return math.log(p / (1 - p))
+
+
+class PlateConsensus:
+    """Streaming per-character vote over OCR reads of one vehicle.
+
+    Every read adds the log-odds of its per-character confidence to the
+    candidate character at each plate position. A position is settled when
+    its leader beats the runner-up by the log-odds of the target confidence;
+    the plate is decided as soon as every position is settled, which for a
+    clean plate is one or two frames instead of a fixed-size buffer.
+    """
+
+    def __init__(self, confidence=0.99, max_frames=12):
+        self.threshold = log_odds(confidence)
+        self.max_frames = max_frames
+        self.reset()
+
+    def reset(self):
+        self.scores = [defaultdict(float) for _ in PLATE_FORMAT]
+        self.frames = 0
+        self.plate = None
+
+    def margins(self):
+        """Lead of the best character over the runner-up at each position."""
+        margins = []
+        for position in self.scores:
+            ranked = sorted(position.values(), reverse=True) + [0.0, 0.0]
+            margins.append(ranked[0] - max(ranked[1], 0.0))
+        return margins
+
+    def confidence(self):
+        """Confidence of the weakest position, as a probability."""
+        weakest = min(self.margins())
+        return 1 / (1 + math.exp(-weakest))
+
+    def add(self, chars):
+        """Feed one OCR read as [(char, confidence)].
+
+        Returns the plate once decided, otherwise None. When max_frames reads
+        pass without a decision the votes start over.
+        """
+        if self.plate:
+            return self.plate
+
+        self.frames += 1
+        window = align_plate(chars)
+        if window:
+            for position, (char, conf) in zip(self.scores, window):
+                # Reads below 50% confidence carry no evidence
+                position[char] += max(log_odds(conf), 0.0)
+
+            if min(self.margins()) >= self.threshold:
+                self.plate = ''.join(max(position, key=position.get) for position in self.scores)
+                return self.plate
+
+        if self.frames >= self.max_frames:
+            self.reset()
+        return None
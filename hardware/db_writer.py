@@ -0,0 +1,210 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from parking_db import DB_FILE, connect
+
+logger = logging.getLogger('DbWriter')
+
+BATCH_SIZE = 64          # writes per group commit at most
+COMMIT_INTERVAL = 0.2    # seconds a write may wait for others to join its commit
+LATENCY_SAMPLES = 1000   # commit latencies kept for the metrics
+
+
+class _Write:
+    __slots__ = ('sql', 'params', 'sync', 'future')
+
+    def __init__(self, sql, params, sync):
+        self.sql = sql
+        self.params = params
+        self.sync = sync
+        self.future = Future()
+
+
+class DbWriter:
+    """Write-behind queue with one writer thread doing group commits.
+
+    Callers enqueue INSERT/UPDATE statements (or small transactional units)
+    and get a Future resolved once the write is committed. The writer takes
+    the first pending write, gathers more for up to `interval` seconds or
+    `batch_size` writes, and commits them in one transaction, so the frame
+    loops never wait on fsync. A batch holding a sync write is committed
+    immediately with synchronous=FULL; everything else rides on WAL's
+    synchronous=NORMAL.
+    """
+
+    def __init__(self, db_file=DB_FILE, batch_size=BATCH_SIZE, interval=COMMIT_INTERVAL):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self.writes = queue.Queue()
+        self.batches = 0
+        self.committed = 0
+        self.failed = 0
+        self.commit_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._closed = False
+        self._lock = threading.Lock()  # orders submit() against close()'s sentinel
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params=(), sync=False):
+        """Queue one write and return a Future of its result.
+
+        `sql` is a statement (the result is its lastrowid) or a callable
+        taking the connection, for multi-statement units; a callable runs in
+        its own savepoint so raising undoes only its own changes. sync=True
+        makes the batch commit straight away with synchronous=FULL.
+        """
+        write = _Write(sql, params, sync)
+        self._enqueue(write)
+        return write.future
+
+    def _enqueue(self, write):
+        # Under the lock, nothing can land behind close()'s sentinel and wait forever
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("DbWriter is closed")
+            self.writes.put(write)
+
+    def execute(self, sql, params=(), sync=False):
+        """submit(); with sync=True, block until durably committed and return the result."""
+        future = self.submit(sql, params, sync)
+        if sync:
+            return future.result()
+        return future
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far is committed."""
+        marker = _Write(None, None, False)
+        self._enqueue(marker)
+        marker.future.result(timeout)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size and not batch[-1].sync and batch[-1].sql is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                write = self.writes.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if write is None:
+                # Shutdown: commit this batch, then let _run see the sentinel
+                self.writes.put(None)
+                break
+            batch.append(write)
+        return batch
+
+    def _run(self):
+        try:
+            conn = connect(self.db_file)
+        except Exception as e:
+            logger.error(f"Cannot open {self.db_file}: {e}")
+            with self._lock:
+                self._closed = True
+            self._fail_pending(e)
+            return
+        try:
+            while True:
+                first = self.writes.get()
+                if first is None:
+                    break
+                self._commit(conn, self._collect(first))
+        finally:
+            conn.close()
+            self._fail_pending(RuntimeError("DbWriter is closed"))
+
+    def _fail_pending(self, error):
+        while True:
+            try:
+                write = self.writes.get_nowait()
+            except queue.Empty:
+                return
+            if write is not None:
+                write.future.set_exception(error)
+
+    def _apply(self, conn, write):
+        if not callable(write.sql):
+            return conn.execute(write.sql, write.params).lastrowid
+        conn.execute('SAVEPOINT write_unit')
+        try:
+            result = write.sql(conn, *write.params)
+        except Exception:
+            conn.execute('ROLLBACK TO write_unit')
+            conn.execute('RELEASE write_unit')
+            raise
+        conn.execute('RELEASE write_unit')
+        return result
+
+    def _commit(self, conn, batch):
+        writes = [w for w in batch if w.sql is not None]
+        durable = any(w.sync for w in writes)
+        results = []
+        started = time.perf_counter()
+        try:
+            if durable:
+                conn.execute('PRAGMA synchronous = FULL')
+            conn.execute('BEGIN IMMEDIATE')
+            for write in writes:
+                try:
+                    results.append(self._apply(conn, write))
+                except Exception as e:
+                    # A failed write is rolled back on its own; the rest still commit
+                    results.append(e)
+            conn.execute('COMMIT')
+        except Exception as e:
+            logger.error(f"Group commit of {len(writes)} writes failed: {e}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            results = [e] * len(writes)
+        finally:
+            if durable:
+                conn.execute('PRAGMA synchronous = NORMAL')
+
+        if writes:
+            self.commit_latencies.append((time.perf_counter() - started) * 1000)
+            self.batches += 1
+        for write, result in zip(writes, results):
+            if isinstance(result, Exception):
+                self.failed += 1
+                write.future.set_exception(result)
+            else:
+                self.committed += 1
+                write.future.set_result(result)
+        # Flush markers resolve once everything queued before them is committed
+        for marker in batch:
+            if marker.sql is None:
+                marker.future.set_result(None)
+
+    def metrics(self):
+        """Queue depth and commit latency (ms) for monitoring."""
+        latencies = sorted(self.commit_latencies)
+
+        def pick(q):
+            return round(latencies[min(int(len(latencies) * q), len(latencies) - 1)], 3) if latencies else None
+
+        return {
+            'queue_depth': self.writes.qsize(),
+            'batches': self.batches,
+            'committed': self.committed,
+            'failed': self.failed,
+            'writes_per_batch': round(self.committed / self.batches, 2) if self.batches else None,
+            'commit_p50_ms': pick(0.5),
+            'commit_p95_ms': pick(0.95),
+            'commit_max_ms': round(latencies[-1], 3) if latencies else None,
+        }
+
+    def close(self, timeout=5):
+        """Commit what is queued and stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self.writes.put(None)
+        self._thread.join(timeout)
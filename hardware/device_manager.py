@@ -0,0 +1,359 @@
+import argparse
+import errno
+import json
+import logging
+import os
+import platform
+import tempfile
+import threading
+import time
+
+import serial
+import serial.tools.list_ports
+
+logger = logging.getLogger('Devices')
+
+# Roles a board can play, with the baud rate their current firmware runs at
+# (the gate boards and payment.ino use protocol.BAUD_RATE). A script that
+# speaks an older firmware's protocol passes that firmware's rate to
+# open_role; "baud" in devices.json overrides both.
+ROLES = {
+    'entry_gate': 115200,
+    'exit_gate': 115200,
+    'payment': 115200,
+}
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'devices.json')
+RUN_DIR = os.environ.get('PARKING_RUN_DIR', os.path.join(tempfile.gettempdir(), 'parking-ms'))
+RESET_DELAY = 2.0      # seconds an Arduino takes to boot after the port is opened
+MIN_BACKOFF = 0.5      # first reconnect delay (s), doubled after every failed attempt
+MAX_BACKOFF = 8.0
+
+
+def load_config(path=CONFIG_FILE):
+    """Role -> match spec from devices.json, e.g.
+
+        {"entry_gate": {"serial_number": "85735313..."},
+         "payment": {"vid": "2341", "pid": "0043", "baud": 115200}}
+
+    A spec may also give a fixed "device" path. PARKING_PORT_<ROLE>
+    (e.g. PARKING_PORT_ENTRY_GATE=/dev/pts/4) overrides the file, which is
+    how the simulator's pty boards are plugged in.
+    """
+    config = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            config = json.load(f)
+    for role in ROLES:
+        override = os.environ.get(f"PARKING_PORT_{role.upper()}")
+        if override:
+            config[role] = {**config.get(role, {}), 'device': override}
+    return config
+
+
+def _hex_id(value):
+    return None if value is None else f"{int(value):04x}" if isinstance(value, int) else str(value).lower()
+
+
+def matches(port, spec):
+    """True if a list_ports entry is the board described by `spec`."""
+    if spec.get('serial_number') and port.serial_number != spec['serial_number']:
+        return False
+    if spec.get('vid') and _hex_id(port.vid) != _hex_id(spec['vid']):
+        return False
+    if spec.get('pid') and _hex_id(port.pid) != _hex_id(spec['pid']):
+        return False
+    return bool(spec.get('serial_number') or spec.get('vid') or spec.get('pid'))
+
+
+def looks_like_arduino(device):
+    """The old name-based guess, used for roles without a USB identity."""
+    system = platform.system()
+    if system == 'Linux':
+        return 'ttyACM' in device or 'ttyUSB' in device
+    if system == 'Darwin':
+        return 'usbmodem' in device or 'usbserial' in device
+    if system == 'Windows':
+        return 'COM' in device
+    return False
+
+
+def find_port(role, config=None, exclude=()):
+    """Device path for `role`, or None if its board is not plugged in.
+
+    A fixed path wins, then a serial-number / VID:PID match. A role with
+    no spec falls back to the first Arduino-looking port not in `exclude`,
+    which is what the scripts did before boards were told apart.
+    """
+    config = load_config() if config is None else config
+    spec = config.get(role, {})
+    if spec.get('device'):
+        return spec['device'] if os.path.exists(spec['device']) else None
+
+    ports = list(serial.tools.list_ports.comports())
+    if any(spec.get(key) for key in ('serial_number', 'vid', 'pid')):
+        for port in ports:
+            if matches(port, spec):
+                return port.device
+        return None
+    for port in ports:
+        if port.device not in exclude and looks_like_arduino(port.device):
+            return port.device
+    return None
+
+
+def role_baud(role, config=None, default=None):
+    config = load_config() if config is None else config
+    return config.get(role, {}).get('baud', default or ROLES[role])
+
+
+def link_path(role, run_dir=RUN_DIR):
+    return os.path.join(run_dir, role)
+
+
+def open_role(role, baud=None, timeout=1):
+    """Open the serial port for `role`; returns (serial, path) or (None, None).
+
+    If the device manager is running, its pty for the role is opened: the
+    board behind it is already booted and stays connected across USB
+    faults, so there is no reset delay. Otherwise the board is opened
+    directly and we wait for it to boot, as before. `baud` is the rate of
+    the firmware the caller speaks to (default: the role's); a "baud" in
+    devices.json still takes precedence.
+    """
+    baud = role_baud(role, default=baud)
+    link = link_path(role)
+    if os.path.exists(link):
+        ser = serial.Serial(link, baud, timeout=timeout)
+        ser.reset_input_buffer()
+        return ser, link
+
+    device = find_port(role)
+    if not device:
+        return None, None
+    ser = serial.Serial(device, baud, timeout=timeout)
+    time.sleep(RESET_DELAY)
+    ser.reset_input_buffer()
+    return ser, device
+
+
+class DeviceLink:
+    """Keeps one role's board connected and relays it to a stable pty.
+
+    Clients open `link_path(role)` (a symlink to the pty) and see the
+    board's byte stream unchanged. When the board disappears the pty stays
+    open; the link looks for it again with exponential backoff (the device
+    path may change after a re-plug, the serial number does not) and
+    resumes relaying once it has booted. Bytes sent while the board is
+    away are dropped and counted.
+    """
+
+    def __init__(self, role, config, run_dir=RUN_DIR, claimed=None):
+        # POSIX only; imported here so open_role works on Windows too
+        import tty
+
+        self.role = role
+        self.config = config
+        self.baud = role_baud(role, config)
+        self.path = link_path(role, run_dir)
+        self.claimed = claimed if claimed is not None else set()
+        self.device = None
+        self.serial = None
+        self.state = 'searching'
+        self.stats = {'connects': 0, 'disconnects': 0, 'bytes_in': 0, 'bytes_out': 0, 'dropped': 0}
+
+        self.master, self._slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self._slave)
+        os.set_blocking(self.master, False)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if os.path.lexists(self.path):
+            os.unlink(self.path)
+        os.symlink(os.ttyname(self._slave), self.path)
+        for target in (self._board_loop, self._client_loop):
+            thread = threading.Thread(target=target, name=f'{self.role}-{target.__name__}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _connect(self):
+        device = find_port(self.role, self.config, exclude=self.claimed)
+        if not device:
+            return False
+        try:
+            ser = serial.Serial(device, self.baud, timeout=0.2)
+        except serial.SerialException as e:
+            logger.debug(f"{self.role}: open {device} failed: {e}")
+            return False
+        self.claimed.add(device)
+        if self._stop.wait(RESET_DELAY):
+            ser.close()
+            return False
+        ser.reset_input_buffer()
+        with self._lock:
+            self.serial, self.device, self.state = ser, device, 'connected'
+        self.stats['connects'] += 1
+        logger.info(f"{self.role}: connected on {device}")
+        return True
+
+    def _disconnect(self, reason):
+        with self._lock:
+            ser, self.serial = self.serial, None
+            self.state = 'searching'
+        self.claimed.discard(self.device)
+        self.stats['disconnects'] += 1
+        logger.warning(f"{self.role}: lost {self.device} ({reason}), reconnecting")
+        try:
+            ser.close()
+        except Exception:
+            pass
+
+    def _board_loop(self):
+        """Board -> pty, reconnecting with backoff whenever the board goes away."""
+        backoff = MIN_BACKOFF
+        while not self._stop.is_set():
+            if self.serial is None:
+                if not self._connect():
+                    self._stop.wait(backoff)
+                    backoff = min(backoff * 2, MAX_BACKOFF)
+                    continue
+                backoff = MIN_BACKOFF
+            try:
+                data = self.serial.read(self.serial.in_waiting or 1)
+            except (serial.SerialException, OSError) as e:
+                if not self._stop.is_set():
+                    self._disconnect(e)
+                continue
+            if data:
+                self.stats['bytes_in'] += len(data)
+                self._to_client(data)
+
+    def _to_client(self, data):
+        try:
+            os.write(self.master, data)
+        except BlockingIOError:
+            # Nobody is reading the pty; the client flushes stale input on open
+            self.stats['dropped'] += len(data)
+        except OSError as e:
+            if e.errno != errno.EIO:
+                raise
+
+    def _client_loop(self):
+        """pty -> board."""
+        import select
+
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self.master], [], [], 0.2)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except (BlockingIOError, OSError):
+                continue
+            with self._lock:
+                ser = self.serial
+            if ser is None:
+                self.stats['dropped'] += len(data)
+                continue
+            try:
+                ser.write(data)
+                self.stats['bytes_out'] += len(data)
+            except (serial.SerialException, OSError):
+                self.stats['dropped'] += len(data)
+
+    def status(self):
+        return {'role': self.role, 'state': self.state, 'device': self.device,
+                'link': self.path, 'baud': self.baud, **self.stats}
+
+    def close(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        if os.path.islink(self.path):
+            os.unlink(self.path)
+        with self._lock:
+            if self.serial:
+                self.serial.close()
+        os.close(self.master)
+        os.close(self._slave)
+
+
+class DeviceManager:
+    """One DeviceLink per configured role, plus a status file for `status`."""
+
+    def __init__(self, roles=None, config=None, run_dir=RUN_DIR):
+        self.config = load_config() if config is None else config
+        self.run_dir = run_dir
+        os.makedirs(run_dir, exist_ok=True)
+        claimed = set()
+        # Roles with a USB identity first, so the name-based fallback cannot take their board
+        roles = sorted(roles or ROLES, key=lambda r: not self.config.get(r))
+        self.links = [DeviceLink(role, self.config, run_dir, claimed) for role in roles]
+
+    def start(self):
+        for link in self.links:
+            link.start()
+            logger.info(f"{link.role}: clients open {link.path}")
+        return self
+
+    def status(self):
+        return [link.status() for link in self.links]
+
+    def write_status(self):
+        path = os.path.join(self.run_dir, 'status.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'updated': time.time(), 'links': self.status()}, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def run(self, interval=1.0):
+        try:
+            while True:
+                self.write_status()
+                time.sleep(interval)
+        finally:
+            self.close()
+
+    def close(self):
+        for link in self.links:
+            link.close()
+
+
+def list_ports(config):
+    for port in serial.tools.list_ports.comports():
+        roles = [role for role, spec in config.items() if matches(port, spec) or spec.get('device') == port.device]
+        vid_pid = f"{_hex_id(port.vid)}:{_hex_id(port.pid)}" if port.vid is not None else '-'
+        print(f"{port.device}\t{vid_pid}\tserial={port.serial_number or '-'}\t{','.join(roles) or '-'}"
+              f"\t{port.description}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep gate and payment boards connected, by role')
+    parser.add_argument('command', choices=['run', 'list', 'status'])
+    parser.add_argument('--role', action='append', choices=list(ROLES), help='run: roles to manage (default all)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(name)s] %(message)s')
+    config = load_config()
+    if args.command == 'list':
+        list_ports(config)
+    elif args.command == 'status':
+        path = os.path.join(RUN_DIR, 'status.json')
+        if not os.path.exists(path):
+            print("[ERROR] Device manager is not running")
+            return
+        with open(path) as f:
+            print(f.read())
+    elif not hasattr(os, 'openpty'):
+        print("[ERROR] The device manager needs ptys (Linux/macOS); scripts open the boards directly")
+    else:
+        try:
+            DeviceManager(args.role, config).start().run()
+        except KeyboardInterrupt:
+            print("[EXIT] Device manager stopped")
+
+
+if __name__ == "__main__":
+    main()
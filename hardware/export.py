@@ -0,0 +1,90 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+import zlib
+
+from parking_db import DB_FILE, EXPORTS, ParkingDB
+
+# format -> (content type, file extension)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+GZIP_LEVEL = 6
+
+
+def csv_chunks(columns, batches):
+    """A header line, then one CSV chunk per batch of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonl_chunks(columns, batches):
+    """One JSON object per row, one chunk per batch of rows."""
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of text chunks into one gzip member as it goes."""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(db, name, fmt='csv', since=None, until=None, gzip=False):
+    """Bytes of an export, produced one batch at a time from a single cursor."""
+    columns = EXPORTS[name]['columns']
+    encode = csv_chunks if fmt == 'csv' else jsonl_chunks
+    chunks = encode(columns, db.export(name, since, until))
+    if gzip:
+        return gzip_chunks(chunks)
+    return (chunk.encode() for chunk in chunks if chunk)
+
+
+def filename(name, fmt, gzip=False):
+    return f"{name}.{FORMATS[fmt][1]}" + ('.gz' if gzip else '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export sessions, payments or violations')
+    parser.add_argument('table', choices=list(EXPORTS))
+    parser.add_argument('--format', choices=list(FORMATS), default='csv')
+    parser.add_argument('--from', dest='since', help="start (epoch or 'YYYY-MM-DD[ HH:MM[:SS]]')")
+    parser.add_argument('--to', dest='until', help='end, exclusive')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('-o', '--output', help='file to write (default: stdout)')
+    parser.add_argument('--db', default=DB_FILE, help='SQLite database')
+    args = parser.parse_args()
+
+    db = ParkingDB(args.db)
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    started = time.perf_counter()
+    written = 0
+    try:
+        for data in stream(db, args.table, args.format, args.since, args.until, args.gzip):
+            out.write(data)
+            written += len(data)
+    finally:
+        if args.output:
+            out.close()
+        db.close()
+    elapsed = time.perf_counter() - started
+    print(f"[EXPORT] {args.table}: {written / 1e6:.1f} MB in {elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
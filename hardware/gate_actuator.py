@@ -0,0 +1,150 @@
+import logging
+import queue
+import threading
+import time
+
+import protocol
+
+logger = logging.getLogger('Gate')
+
+# command: (bytes sent, acknowledgement line expected from the gate Arduino)
+COMMANDS = {
+    'open': (b'1', "[GATE] Opened"),
+    'close': (b'0', "[GATE] Closed"),
+    'alarm': (b'2', "[ALERT] Unpaid vehicle detected"),
+    'clear': (b'0', "[ALERT] Cleared"),
+}
+
+# command: frame type on a FramedTransport (acked by sequence number)
+FRAME_COMMANDS = {
+    'open': protocol.MSG_GATE_OPEN,
+    'close': protocol.MSG_GATE_CLOSE,
+    'alarm': protocol.MSG_ALARM_ON,
+    'clear': protocol.MSG_ALARM_OFF,
+}
+
+# deadline name -> command issued when it expires
+DEADLINE_ACTIONS = {
+    'close': 'close',
+    'buzzer_off': 'clear',
+}
+
+
+class GateActuator:
+    """Single owner of the barrier and buzzer.
+
+    Callers enqueue open()/alarm() and return immediately; a worker thread
+    sends the commands and waits for the Arduino's acknowledgements. Auto-close
+    and buzzer-off are two named deadlines on one timer loop: re-triggering
+    open() while the gate is up extends the close deadline instead of
+    stacking another timer.
+    """
+
+    def __init__(self, transport=None, open_time=10, buzzer_time=5, ack_timeout=2.0):
+        self.transport = transport
+        self.open_time = open_time
+        self.buzzer_time = buzzer_time
+        self.ack_timeout = ack_timeout
+
+        self.gate_is_open = False
+        self.buzzer_is_on = False
+        self.deadlines = {}
+        self.commands = queue.Queue()
+        self._cond = threading.Condition()
+        self._running = True
+        self._worker = threading.Thread(target=self._run_commands, name='gate-commands', daemon=True)
+        self._timer = threading.Thread(target=self._run_deadlines, name='gate-timers', daemon=True)
+        self._worker.start()
+        self._timer.start()
+
+    @property
+    def busy(self):
+        """True while the gate is up or the buzzer is sounding."""
+        return self.gate_is_open or self.buzzer_is_on
+
+    def open(self, duration=None):
+        """Open the gate (or keep it open) for `duration` seconds from now."""
+        with self._cond:
+            self.deadlines['close'] = time.monotonic() + (duration or self.open_time)
+            already_open = self.gate_is_open
+            self.gate_is_open = True
+            self._cond.notify()
+        if not already_open:
+            self.commands.put('open')
+
+    def alarm(self, duration=None):
+        """Sound the buzzer for `duration` seconds from now."""
+        with self._cond:
+            self.deadlines['buzzer_off'] = time.monotonic() + (duration or self.buzzer_time)
+            already_on = self.buzzer_is_on
+            self.buzzer_is_on = True
+            self._cond.notify()
+        if not already_on:
+            self.commands.put('alarm')
+
+    def close(self):
+        """Close the gate now and cancel the pending auto-close."""
+        with self._cond:
+            self.deadlines.pop('close', None)
+            was_open = self.gate_is_open
+            self.gate_is_open = False
+        if was_open:
+            self.commands.put('close')
+
+    def _run_deadlines(self):
+        with self._cond:
+            while self._running:
+                now = time.monotonic()
+                for name, deadline in list(self.deadlines.items()):
+                    if deadline <= now:
+                        del self.deadlines[name]
+                        if name == 'close':
+                            self.gate_is_open = False
+                        else:
+                            self.buzzer_is_on = False
+                        self.commands.put(DEADLINE_ACTIONS[name])
+
+                timeout = min(self.deadlines.values()) - now if self.deadlines else None
+                self._cond.wait(timeout)
+
+    def _run_commands(self):
+        while True:
+            command = self.commands.get()
+            if command is None:
+                break
+            self._send(command)
+
+    def _send(self, command):
+        data, ack = COMMANDS[command]
+        if self.transport is None:
+            logger.info(f"{command} (SIMULATED)")
+            return
+
+        started = time.monotonic()
+        try:
+            if getattr(self.transport, 'framed', False):
+                frame = self.transport.request(FRAME_COMMANDS[command], timeout=self.ack_timeout)
+                reply = frame and f"{command} acked (seq {frame.seq})"
+            else:
+                reply = self.transport.request(data, ack, timeout=self.ack_timeout)
+        except Exception as e:
+            logger.error(f"Failed to send {command}: {e}")
+            return
+        if reply:
+            logger.info(f"{reply} (sent '{data.decode()}', {(time.monotonic() - started) * 1000:.0f}ms)")
+        else:
+            logger.warning(f"No acknowledgement for {command} within {self.ack_timeout}s")
+
+    def shutdown(self):
+        """Close the barrier, silence the buzzer and stop the worker threads."""
+        with self._cond:
+            pending = self.gate_is_open or self.buzzer_is_on
+            self.deadlines.clear()
+            self.gate_is_open = self.buzzer_is_on = False
+            self._running = False
+            self._cond.notify()
+        if pending:
+            self.commands.put('close')
+        self.commands.put(None)
+        self._worker.join(timeout=self.ack_timeout + 1)
+        self._timer.join(timeout=1)
@@ -1,19 +1,22 @@
-import platform
 import cv2
-import numpy as np
-from ultralytics import YOLO
-import pytesseract
 import os
 import time
 import serial
-import serial.tools.list_ports
 import csv
 import logging
-from collections import Counter
 from datetime import datetime
 import re
 import argparse
-import threading
+
+from consensus import PlateConsensus
+from device_manager import open_role
+from gate_actuator import GateActuator
+from ocr_engine import BACKENDS, OcrEnginePool, adaptive_threshold
+from pipeline import StagedPipeline
+from replay import ReplaySource
+from sensor import UltrasonicSampler
+from serial_transport import SerialTransport
+from tracker import PlateTracker, Track
 
 
 class PlateRecognitionSystem:
@@ -31,14 +34,29 @@ class PlateRecognitionSystem:
 
         # Initialize components
         self.init_csv()
-        self.load_model()
         self.connect_arduino()
-        self.init_camera()
+        self.gate = GateActuator(self.transport, open_time=config['gate_open_duration'])
+        self.init_sensor()
+        self.pipeline = None
+        self.ocr = None
+        self.cap = None
+        if config['pipeline']:
+            # Capture, detection and OCR run in their own processes
+            self.pipeline = StagedPipeline(config, adaptive_threshold)
+        else:
+            self.load_model()
+            self.init_ocr()
+            self.init_camera()
 
         # State variables
-        self.plate_buffer = []
+        self.tracker = PlateTracker(
+            confidence=config['consensus_confidence'],
+            max_frames=config['max_consensus_frames']
+        )
+        self.current_plate_img = None
         self.last_saved_plate = None
         self.last_entry_time = 0
+        self.replay_image = None  # still being replayed; a new one is a new vehicle
         self.entry_count = self.get_entry_count()
         self.running = False
 
@@ -75,47 +93,40 @@ class PlateRecognitionSystem:
         """Load the YOLO model for plate detection."""
         try:
             self.logger.info(f"Loading model from {self.config['model_path']}")
+            from ultralytics import YOLO
             self.model = YOLO(self.config['model_path'])
             self.logger.info("Model loaded successfully")
         except Exception as e:
             self.logger.error(f"Failed to load model: {e}")
             raise
 
-    def detect_arduino_port(self):
-        """Auto-detect Arduino serial port based on the operating system."""
-        ports = list(serial.tools.list_ports.comports())
-        system = platform.system()
-
-        for port in ports:
-            port_desc = f"{port.device} - {port.description}"
-            self.logger.debug(f"Found port: {port_desc}")
-
-            if system == "Linux" and ("ttyUSB" in port.device or "ttyACM" in port.device):
-                self.logger.info(f"Detected Arduino port on Linux: {port.device}")
-                return port.device
-            elif system == "Darwin" and ("usbmodem" in port.device or "usbserial" in port.device):
-                self.logger.info(f"Detected Arduino port on macOS: {port.device}")
-                return port.device
-            elif system == "Windows" and "COM" in port.device:
-                self.logger.info(f"Detected Arduino port on Windows: {port.device}")
-                return port.device
-
-        self.logger.warning("No Arduino port detected")
-        return None
+    def init_ocr(self):
+        """Start the pool of long-lived OCR engines."""
+        try:
+            self.ocr = OcrEnginePool(
+                self.config['tesseract_config'],
+                size=self.config['ocr_workers'],
+                backend=self.config['ocr_backend']
+            )
+            self.logger.info(f"OCR backend: {self.ocr.backend}")
+        except Exception as e:
+            self.logger.error(f"Failed to initialize OCR: {e}")
+            raise
 
     def connect_arduino(self):
         """Connect to Arduino for gate control and distance sensing."""
         self.arduino = None
+        self.transport = None
 
         if not self.config['use_arduino']:
             self.logger.info("Arduino disabled in configuration")
             return
 
         try:
-            arduino_port = self.detect_arduino_port()
-            if arduino_port:
-                self.arduino = serial.Serial(arduino_port, 9600, timeout=1)
-                time.sleep(2)  # Wait for connection to stabilize
+            # Device manager pty when running (no reset wait), else the board itself
+            self.arduino, arduino_port = open_role('entry_gate')
+            if self.arduino:
+                self.transport = SerialTransport(self.arduino, name=arduino_port).start()
                 self.logger.info(f"Connected to Arduino on {arduino_port}")
             else:
                 self.logger.warning("Arduino not detected, running in simulation mode")
@@ -124,7 +135,14 @@ class PlateRecognitionSystem:
             self.logger.warning("Running in simulation mode")
 
     def init_camera(self):
-        """Initialize the webcam for video capture."""
+        """Initialize the webcam for video capture, or a replay source."""
+        if self.config.get('replay_source'):
+            self.cap = ReplaySource(self.config['replay_source'])
+            if not self.cap.isOpened():
+                raise IOError(f"Could not open replay source {self.config['replay_source']}")
+            self.logger.info(f"Replaying frames from {self.config['replay_source']}")
+            return
+
         try:
             self.logger.info(f"Connecting to camera on device {self.config['camera_device']}")
             self.cap = cv2.VideoCapture(self.config['camera_device'])
@@ -143,49 +161,32 @@ class PlateRecognitionSystem:
             self.logger.error(f"Camera initialization error: {e}")
             raise
 
-    def read_distance(self):
-        """Read distance value from Arduino or simulate if not available."""
-        if self.arduino and self.arduino.is_open and self.arduino.in_waiting > 0:
-            try:
-                line = self.arduino.readline().decode('utf-8').strip()
-                distance = float(line)
-                self.logger.debug(f"Read distance from Arduino: {distance}cm")
-                return distance
-            except (ValueError, serial.SerialException) as e:
-                self.logger.warning(f"Error reading from Arduino: {e}")
-
-        # Return simulated distance if Arduino unavailable
-        distance = self.mock_ultrasonic_distance()
-        self.logger.debug(f"Using simulated distance: {distance}cm")
-        return distance
-
-    def mock_ultrasonic_distance(self):
-        """Generate a simulated distance value for testing."""
-        import random
-        return random.choice([random.randint(10, 40)] + [random.randint(60, 150)] * 10)
+    def init_sensor(self):
+        """Start the background ultrasonic sampler (simulated without an Arduino)."""
+        self.sensor = UltrasonicSampler(
+            self.transport,
+            arrive_distance=self.config['detection_distance'],
+            depart_distance=self.config['detection_distance'] + self.config['distance_hysteresis']
+        )
+        self.sensor.start()
+        if self.sensor.simulated:
+            self.logger.info("Using simulated distance sensor")
 
-    def control_gate(self, open_gate=True):
-        """Control the gate via Arduino."""
-        if not self.arduino or not self.arduino.is_open:
-            self.logger.info(f"Gate {'opening' if open_gate else 'closing'} (SIMULATED)")
-            return
+    def vehicle_present(self):
+        """True while a vehicle is at the gate; a replay always has one in frame."""
+        return bool(self.config.get('replay_source')) or self.sensor.present
 
-        try:
-            command = b'1' if open_gate else b'0'
-            self.arduino.write(command)
-            state = "Opening" if open_gate else "Closing"
-            self.logger.info(f"Gate {state.lower()} (sent '{command.decode()}')")
-
-            if open_gate:
-                # Start a timer to close the gate after the configured duration
-                threading.Timer(
-                    self.config['gate_open_duration'],
-                    self.control_gate,
-                    [False]
-                ).start()
+    def read_distance(self):
+        """Latest median-filtered distance from the sensor thread."""
+        distance = self.sensor.distance
+        return float('inf') if distance is None else distance
 
-        except serial.SerialException as e:
-            self.logger.error(f"Failed to control gate: {e}")
+    def control_gate(self, open_gate=True):
+        """Queue a gate command; re-opening extends the auto-close deadline."""
+        if open_gate:
+            self.gate.open(self.config['gate_open_duration'])
+        else:
+            self.gate.close()
 
     def process_plate_image(self, plate_img):
         """Process the plate image for better OCR accuracy."""
@@ -194,40 +195,19 @@ class PlateRecognitionSystem:
             return None
 
         try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY)
-
-            # Apply adaptive thresholding
-            thresh = cv2.adaptiveThreshold(
-                gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                cv2.THRESH_BINARY_INV, 11, 2
-            )
-
-            # Noise removal
-            kernel = np.ones((1, 1), np.uint8)
-            thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
-            thresh = cv2.medianBlur(thresh, 3)
-
-            return thresh
+            # Adaptive thresholding and noise removal
+            return adaptive_threshold(plate_img)
         except Exception as e:
             self.logger.error(f"Error processing plate image: {e}")
             return None
 
-    def extract_plate_text(self, processed_img):
-        """Extract plate text using OCR."""
+    def extract_plate_chars(self, processed_img):
+        """Extract plate characters with per-character OCR confidence."""
         if processed_img is None:
             return None
 
         try:
-            # Get OCR options from config
-            config = self.config['tesseract_config']
-
-            # Run OCR
-            plate_text = pytesseract.image_to_string(
-                processed_img, config=config
-            ).strip().replace(" ", "")
-
-            return plate_text
+            return self.ocr.recognize_chars(processed_img)
         except Exception as e:
             self.logger.error(f"OCR error: {e}")
             return None
@@ -269,7 +249,7 @@ class PlateRecognitionSystem:
             self.logger.info(f"Recorded entry for plate {plate_number}")
 
             # Save plate image if configured
-            if self.config['save_plate_images']:
+            if self.config['save_plate_images'] and self.current_plate_img is not None:
                 filename = f"{plate_number}_{time.strftime('%Y%m%d_%H%M%S')}.jpg"
                 cv2.imwrite(os.path.join(self.config['save_dir'], filename), self.current_plate_img)
                 self.logger.debug(f"Saved plate image to {filename}")
@@ -294,44 +274,50 @@ class PlateRecognitionSystem:
             return frame
 
         try:
-            # Get distance from sensor
-            distance = self.read_distance()
-            self.logger.debug(f"Current distance: {distance}cm")
-
-            # Only process if vehicle is close enough
-            if distance <= self.config['detection_distance']:
+            # Only run inference while a vehicle is present at the gate
+            if self.sensor.consume_arrival():
+                self.logger.info(f"Vehicle arrived at {self.read_distance():.1f}cm, starting recognition")
+                self.tracker.reset()
+            if self.config.get('replay_source') and self.cap.name != self.replay_image:
+                self.replay_image = self.cap.name
+                self.tracker.reset()
+
+            if self.vehicle_present():
                 # Run object detection
                 results = self.model(frame)
 
-                # Process detection results
-                for result in results:
-                    for box in result.boxes:
-                        # Extract box coordinates
-                        x1, y1, x2, y2 = map(int, box.xyxy[0])
+                # Assign each detection to a tracked vehicle
+                boxes = [tuple(map(int, box.xyxy[0])) for result in results for box in result.boxes]
+                tracks = self.tracker.update(boxes)
 
-                        # Extract plate image
-                        plate_img = frame[y1:y2, x1:x2]
-                        self.current_plate_img = plate_img.copy()
+                for track, (x1, y1, x2, y2) in zip(tracks, boxes):
+                    # Plate already agreed for this vehicle, skip OCR
+                    if track.decided:
+                        continue
 
-                        # Process plate image for OCR
-                        processed_img = self.process_plate_image(plate_img)
-                        if processed_img is None:
-                            continue
+                    # Extract plate image
+                    plate_img = frame[y1:y2, x1:x2]
+                    self.current_plate_img = plate_img.copy()
 
-                        # Extract text with OCR
-                        plate_text = self.extract_plate_text(processed_img)
-                        if not plate_text:
-                            continue
+                    # Process plate image for OCR
+                    processed_img = self.process_plate_image(plate_img)
+                    if processed_img is None:
+                        continue
 
-                        # Validate plate format
-                        valid_plate = self.validate_plate(plate_text)
-                        if valid_plate:
-                            self.handle_valid_plate(valid_plate)
+                    # Extract characters and their confidences with OCR
+                    plate_chars = self.extract_plate_chars(processed_img)
+                    if not plate_chars:
+                        continue
 
-                            # Display plate images if in debug mode
-                            if self.config['debug_mode']:
-                                cv2.imshow("Plate", plate_img)
-                                cv2.imshow("Processed", processed_img)
+                    # Validate plate format
+                    valid_plate = self.validate_plate(''.join(char for char, _ in plate_chars))
+                    if valid_plate:
+                        self.handle_valid_plate(track, plate_chars)
+
+                        # Display plate images if in debug mode
+                        if self.config['debug_mode']:
+                            cv2.imshow("Plate", plate_img)
+                            cv2.imshow("Processed", processed_img)
 
                 # Return annotated frame
                 return results[0].plot()
@@ -343,55 +329,50 @@ class PlateRecognitionSystem:
             self.logger.error(f"Error processing frame: {e}")
             return frame
 
-    def handle_valid_plate(self, plate_number):
-        """Handle a validated license plate."""
-        # Add to detection buffer
-        self.plate_buffer.append(plate_number)
-
-        # Decision after collecting enough samples
-        if len(self.plate_buffer) >= self.config['min_plate_detections']:
-            # Get most common plate from buffer (consensus)
-            plate_counts = Counter(self.plate_buffer)
-            most_common = plate_counts.most_common(1)[0][0]
-            most_common_count = plate_counts.most_common(1)[0][1]
-
-            # Check if we have a strong consensus
-            buffer_size = len(self.plate_buffer)
-            consensus_ratio = most_common_count / buffer_size
-
-            if consensus_ratio >= self.config['min_consensus_ratio']:
-                self.logger.info(f"Strong consensus ({consensus_ratio:.2f}) for plate {most_common}")
-                current_time = time.time()
-
-                # Check for duplicate entry within cooldown period
-                if (most_common != self.last_saved_plate or
-                        (current_time - self.last_entry_time) > self.config['entry_cooldown']):
-
-                    # Save plate entry to CSV
-                    if self.save_plate_entry(most_common):
-                        # Open gate
-                        self.control_gate(open_gate=True)
-
-                        # Update state
-                        self.last_saved_plate = most_common
-                        self.last_entry_time = current_time
-                else:
-                    self.logger.info(f"Skipped duplicate entry for {most_common} within cooldown period")
-            else:
-                self.logger.warning(f"Weak consensus ({consensus_ratio:.2f}) for {most_common}, ignoring")
+    def handle_valid_plate(self, track, plate_chars):
+        """Handle a validated license plate read for one tracked vehicle."""
+        # Vote per character; decides as soon as the confidence bound is met
+        most_common = track.vote(plate_chars)
+        if most_common is None:
+            return
 
-            # Clear buffer after processing
-            self.plate_buffer.clear()
+        self.logger.info(
+            f"Consensus for plate {most_common} on track {track.id} after {track.frames} frames "
+            f"(confidence {track.consensus.confidence():.3f})"
+        )
+        current_time = time.time()
+
+        # Check for duplicate entry within cooldown period
+        if (most_common != self.last_saved_plate or
+                (current_time - self.last_entry_time) > self.config['entry_cooldown']):
+
+            # Save plate entry to CSV
+            if self.save_plate_entry(most_common):
+                # Open gate
+                self.control_gate(open_gate=True)
+
+                # Update state
+                self.last_saved_plate = most_common
+                self.last_entry_time = current_time
+        else:
+            self.logger.info(f"Skipped duplicate entry for {most_common} within cooldown period")
 
     def run(self):
         """Main processing loop."""
         self.logger.info("Starting plate recognition system")
         self.running = True
 
+        if self.pipeline:
+            self.run_pipeline()
+            return
+
         try:
             while self.running:
                 # Capture frame
                 ret, frame = self.cap.read()
+                if not ret and self.config.get('replay_source'):
+                    self.logger.info("Replay finished")
+                    break
                 if not ret:
                     self.logger.warning("Failed to capture frame")
                     time.sleep(0.1)
@@ -400,6 +381,9 @@ class PlateRecognitionSystem:
                 # Process the frame
                 processed_frame = self.process_frame(frame)
 
+                if self.config.get('headless'):
+                    continue
+
                 # Display frame
                 cv2.imshow('Plate Recognition System', processed_frame)
 
@@ -416,23 +400,81 @@ class PlateRecognitionSystem:
         finally:
             self.cleanup()
 
+    def run_pipeline(self):
+        """Decision loop for the multi-process pipeline: sensor gating and voting."""
+        tracks = {}
+        retired = set()  # ids of earlier vehicles' tracks; late OCR results for them are dropped
+        # Set before capture starts, so a replay's first frames are not skipped
+        self.pipeline.set_active(self.vehicle_present())
+        self.pipeline.start()
+
+        try:
+            while self.running:
+                # A new vehicle starts with no tracks, here and in the detector
+                if self.sensor.consume_arrival():
+                    self.logger.info(f"Vehicle arrived at {self.read_distance():.1f}cm, starting recognition")
+                    retired.update(tracks)
+                    tracks.clear()
+                    self.pipeline.reset_tracks()
+
+                # Only capture while a vehicle is present at the gate
+                self.pipeline.set_active(self.vehicle_present())
+
+                try:
+                    result = self.pipeline.get_result()
+                except EOFError:
+                    self.logger.info("Replay finished")
+                    break
+                if result is None:
+                    continue
+
+                track_id, frame_no, box, plate_chars = result
+                if track_id in retired:
+                    continue
+                track = tracks.get(track_id)
+                if track is None:
+                    track = tracks[track_id] = Track(track_id, box, PlateConsensus(
+                        self.config['consensus_confidence'], self.config['max_consensus_frames']))
+                if track.decided or not plate_chars:
+                    continue
+
+                if self.validate_plate(''.join(char for char, _ in plate_chars)):
+                    self.handle_valid_plate(track, plate_chars)
+                    if track.decided:
+                        self.pipeline.mark_decided(track_id)
+
+        except KeyboardInterrupt:
+            self.logger.info("Interrupted by user")
+        except Exception as e:
+            self.logger.error(f"Runtime error: {e}")
+        finally:
+            self.cleanup()
+
     def cleanup(self):
         """Clean up resources."""
         self.logger.info("Cleaning up resources")
 
+        if self.pipeline:
+            self.pipeline.close()
+
         if self.cap and self.cap.isOpened():
             self.cap.release()
 
-        if self.arduino and self.arduino.is_open:
+        self.sensor.stop()
+
+        # Close the gate before exiting
+        self.gate.shutdown()
+
+        if self.transport:
             try:
-                # Close the gate before exiting
-                self.arduino.write(b'0')
-                time.sleep(0.5)
-                self.arduino.close()
+                self.transport.close()
             except serial.SerialException as e:
                 self.logger.error(f"Error closing Arduino connection: {e}")
 
-        cv2.destroyAllWindows()
+        if self.ocr:
+            self.ocr.close()
+        if not self.config.get('headless'):
+            cv2.destroyAllWindows()
         self.logger.info("System shutdown complete")
 
 
@@ -450,6 +492,18 @@ def parse_arguments():
                         help='Enable debug mode')
     parser.add_argument('--save-images', action='store_true',
                         help='Save detected plate images')
+    parser.add_argument('--replay', type=str, default=None,
+                        help='Replay a video file or image directory instead of the camera')
+    parser.add_argument('--headless', action='store_true',
+                        help='Run without display windows')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Run capture, detection and OCR in separate processes')
+    parser.add_argument('--ocr-processes', type=int, default=max(1, (os.cpu_count() or 2) - 2),
+                        help='OCR worker processes in pipeline mode')
+    parser.add_argument('--ocr-backend', choices=BACKENDS, default='auto',
+                        help='OCR backend (auto prefers in-process tesserocr)')
+    parser.add_argument('--ocr-workers', type=int, default=1,
+                        help='Number of pooled OCR engines')
 
     return parser.parse_args()
 
@@ -462,6 +516,8 @@ def main():
     config = {
         'model_path': args.model,
         'camera_device': args.camera,
+        'replay_source': args.replay,
+        'headless': args.headless,
         'camera_width': 1280,
         'camera_height': 720,
         'use_arduino': args.arduino,
@@ -473,11 +529,17 @@ def main():
         'log_file': 'logs/plate_recognition.log',
 
         'detection_distance': 50,  # cm
+        'distance_hysteresis': 10,  # cm beyond detection_distance before a departure
         'entry_cooldown': 300,  # seconds (5 minutes)
         'gate_open_duration': 15,  # seconds
-        'min_plate_detections': 3,
-        'min_consensus_ratio': 0.7,
+        'consensus_confidence': 0.99,  # per-character bound for an early decision
+        'max_consensus_frames': 12,  # reads before a vehicle's vote starts over
         'plate_regex': r'(RA[A-Z]\d{3}[A-Z])',  # Regex for plates starting with RA + letter + 3 digits + letter  # Adjust pattern for your plates
+        'pipeline': args.pipeline,
+        'ocr_processes': args.ocr_processes,
+        'ring_slots': 8,  # shared memory frame slots in pipeline mode
+        'ocr_backend': args.ocr_backend,
+        'ocr_workers': args.ocr_workers,
         'tesseract_config': '--psm 8 --oem 3 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
     }
 
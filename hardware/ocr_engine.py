@@ -0,0 +1,208 @@
+import logging
+import queue
+import re
+import threading
+
+import cv2
+import numpy as np
+
+try:
+    import tesserocr
+except ImportError:  # libtesseract bindings are optional
+    tesserocr = None
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+logger = logging.getLogger('OCR')
+
+PLATE_CHARSET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+DEFAULT_TESSERACT_CONFIG = f'--psm 8 --oem 3 -c tessedit_char_whitelist={PLATE_CHARSET}'
+
+BACKENDS = ('auto', 'tesserocr', 'pytesseract')
+
+
+def otsu_threshold(plate_img):
+    """Grayscale, blur and Otsu-binarise a plate crop (gate scripts' preprocessing)."""
+    gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY)
+    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+    return cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+
+def adaptive_threshold(plate_img):
+    """Adaptive-threshold a plate crop and remove speckle noise (main.py's preprocessing)."""
+    if plate_img.size == 0:
+        return None
+
+    gray = cv2.cvtColor(plate_img, cv2.COLOR_BGR2GRAY)
+    thresh = cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY_INV, 11, 2
+    )
+    kernel = np.ones((1, 1), np.uint8)
+    thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
+    return cv2.medianBlur(thresh, 3)
+
+
+def parse_tesseract_config(config):
+    """Split a tesseract command line config into psm, oem and -c variables."""
+    options = {'psm': 3, 'oem': 3, 'variables': {}}
+
+    psm = re.search(r'--psm\s+(\d+)', config)
+    if psm:
+        options['psm'] = int(psm.group(1))
+
+    oem = re.search(r'--oem\s+(\d+)', config)
+    if oem:
+        options['oem'] = int(oem.group(1))
+
+    for name, value in re.findall(r'-c\s+(\w+)=(\S+)', config):
+        options['variables'][name] = value
+
+    return options
+
+
+class PytesseractEngine:
+    """OCR through the tesseract binary (one subprocess per call)."""
+
+    name = 'pytesseract'
+
+    def __init__(self, config=DEFAULT_TESSERACT_CONFIG):
+        if pytesseract is None:
+            raise RuntimeError("pytesseract is not installed")
+        self.config = config
+
+    def recognize(self, image):
+        """Return the recognised text of a plate crop with spaces removed."""
+        text = pytesseract.image_to_string(image, config=self.config)
+        return text.strip().replace(' ', '')
+
+    def recognize_chars(self, image):
+        """Return [(char, confidence 0-1)]; the binary only reports word confidence."""
+        data = pytesseract.image_to_data(image, config=self.config, output_type=pytesseract.Output.DICT)
+        chars = []
+        for word, conf in zip(data['text'], data['conf']):
+            conf = float(conf)
+            if conf < 0:
+                continue
+            chars.extend((char, conf / 100) for char in word.strip())
+        return chars
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """OCR through an in-process libtesseract handle.
+
+    The handle is initialised once with the psm/oem/whitelist settings and
+    is fed numpy buffers directly, so no process is forked and no temp
+    image file is written per crop.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, config=DEFAULT_TESSERACT_CONFIG):
+        if tesserocr is None:
+            raise RuntimeError("tesserocr is not installed")
+        options = parse_tesseract_config(config)
+        self.api = tesserocr.PyTessBaseAPI(psm=options['psm'], oem=options['oem'])
+        for name, value in options['variables'].items():
+            self.api.SetVariable(name, value)
+
+    def set_image(self, image):
+        """Hand a grayscale or BGR numpy image to tesseract without copying to disk."""
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        self.api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+
+    def recognize(self, image):
+        """Return the recognised text of a plate crop with spaces removed."""
+        self.set_image(image)
+        return self.api.GetUTF8Text().strip().replace(' ', '')
+
+    def recognize_chars(self, image):
+        """Return [(char, confidence 0-1)] for every recognised symbol."""
+        self.set_image(image)
+        self.api.Recognize()
+        level = tesserocr.RIL.SYMBOL
+        chars = []
+        for symbol in tesserocr.iterate_level(self.api.GetIterator(), level):
+            char = symbol.GetUTF8Text(level)
+            if char and char.strip():
+                chars.append((char.strip(), symbol.Confidence(level) / 100))
+        return chars
+
+    def close(self):
+        self.api.End()
+
+
+def create_engine(backend='auto', config=DEFAULT_TESSERACT_CONFIG):
+    """Create a single OCR engine, falling back to pytesseract for 'auto'."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown OCR backend: {backend}")
+
+    if backend in ('auto', 'tesserocr'):
+        try:
+            return TesserocrEngine(config)
+        except RuntimeError as e:
+            if backend == 'tesserocr':
+                raise
+            logger.warning(f"In-process OCR unavailable ({e}), falling back to pytesseract")
+
+    return PytesseractEngine(config)
+
+
+class OcrEnginePool:
+    """Fixed pool of long-lived OCR engines shared by the recognition loops.
+
+    Engines are created up front and borrowed per crop, so callers on several
+    threads never pay for engine start-up on the hot path.
+    """
+
+    def __init__(self, config=DEFAULT_TESSERACT_CONFIG, size=1, backend='auto'):
+        self.config = config
+        self.size = max(1, size)
+        self._engines = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+
+        for _ in range(self.size):
+            engine = create_engine(backend, config)
+            self._all.append(engine)
+            self._engines.put(engine)
+
+        self.backend = self._all[0].name
+        logger.info(f"OCR pool ready: {self.size} x {self.backend}")
+
+    def recognize(self, image):
+        """Run OCR on a numpy image using the next free engine."""
+        engine = self._engines.get()
+        try:
+            return engine.recognize(image)
+        finally:
+            self._engines.put(engine)
+
+    def recognize_chars(self, image):
+        """Run OCR and return per-character confidences using the next free engine."""
+        engine = self._engines.get()
+        try:
+            return engine.recognize_chars(image)
+        finally:
+            self._engines.put(engine)
+
+    def close(self):
+        """Release every engine in the pool."""
+        with self._lock:
+            for engine in self._all:
+                engine.close()
+            self._all = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
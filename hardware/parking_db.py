@@ -0,0 +1,1000 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+logger = logging.getLogger('ParkingDB')
+
+DB_FILE = 'parking.db'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+# Recomputes the stats_* summary tables (migration 8) from the base tables;
+# run by the migration and by `python stats.py backfill`.
+STATS_BACKFILL = '''
+    DELETE FROM stats_hourly;
+    DELETE FROM stats_gate_violations;
+    INSERT INTO stats_hourly (hour_ts, entries)
+        SELECT entry_ts / 3600 * 3600, COUNT(*) FROM entries WHERE entry_ts IS NOT NULL GROUP BY 1
+        ON CONFLICT (hour_ts) DO UPDATE SET entries = excluded.entries;
+    INSERT INTO stats_hourly (hour_ts, exits, paid, revenue)
+        SELECT exit_ts / 3600 * 3600, COUNT(*),
+               SUM(payment_status = 1 AND due_payment IS NOT NULL),
+               SUM(CASE WHEN payment_status = 1 THEN COALESCE(due_payment, 0) ELSE 0 END)
+        FROM entries WHERE exit_ts IS NOT NULL GROUP BY 1
+        ON CONFLICT (hour_ts) DO UPDATE SET
+            exits = excluded.exits, paid = excluded.paid, revenue = excluded.revenue;
+    INSERT INTO stats_hourly (hour_ts, violations)
+        SELECT CAST(strftime('%s', timestamp, 'utc') AS INTEGER) / 3600 * 3600, COUNT(*)
+        FROM violations WHERE strftime('%s', timestamp, 'utc') IS NOT NULL GROUP BY 1
+        ON CONFLICT (hour_ts) DO UPDATE SET violations = excluded.violations;
+    INSERT INTO stats_gate_violations (gate_location, violations, last_timestamp)
+        SELECT COALESCE(gate_location, ''), COUNT(*), MAX(timestamp) FROM violations GROUP BY 1;
+    INSERT INTO stats_occupancy (id, inside)
+        SELECT 1, COUNT(*) FROM entries WHERE exit_ts IS NULL
+        ON CONFLICT (id) DO UPDATE SET inside = excluded.inside;
+'''
+
+# Schema migrations, applied in order; PRAGMA user_version holds the number applied.
+MIGRATIONS = [
+    # 1: base schema (previously created by migrate_to_db.py)
+    '''
+    CREATE TABLE IF NOT EXISTS entries (
+        no INTEGER PRIMARY KEY,
+        entry_time TEXT,
+        exit_time TEXT,
+        car_plate TEXT,
+        due_payment REAL,
+        payment_status INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS violations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        car_plate TEXT,
+        gate_location TEXT,
+        reason TEXT
+    );
+    ''',
+    # 2: indexes for the gate decisions and dashboard listings
+    '''
+    CREATE INDEX IF NOT EXISTS idx_entries_plate_status_exit
+        ON entries (car_plate, payment_status, exit_time, entry_time);
+    CREATE INDEX IF NOT EXISTS idx_entries_exit_entry
+        ON entries (exit_time, entry_time);
+    CREATE INDEX IF NOT EXISTS idx_entries_status_exit
+        ON entries (payment_status, exit_time);
+    CREATE INDEX IF NOT EXISTS idx_violations_timestamp
+        ON violations (timestamp);
+    ''',
+    # 3: change log filled by triggers, so other processes can see what changed
+    '''
+    CREATE TABLE IF NOT EXISTS change_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tbl TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL
+    );
+    CREATE TRIGGER IF NOT EXISTS entries_log_insert AFTER INSERT ON entries BEGIN
+        INSERT INTO change_log (tbl, row_id, op) VALUES ('entries', NEW.no, 'insert');
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_log_update AFTER UPDATE ON entries BEGIN
+        INSERT INTO change_log (tbl, row_id, op) VALUES ('entries', NEW.no, 'update');
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_log_delete AFTER DELETE ON entries BEGIN
+        INSERT INTO change_log (tbl, row_id, op) VALUES ('entries', OLD.no, 'delete');
+    END;
+    CREATE TRIGGER IF NOT EXISTS violations_log_insert AFTER INSERT ON violations BEGIN
+        INSERT INTO change_log (tbl, row_id, op) VALUES ('violations', NEW.id, 'insert');
+    END;
+    ''',
+    # 4: integer epoch timestamps (backfilled from the local-time text columns);
+    #    the text columns stay for display and are written alongside
+    '''
+    ALTER TABLE entries ADD COLUMN entry_ts INTEGER;
+    ALTER TABLE entries ADD COLUMN exit_ts INTEGER;
+    DROP TRIGGER IF EXISTS entries_log_update;
+    UPDATE entries SET
+        entry_ts = CAST(strftime('%s', entry_time, 'utc') AS INTEGER),
+        exit_ts = CAST(strftime('%s', NULLIF(exit_time, ''), 'utc') AS INTEGER);
+    CREATE TRIGGER IF NOT EXISTS entries_log_update AFTER UPDATE ON entries BEGIN
+        INSERT INTO change_log (tbl, row_id, op) VALUES ('entries', NEW.no, 'update');
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_fill_ts AFTER INSERT ON entries
+    WHEN NEW.entry_ts IS NULL BEGIN
+        UPDATE entries SET
+            entry_ts = CAST(strftime('%s', NEW.entry_time, 'utc') AS INTEGER),
+            exit_ts = CAST(strftime('%s', NULLIF(NEW.exit_time, ''), 'utc') AS INTEGER)
+        WHERE no = NEW.no;
+    END;
+    DROP INDEX IF EXISTS idx_entries_plate_status_exit;
+    DROP INDEX IF EXISTS idx_entries_exit_entry;
+    DROP INDEX IF EXISTS idx_entries_status_exit;
+    CREATE INDEX IF NOT EXISTS idx_entries_plate_status_exit_ts
+        ON entries (car_plate, payment_status, exit_ts, entry_ts);
+    CREATE INDEX IF NOT EXISTS idx_entries_exit_ts_entry_ts
+        ON entries (exit_ts, entry_ts);
+    CREATE INDEX IF NOT EXISTS idx_entries_status_exit_ts
+        ON entries (payment_status, exit_ts);
+    ''',
+    # 5: payments ledger (one row per settled session)
+    '''
+    CREATE TABLE IF NOT EXISTS payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entry_no INTEGER NOT NULL REFERENCES entries (no),
+        car_plate TEXT NOT NULL,
+        amount REAL NOT NULL,
+        balance_before REAL,
+        balance_after REAL,
+        method TEXT NOT NULL,
+        paid_ts INTEGER NOT NULL,
+        paid_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_payments_entry ON payments (entry_no);
+    CREATE INDEX IF NOT EXISTS idx_payments_paid_ts ON payments (paid_ts);
+    CREATE TRIGGER IF NOT EXISTS payments_log_insert AFTER INSERT ON payments BEGIN
+        INSERT INTO change_log (tbl, row_id, op) VALUES ('payments', NEW.id, 'insert');
+    END;
+    ''',
+    # 6: indexes for the dashboard's filtered violation pages
+    '''
+    CREATE INDEX IF NOT EXISTS idx_violations_plate_timestamp ON violations (car_plate, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_violations_gate_timestamp ON violations (gate_location, timestamp);
+    ''',
+    # 7: per-table change versions (MAX(id) for a table) and deltas for the dashboard
+    '''
+    CREATE INDEX IF NOT EXISTS idx_change_log_tbl_id ON change_log (tbl, id, row_id, op);
+    ''',
+    # 8: summary tables kept current by triggers, so the stats endpoints read
+    #    a few buckets instead of aggregating history. A row's contribution is
+    #    added on insert, removed on delete, and swapped on an update that
+    #    touches a counted column. Hours are epoch hour starts (UTC).
+    '''
+    CREATE TABLE IF NOT EXISTS stats_hourly (
+        hour_ts INTEGER PRIMARY KEY,
+        entries INTEGER NOT NULL DEFAULT 0,
+        exits INTEGER NOT NULL DEFAULT 0,
+        paid INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        violations INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS stats_occupancy (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        inside INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS stats_gate_violations (
+        gate_location TEXT PRIMARY KEY,
+        violations INTEGER NOT NULL DEFAULT 0,
+        last_timestamp TEXT
+    );
+    CREATE TRIGGER IF NOT EXISTS entries_stats_insert AFTER INSERT ON entries BEGIN
+        INSERT INTO stats_hourly (hour_ts, entries)
+            SELECT NEW.entry_ts / 3600 * 3600, 1 WHERE NEW.entry_ts IS NOT NULL
+            ON CONFLICT (hour_ts) DO UPDATE SET entries = entries + 1;
+        INSERT INTO stats_hourly (hour_ts, exits, paid, revenue)
+            SELECT NEW.exit_ts / 3600 * 3600, 1, NEW.payment_status = 1 AND NEW.due_payment IS NOT NULL,
+                   CASE WHEN NEW.payment_status = 1 THEN COALESCE(NEW.due_payment, 0) ELSE 0 END
+            WHERE NEW.exit_ts IS NOT NULL
+            ON CONFLICT (hour_ts) DO UPDATE SET
+                exits = exits + 1, paid = paid + excluded.paid, revenue = revenue + excluded.revenue;
+        UPDATE stats_occupancy SET inside = inside + 1 WHERE id = 1 AND NEW.exit_ts IS NULL;
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_stats_delete AFTER DELETE ON entries BEGIN
+        UPDATE stats_hourly SET entries = entries - 1 WHERE hour_ts = OLD.entry_ts / 3600 * 3600;
+        UPDATE stats_hourly SET
+            exits = exits - 1,
+            paid = paid - (OLD.payment_status = 1 AND OLD.due_payment IS NOT NULL),
+            revenue = revenue - CASE WHEN OLD.payment_status = 1 THEN COALESCE(OLD.due_payment, 0) ELSE 0 END
+        WHERE hour_ts = OLD.exit_ts / 3600 * 3600;
+        UPDATE stats_occupancy SET inside = inside - 1 WHERE id = 1 AND OLD.exit_ts IS NULL;
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_stats_update AFTER UPDATE ON entries
+    WHEN OLD.entry_ts IS NOT NEW.entry_ts OR OLD.exit_ts IS NOT NEW.exit_ts
+        OR OLD.payment_status IS NOT NEW.payment_status OR OLD.due_payment IS NOT NEW.due_payment BEGIN
+        UPDATE stats_hourly SET entries = entries - 1 WHERE hour_ts = OLD.entry_ts / 3600 * 3600;
+        UPDATE stats_hourly SET
+            exits = exits - 1,
+            paid = paid - (OLD.payment_status = 1 AND OLD.due_payment IS NOT NULL),
+            revenue = revenue - CASE WHEN OLD.payment_status = 1 THEN COALESCE(OLD.due_payment, 0) ELSE 0 END
+        WHERE hour_ts = OLD.exit_ts / 3600 * 3600;
+        INSERT INTO stats_hourly (hour_ts, entries)
+            SELECT NEW.entry_ts / 3600 * 3600, 1 WHERE NEW.entry_ts IS NOT NULL
+            ON CONFLICT (hour_ts) DO UPDATE SET entries = entries + 1;
+        INSERT INTO stats_hourly (hour_ts, exits, paid, revenue)
+            SELECT NEW.exit_ts / 3600 * 3600, 1, NEW.payment_status = 1 AND NEW.due_payment IS NOT NULL,
+                   CASE WHEN NEW.payment_status = 1 THEN COALESCE(NEW.due_payment, 0) ELSE 0 END
+            WHERE NEW.exit_ts IS NOT NULL
+            ON CONFLICT (hour_ts) DO UPDATE SET
+                exits = exits + 1, paid = paid + excluded.paid, revenue = revenue + excluded.revenue;
+        UPDATE stats_occupancy SET inside = inside + (NEW.exit_ts IS NULL) - (OLD.exit_ts IS NULL)
+        WHERE id = 1 AND (OLD.exit_ts IS NULL) != (NEW.exit_ts IS NULL);
+    END;
+    CREATE TRIGGER IF NOT EXISTS violations_stats_insert AFTER INSERT ON violations BEGIN
+        INSERT INTO stats_hourly (hour_ts, violations)
+            SELECT CAST(strftime('%s', NEW.timestamp, 'utc') AS INTEGER) / 3600 * 3600, 1
+            WHERE strftime('%s', NEW.timestamp, 'utc') IS NOT NULL
+            ON CONFLICT (hour_ts) DO UPDATE SET violations = violations + 1;
+        INSERT INTO stats_gate_violations (gate_location, violations, last_timestamp)
+            VALUES (COALESCE(NEW.gate_location, ''), 1, NEW.timestamp)
+            ON CONFLICT (gate_location) DO UPDATE SET
+                violations = violations + 1, last_timestamp = MAX(last_timestamp, excluded.last_timestamp);
+    END;
+    CREATE TRIGGER IF NOT EXISTS violations_stats_delete AFTER DELETE ON violations BEGIN
+        UPDATE stats_hourly SET violations = violations - 1
+        WHERE hour_ts = CAST(strftime('%s', OLD.timestamp, 'utc') AS INTEGER) / 3600 * 3600;
+        UPDATE stats_gate_violations SET violations = violations - 1
+        WHERE gate_location = COALESCE(OLD.gate_location, '');
+    END;
+    ''' + STATS_BACKFILL,
+    # 9: lot capacity next to the occupancy counter (NULL = no limit)
+    '''
+    ALTER TABLE stats_occupancy ADD COLUMN capacity INTEGER;
+    ''',
+    # 10: date-range exports of sessions by entry time
+    '''
+    CREATE INDEX IF NOT EXISTS idx_entries_entry_ts ON entries (entry_ts);
+    ''',
+    # 11: archival (archive.py) moves rows out without taking them out of the
+    #     summary tables: its delete transaction puts a row in `archiving`,
+    #     which the stats delete triggers check first
+    '''
+    CREATE TABLE IF NOT EXISTS archiving (id INTEGER PRIMARY KEY CHECK (id = 1));
+    DROP TRIGGER IF EXISTS entries_stats_delete;
+    CREATE TRIGGER IF NOT EXISTS entries_stats_delete AFTER DELETE ON entries
+    WHEN NOT EXISTS (SELECT 1 FROM archiving) BEGIN
+        UPDATE stats_hourly SET entries = entries - 1 WHERE hour_ts = OLD.entry_ts / 3600 * 3600;
+        UPDATE stats_hourly SET
+            exits = exits - 1,
+            paid = paid - (OLD.payment_status = 1 AND OLD.due_payment IS NOT NULL),
+            revenue = revenue - CASE WHEN OLD.payment_status = 1 THEN COALESCE(OLD.due_payment, 0) ELSE 0 END
+        WHERE hour_ts = OLD.exit_ts / 3600 * 3600;
+        UPDATE stats_occupancy SET inside = inside - 1 WHERE id = 1 AND OLD.exit_ts IS NULL;
+    END;
+    DROP TRIGGER IF EXISTS violations_stats_delete;
+    CREATE TRIGGER IF NOT EXISTS violations_stats_delete AFTER DELETE ON violations
+    WHEN NOT EXISTS (SELECT 1 FROM archiving) BEGIN
+        UPDATE stats_hourly SET violations = violations - 1
+        WHERE hour_ts = CAST(strftime('%s', OLD.timestamp, 'utc') AS INTEGER) / 3600 * 3600;
+        UPDATE stats_gate_violations SET violations = violations - 1
+        WHERE gate_location = COALESCE(OLD.gate_location, '');
+    END;
+    ''',
+    # 12: bulk CSV imports (bulk_import.py): the legacy plate sightings log,
+    #     hashes of every row imported so far, and per-file resume offsets
+    '''
+    CREATE TABLE IF NOT EXISTS plate_log (
+        id INTEGER PRIMARY KEY,
+        timestamp TEXT,
+        car_plate TEXT,
+        payment_status INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS import_hashes (hash BLOB PRIMARY KEY) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS import_progress (
+        path TEXT PRIMARY KEY,
+        offset INTEGER NOT NULL,
+        lines INTEGER NOT NULL,
+        imported INTEGER NOT NULL,
+        updated_ts INTEGER NOT NULL
+    );
+    ''',
+]
+
+# Cold storage for closed sessions and old violations (see archive.py),
+# attached as `archive`. Tables keep the main tables' keys and the EXPORTS
+# columns, so exports read both with a UNION ALL.
+ARCHIVE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS archive.entries (
+        no INTEGER PRIMARY KEY,
+        car_plate TEXT,
+        entry_time TEXT,
+        exit_time TEXT,
+        due_payment REAL,
+        payment_status INTEGER,
+        entry_ts INTEGER,
+        exit_ts INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS archive.idx_entries_entry_ts ON entries (entry_ts);
+    CREATE TABLE IF NOT EXISTS archive.payments (
+        id INTEGER PRIMARY KEY,
+        entry_no INTEGER NOT NULL,
+        car_plate TEXT NOT NULL,
+        amount REAL NOT NULL,
+        balance_before REAL,
+        balance_after REAL,
+        method TEXT NOT NULL,
+        paid_at TEXT NOT NULL,
+        paid_ts INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS archive.idx_payments_paid_ts ON payments (paid_ts);
+    CREATE TABLE IF NOT EXISTS archive.violations (
+        id INTEGER PRIMARY KEY,
+        timestamp TEXT,
+        car_plate TEXT,
+        gate_location TEXT,
+        reason TEXT
+    );
+    CREATE INDEX IF NOT EXISTS archive.idx_violations_timestamp ON violations (timestamp);
+'''
+
+# Adds the archived rows' share to the summary tables after STATS_BACKFILL
+# has rebuilt them from the main tables (occupancy only counts open sessions,
+# which are never archived).
+ARCHIVE_STATS_BACKFILL = '''
+    INSERT INTO stats_hourly (hour_ts, entries)
+        SELECT entry_ts / 3600 * 3600, COUNT(*) FROM archive.entries WHERE entry_ts IS NOT NULL GROUP BY 1
+        ON CONFLICT (hour_ts) DO UPDATE SET entries = entries + excluded.entries;
+    INSERT INTO stats_hourly (hour_ts, exits, paid, revenue)
+        SELECT exit_ts / 3600 * 3600, COUNT(*),
+               SUM(payment_status = 1 AND due_payment IS NOT NULL),
+               SUM(CASE WHEN payment_status = 1 THEN COALESCE(due_payment, 0) ELSE 0 END)
+        FROM archive.entries WHERE exit_ts IS NOT NULL GROUP BY 1
+        ON CONFLICT (hour_ts) DO UPDATE SET
+            exits = exits + excluded.exits, paid = paid + excluded.paid, revenue = revenue + excluded.revenue;
+    INSERT INTO stats_hourly (hour_ts, violations)
+        SELECT CAST(strftime('%s', timestamp, 'utc') AS INTEGER) / 3600 * 3600, COUNT(*)
+        FROM archive.violations WHERE strftime('%s', timestamp, 'utc') IS NOT NULL GROUP BY 1
+        ON CONFLICT (hour_ts) DO UPDATE SET violations = violations + excluded.violations;
+    INSERT INTO stats_gate_violations (gate_location, violations, last_timestamp)
+        SELECT COALESCE(gate_location, ''), COUNT(*), MAX(timestamp) FROM archive.violations GROUP BY 1
+        ON CONFLICT (gate_location) DO UPDATE SET
+            violations = violations + excluded.violations,
+            last_timestamp = MAX(last_timestamp, excluded.last_timestamp);
+'''
+
+# SQL is kept in module constants so sqlite3's per-connection statement
+# cache sees identical text and reuses the prepared statements.
+SQL_HAS_UNPAID = 'SELECT 1 FROM entries WHERE car_plate = ? AND payment_status = 0 LIMIT 1'
+SQL_NEXT_ENTRY_NO = 'SELECT COALESCE(MAX(no), 0) + 1 AS next_no FROM entries'
+# `no` is the rowid alias, so a NULL insert takes MAX(no) + 1 atomically
+SQL_INSERT_ENTRY = '''
+    INSERT INTO entries (no, entry_time, exit_time, car_plate, due_payment, payment_status, entry_ts, exit_ts)
+    VALUES (NULL, ?, '', ?, NULL, 0, ?, NULL)
+'''
+# Entry that only goes in while the lot has room, decided inside the write
+# transaction so two gates cannot both take the last space
+SQL_ADMIT_ENTRY = '''
+    INSERT INTO entries (no, entry_time, exit_time, car_plate, due_payment, payment_status, entry_ts, exit_ts)
+    SELECT NULL, ?, '', ?, NULL, 0, ?, NULL
+    WHERE (SELECT capacity IS NULL OR inside < capacity FROM stats_occupancy WHERE id = 1) IS NOT 0
+'''
+SQL_INSERT_VIOLATION = '''
+    INSERT INTO violations (timestamp, car_plate, gate_location, reason)
+    VALUES (?, ?, ?, ?)
+'''
+SQL_RECENT_PAID_EXIT = '''
+    SELECT no, exit_ts
+    FROM entries
+    WHERE car_plate = ? AND payment_status = 1 AND exit_ts >= ?
+    ORDER BY exit_ts DESC
+    LIMIT 1
+'''
+SQL_OPEN_SESSION = '''
+    SELECT no, entry_time, entry_ts
+    FROM entries
+    WHERE car_plate = ? AND payment_status = 0 AND exit_ts IS NULL
+    ORDER BY entry_ts DESC
+    LIMIT 1
+'''
+SQL_RECORD_EXIT = '''
+    UPDATE entries
+    SET exit_time = ?, exit_ts = ?, due_payment = ?, payment_status = 1
+    WHERE no = ?
+'''
+# Settling a session: only succeeds while it is still unpaid
+SQL_SETTLE_SESSION = '''
+    UPDATE entries
+    SET exit_time = ?, exit_ts = ?, due_payment = ?, payment_status = 1
+    WHERE no = ? AND payment_status = 0
+'''
+SQL_INSERT_PAYMENT = '''
+    INSERT INTO payments (entry_no, car_plate, amount, balance_before, balance_after, method, paid_ts, paid_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+# Dashboard listings, paged newest first on (key, id): each page continues
+# strictly below the previous page's last row, so a page costs one index
+# range scan however much history sits behind it. `filters` maps query
+# parameters to the columns they compare; each combination is covered by
+# one of the indexes above. `hints` pins the index for a filter where,
+# without ANALYZE statistics, the planner would walk the ordering index
+# and test every paid row against the plate.
+LISTINGS = {
+    'entries': {
+        'table': 'entries', 'where': 'exit_ts IS NULL', 'key': 'entry_ts', 'id': 'no',
+        'filters': {'plate': 'car_plate', 'status': 'payment_status'},
+    },
+    'exits': {
+        'table': 'entries', 'where': 'payment_status = 1 AND exit_ts IS NOT NULL', 'key': 'exit_ts', 'id': 'no',
+        'filters': {'plate': 'car_plate'},
+        'hints': {'plate': 'idx_entries_plate_status_exit_ts'},
+    },
+    'payments': {
+        'table': 'entries', 'where': 'payment_status = 1 AND exit_ts IS NOT NULL AND due_payment IS NOT NULL',
+        'key': 'exit_ts', 'id': 'no',
+        'filters': {'plate': 'car_plate'},
+        'hints': {'plate': 'idx_entries_plate_status_exit_ts'},
+    },
+    'violations': {
+        'table': 'violations', 'where': '1', 'key': 'timestamp', 'id': 'id', 'text_key': True,
+        'filters': {'plate': 'car_plate', 'gate': 'gate_location'},
+    },
+}
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Full-table exports (see export.py), oldest first on (key, id) so a date
+# range is one index range scan. Columns are listed so the file layout does
+# not change when a migration adds one.
+EXPORTS = {
+    'entries': {
+        'table': 'entries', 'key': 'entry_ts', 'id': 'no',
+        'columns': ('no', 'car_plate', 'entry_time', 'exit_time', 'due_payment', 'payment_status',
+                    'entry_ts', 'exit_ts'),
+    },
+    'payments': {
+        'table': 'payments', 'key': 'paid_ts', 'id': 'id',
+        'columns': ('id', 'entry_no', 'car_plate', 'amount', 'balance_before', 'balance_after', 'method',
+                    'paid_at', 'paid_ts'),
+    },
+    'violations': {
+        'table': 'violations', 'key': 'timestamp', 'id': 'id', 'text_key': True,
+        'columns': ('id', 'timestamp', 'car_plate', 'gate_location', 'reason'),
+    },
+}
+EXPORT_BATCH = 1000  # rows fetched from the cursor (and written out) at a time
+
+# Archival (see archive.py): paid sessions (with their payments) and
+# violations older than the retention horizon, moved a batch at a time.
+# Ids are passed as a JSON array. A batch that was copied but not yet
+# deleted is copied again on the next run, so rows already archived
+# unchanged are skipped; a different row under the same key fails the
+# copy (IntegrityError) before anything is deleted, rather than
+# overwriting history. entries.no is not AUTOINCREMENT and new sessions
+# are numbered after the highest one left in main, so the newest session
+# is never archived and archived numbers are never handed out again.
+ARCHIVE_BATCH = 1000  # rows per transaction; about 0.1 s of write lock
+SQL_ARCHIVABLE_SESSIONS = '''
+    SELECT no FROM entries
+    WHERE payment_status = 1 AND exit_ts < ? AND no < (SELECT MAX(no) FROM entries)
+    ORDER BY exit_ts LIMIT ?
+'''
+SQL_ARCHIVABLE_VIOLATIONS = 'SELECT id FROM violations WHERE timestamp < ? ORDER BY timestamp LIMIT ?'
+SQL_ARCHIVE_COPY = {
+    table: f'''
+    INSERT INTO archive.{table} ({', '.join(EXPORTS[table]['columns'])})
+    SELECT {', '.join(f'main.{table}.{c}' for c in EXPORTS[table]['columns'])} FROM json_each(?) AS moved
+    CROSS JOIN main.{table} ON main.{table}.{column} = moved.value
+    WHERE NOT EXISTS (SELECT 1 FROM archive.{table} AS copied
+                      WHERE {' AND '.join(f'copied.{c} IS main.{table}.{c}' for c in EXPORTS[table]['columns'])})
+    '''
+    for table, column in (('entries', 'no'), ('payments', 'entry_no'), ('violations', 'id'))
+}
+SQL_ARCHIVE_DELETE = {
+    'entries': 'DELETE FROM main.entries WHERE no IN (SELECT value FROM json_each(?))',
+    'payments': 'DELETE FROM main.payments WHERE entry_no IN (SELECT value FROM json_each(?))',
+    'violations': 'DELETE FROM main.violations WHERE id IN (SELECT value FROM json_each(?))',
+}
+ANALYSIS_LIMIT = 1000  # rows ANALYZE samples per index
+
+# Session cache loading and change tracking (see session_cache.py)
+SQL_UNPAID_SESSIONS = 'SELECT no, entry_ts, exit_ts, car_plate, payment_status FROM entries WHERE payment_status = 0'
+SQL_RECENT_PAID_EXITS = '''
+    SELECT car_plate, MAX(exit_ts) AS exit_ts
+    FROM entries
+    WHERE payment_status = 1 AND exit_ts >= ?
+    GROUP BY car_plate
+'''
+SQL_ENTRY_BY_NO = 'SELECT no, entry_ts, exit_ts, car_plate, payment_status FROM entries WHERE no = ?'
+SQL_LAST_CHANGE = 'SELECT COALESCE(MAX(id), 0) AS last_id, COALESCE(MIN(id), 1) AS first_id FROM change_log'
+SQL_CHANGES_SINCE = 'SELECT id, tbl, row_id, op FROM change_log WHERE id > ? ORDER BY id'
+SQL_PRUNE_CHANGES = 'DELETE FROM change_log WHERE id <= (SELECT MAX(id) FROM change_log) - ?'
+SQL_CHANGE_BATCH = 'SELECT id, tbl, row_id, op FROM change_log WHERE id > ? ORDER BY id LIMIT ?'
+SQL_ROW_BY_ID = {
+    'entries': 'SELECT * FROM entries WHERE no = ?',
+    'payments': 'SELECT * FROM payments WHERE id = ?',
+    'violations': 'SELECT * FROM violations WHERE id = ?',
+}
+# Summary tables (migration 8)
+SQL_LOT_STATUS = 'SELECT inside, capacity FROM stats_occupancy WHERE id = 1'
+SQL_SET_CAPACITY = 'UPDATE stats_occupancy SET capacity = ? WHERE id = 1'
+SQL_HOURLY_STATS = 'SELECT * FROM stats_hourly WHERE hour_ts >= ? AND hour_ts < ? ORDER BY hour_ts'
+SQL_GATE_VIOLATION_STATS = '''
+    SELECT gate_location, violations, last_timestamp FROM stats_gate_violations
+    WHERE violations > 0 ORDER BY violations DESC
+'''
+SQL_TABLE_VERSION = 'SELECT COALESCE(MAX(id), 0) FROM change_log WHERE tbl = ?'
+SQL_TABLE_CHANGES = 'SELECT DISTINCT row_id FROM change_log WHERE tbl = ? AND id > ?'
+
+
+def now_text():
+    return datetime.now().strftime(TIME_FORMAT)
+
+
+def epoch_text(ts):
+    """Local-time TIME_FORMAT text for an epoch timestamp (the display columns)."""
+    return datetime.fromtimestamp(ts).strftime(TIME_FORMAT)
+
+
+def parse_time(value):
+    """Epoch seconds from an epoch number or local 'YYYY-MM-DD[ HH:MM[:SS]]' text."""
+    value = str(value).strip()
+    try:
+        return int(float(value))
+    except ValueError:
+        pass
+    for fmt in (TIME_FORMAT, '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognised time '{value}'")
+
+
+def listing_filter(name, since=None, until=None, **filters):
+    """(table clause, WHERE terms, params) selecting a LISTINGS entry's rows.
+
+    `since`/`until` bound the listing's key ([since, until)). Raises
+    ValueError for a filter the listing does not support.
+    """
+    spec = LISTINGS[name]
+    key = spec['key']
+    convert = epoch_text if spec.get('text_key') else int
+    table, where, params = spec['table'], [spec['where']], []
+    for param, value in sorted(filters.items()):
+        if value is None:
+            continue
+        if param not in spec['filters']:
+            raise ValueError(f"{name} cannot be filtered by '{param}'")
+        where.append(f"{spec['filters'][param]} = ?")
+        params.append(int(value) if param == 'status' else value)
+        if param in spec.get('hints', {}):
+            table = f"{table} INDEXED BY {spec['hints'][param]}"
+    if since is not None:
+        where.append(f"{key} >= ?")
+        params.append(convert(parse_time(since)))
+    if until is not None:
+        where.append(f"{key} < ?")
+        params.append(convert(parse_time(until)))
+    return table, where, params
+
+
+def listing_query(name, limit=None, before=None, **filters):
+    """SQL and parameters for one page of a LISTINGS entry.
+
+    `before` is the cursor of the previous page ('key,id'); other keyword
+    arguments go to listing_filter(). Raises ValueError for bad parameters.
+    The SQL only varies with which filters are present, so the statement
+    cache holds a handful of variants.
+    """
+    spec = LISTINGS[name]
+    limit = DEFAULT_PAGE_SIZE if limit is None else int(limit)
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    key, id_col = spec['key'], spec['id']
+    table, where, params = listing_filter(name, **filters)
+    if before:
+        cursor_key, _, cursor_id = str(before).rpartition(',')
+        if not cursor_key or not cursor_id.isdigit():
+            raise ValueError(f"bad cursor '{before}'")
+        where.append(f"({key}, {id_col}) < (?, ?)")
+        params.extend((cursor_key if spec.get('text_key') else int(cursor_key), int(cursor_id)))
+
+    sql = (f"SELECT * FROM {table} WHERE {' AND '.join(where)} "
+           f"ORDER BY {key} DESC, {id_col} DESC LIMIT ?")
+    return sql, params + [limit + 1], limit
+
+
+def delta_query(name, **filters):
+    """SQL selecting which of a JSON array of changed ids (the first parameter) are in a listing.
+
+    CROSS JOIN keeps the id list as the outer loop, so each changed row is
+    one primary-key probe rather than a walk of the listing's index.
+    """
+    spec = LISTINGS[name]
+    _, where, params = listing_filter(name, **filters)
+    sql = (f"SELECT {spec['table']}.* FROM json_each(?) AS changed "
+           f"CROSS JOIN {spec['table']} ON {spec['table']}.{spec['id']} = changed.value "
+           f"WHERE {' AND '.join(where)}")
+    return sql, params
+
+
+def archive_path(db_file=DB_FILE):
+    """The archive database kept next to `db_file` (parking.db -> parking_archive.db)."""
+    return f"{os.path.splitext(db_file)[0]}_archive.db"
+
+
+def export_query(name, since=None, until=None, archive=False):
+    """SQL and parameters for an EXPORTS entry's rows with key in [since, until).
+
+    With `archive`, the attached archive's rows are merged in; both sides
+    are read in index order, so the result needs no sort.
+    """
+    spec = EXPORTS[name]
+    key = spec['key']
+    convert = epoch_text if spec.get('text_key') else int
+    where, params = ['1'], []
+    if since is not None:
+        where.append(f"{key} >= ?")
+        params.append(convert(parse_time(since)))
+    if until is not None:
+        where.append(f"{key} < ?")
+        params.append(convert(parse_time(until)))
+    select = f"SELECT {', '.join(spec['columns'])} FROM {{}}.{spec['table']} WHERE {' AND '.join(where)}"
+    if archive:
+        sql = f"{select.format('archive')} UNION ALL {select.format('main')} ORDER BY {key}, {spec['id']}"
+        return sql, params * 2
+    return f"{select.format('main')} ORDER BY {key}, {spec['id']}", params
+
+
+def split_statements(script):
+    """Split a migration script into complete statements (trigger bodies included)."""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ''
+
+
+def migrate(conn, target=None):
+    """Apply pending MIGRATIONS (up to `target`); returns the resulting version.
+
+    Each migration runs in its own BEGIN IMMEDIATE transaction and re-reads
+    user_version once it holds the lock, so processes starting together
+    apply every migration exactly once.
+    """
+    target = len(MIGRATIONS) if target is None else target
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    while version < target:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version < target:
+                version += 1
+                logger.info(f"Applying schema migration {version}")
+                for statement in split_statements(MIGRATIONS[version - 1]):
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return version
+
+
+def connect(db_file=DB_FILE, migrate_schema=True, check_same_thread=True):
+    """Open parking.db in WAL mode with a busy timeout and an up-to-date schema."""
+    conn = sqlite3.connect(
+        db_file,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=check_same_thread
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    # Takes effect for a new file only; archive.py --full-vacuum converts an existing one
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    if migrate_schema:
+        migrate(conn)
+    return conn
+
+
+def settle_payment(conn, no, plate, amount, balance_before, balance_after, method, paid_ts):
+    """Mark session `no` paid and add its ledger row; None if it was already settled."""
+    paid_at = epoch_text(paid_ts)
+    if not conn.execute(SQL_SETTLE_SESSION, (paid_at, paid_ts, amount, no)).rowcount:
+        return None
+    return conn.execute(SQL_INSERT_PAYMENT, (
+        no, plate, amount, balance_before, balance_after, method, paid_ts, paid_at
+    )).lastrowid
+
+
+def admit_entry(conn, plate, entry_ts):
+    """Insert an open session if the lot has room; its number, or None when full."""
+    cursor = conn.execute(SQL_ADMIT_ENTRY, (epoch_text(entry_ts), plate, entry_ts))
+    return cursor.lastrowid if cursor.rowcount else None
+
+
+class ParkingDB:
+    """Data access shared by the entry/exit gates, payments and the dashboard.
+
+    Reads use this object's connection. Writes commit on it directly, or,
+    when a DbWriter is given, are queued for its group commits. In that case
+    `sync` picks between waiting for a durable commit and returning at once
+    (a Future stands in for the row id).
+    """
+
+    def __init__(self, db_file=DB_FILE, check_same_thread=True, writer=None):
+        self.conn = connect(db_file, check_same_thread=check_same_thread)
+        self.writer = writer
+        self.archive_file = archive_path(db_file)
+        self.archive_attached = False
+
+    def _write(self, sql, params, sync):
+        if self.writer is not None:
+            return self.writer.execute(sql, params, sync=sync)
+        with self.conn:
+            return self.conn.execute(sql, params).lastrowid
+
+    # --- gate decisions ---
+
+    def has_unpaid_record(self, plate):
+        return self.conn.execute(SQL_HAS_UNPAID, (plate,)).fetchone() is not None
+
+    def next_entry_no(self):
+        return self.conn.execute(SQL_NEXT_ENTRY_NO).fetchone()['next_no']
+
+    def add_entry(self, plate, entry_ts=None, sync=True):
+        """Insert an open, unpaid session and return its entry number."""
+        entry_ts = int(entry_ts or time.time())
+        return self._write(SQL_INSERT_ENTRY, (epoch_text(entry_ts), plate, entry_ts), sync)
+
+    def admit_entry(self, plate, entry_ts=None, sync=True):
+        """add_entry() that respects the lot capacity; None when the lot is full."""
+        entry_ts = int(entry_ts or time.time())
+        if self.writer is not None:
+            return self.writer.execute(admit_entry, (plate, entry_ts), sync=sync)
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            return admit_entry(self.conn, plate, entry_ts)
+
+    def log_violation(self, plate, gate_location, reason, timestamp=None, sync=False):
+        return self._write(SQL_INSERT_VIOLATION, (timestamp or now_text(), plate, gate_location, reason), sync)
+
+    def recent_paid_exit(self, plate, since_ts):
+        """Latest paid exit of a plate at or after `since_ts`, or None (one index range probe)."""
+        return self.conn.execute(SQL_RECENT_PAID_EXIT, (plate, int(since_ts))).fetchone()
+
+    def open_session(self, plate):
+        """Most recent unpaid session still inside, or None."""
+        return self.conn.execute(SQL_OPEN_SESSION, (plate,)).fetchone()
+
+    def record_exit(self, no, due_payment, exit_ts=None, sync=False):
+        exit_ts = int(exit_ts or time.time())
+        return self._write(SQL_RECORD_EXIT, (epoch_text(exit_ts), exit_ts, due_payment, no), sync)
+
+    # --- payments ---
+
+    def record_payment(self, no, plate, amount, balance_before=None, balance_after=None,
+                       method='rfid', paid_ts=None, sync=True):
+        """Settle an unpaid session and append it to the ledger in one transaction.
+
+        Returns the ledger id, or None when the session was no longer unpaid
+        (e.g. settled concurrently by another kiosk). Through a writer with
+        sync=False, a Future of that result.
+        """
+        paid_ts = int(paid_ts or time.time())
+        params = (no, plate, amount, balance_before, balance_after, method, paid_ts)
+        if self.writer is not None:
+            return self.writer.execute(settle_payment, params, sync=sync)
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            return settle_payment(self.conn, *params)
+
+    # --- session cache support ---
+
+    def unpaid_sessions(self):
+        return self.conn.execute(SQL_UNPAID_SESSIONS).fetchall()
+
+    def recent_paid_exits(self, since_ts):
+        """Latest paid exit per plate at or after `since_ts`."""
+        return self.conn.execute(SQL_RECENT_PAID_EXITS, (int(since_ts),)).fetchall()
+
+    def entry(self, no):
+        return self.conn.execute(SQL_ENTRY_BY_NO, (no,)).fetchone()
+
+    def data_version(self):
+        """Changes whenever another connection commits to the database file."""
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def change_range(self):
+        """(first, last) change_log ids currently retained."""
+        row = self.conn.execute(SQL_LAST_CHANGE).fetchone()
+        return row['first_id'], row['last_id']
+
+    def changes_since(self, last_id):
+        return self.conn.execute(SQL_CHANGES_SINCE, (last_id,)).fetchall()
+
+    def prune_changes(self, keep):
+        """Drop all but the newest `keep` change_log rows."""
+        self._write(SQL_PRUNE_CHANGES, (keep,), sync=False)
+
+    # --- dashboard listings ---
+
+    def page(self, name, **params):
+        """One page of a listing: (rows, cursor for the next page or None)."""
+        sql, args, limit = listing_query(name, **params)
+        rows = [dict(row) for row in self.conn.execute(sql, args)]
+        if len(rows) <= limit:
+            return rows, None
+        spec = LISTINGS[name]
+        last = rows[limit - 1]
+        return rows[:limit], f"{last[spec['key']]},{last[spec['id']]}"
+
+    def export(self, name, since=None, until=None, batch=EXPORT_BATCH):
+        """Yield an export's rows (tuples in EXPORTS[name]['columns'] order) in lists of `batch`.
+
+        The rows come from one cursor, so the export is a consistent snapshot
+        and memory stays at one batch however many rows there are. Closing
+        the generator early (a dropped download) finalizes the statement, so
+        the connection does not keep holding the snapshot.
+        """
+        sql, params = export_query(name, since, until, archive=self.attach_archive())
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def change_events(self, after_id, limit=MAX_PAGE_SIZE):
+        """change_log rows after `after_id`, each with the changed row as it is now.
+
+        Returns dicts {'id', 'table', 'op', 'row_id', 'row'}; 'row' is None
+        once the row is gone.
+        """
+        events = []
+        for change in self.conn.execute(SQL_CHANGE_BATCH, (after_id, limit)).fetchall():
+            row = None
+            if change['op'] != 'delete' and change['tbl'] in SQL_ROW_BY_ID:
+                row = self.conn.execute(SQL_ROW_BY_ID[change['tbl']], (change['row_id'],)).fetchone()
+            events.append({'id': change['id'], 'table': change['tbl'], 'op': change['op'],
+                           'row_id': change['row_id'], 'row': dict(row) if row else None})
+        return events
+
+    def table_version(self, table):
+        """Id of the table's latest change_log row; bumps on every write to it."""
+        return self.conn.execute(SQL_TABLE_VERSION, (table,)).fetchone()[0]
+
+    def listing_version(self, name):
+        return self.table_version(LISTINGS[name]['table'])
+
+    def delta(self, name, version, **filters):
+        """Rows of a listing changed since `version`, for a client holding that version.
+
+        Returns {'version', 'upserts', 'removed'}: changed rows that are (now)
+        in the listing, and ids of changed rows that are not (e.g. an entry
+        that has exited). None when the change log no longer reaches back to
+        `version`, or more rows changed than a page holds, and the client
+        should reload the listing instead.
+        """
+        spec = LISTINGS[name]
+        current = self.table_version(spec['table'])
+        first, _ = self.change_range()
+        if not first - 1 <= version <= current:
+            return None
+        changed = [row[0] for row in self.conn.execute(SQL_TABLE_CHANGES, (spec['table'], version))]
+        if len(changed) > MAX_PAGE_SIZE:
+            return None
+        upserts = []
+        if changed:
+            sql, params = delta_query(name, **filters)
+            upserts = [dict(row) for row in self.conn.execute(sql, [json.dumps(changed)] + params)]
+        kept = {row[spec['id']] for row in upserts}
+        return {'version': current, 'upserts': upserts, 'removed': [i for i in changed if i not in kept]}
+
+    # --- summary statistics ---
+
+    def lot_status(self):
+        """Cars inside now and the lot's capacity and headroom (None without a limit)."""
+        row = self.conn.execute(SQL_LOT_STATUS).fetchone()
+        inside, capacity = (row['inside'], row['capacity']) if row else (0, None)
+        return {'inside': inside, 'capacity': capacity,
+                'headroom': None if capacity is None else max(capacity - inside, 0)}
+
+    def set_capacity(self, capacity):
+        """Set the number of spaces (None for no limit)."""
+        self._write(SQL_SET_CAPACITY, (capacity,), sync=True)
+
+    def hourly_stats(self, since_ts, until_ts):
+        """stats_hourly buckets starting in [since_ts, until_ts), oldest first."""
+        return [dict(row) for row in self.conn.execute(SQL_HOURLY_STATS, (int(since_ts), int(until_ts)))]
+
+    def gate_violation_stats(self):
+        return [dict(row) for row in self.conn.execute(SQL_GATE_VIOLATION_STATS)]
+
+    def rebuild_stats(self):
+        """Recompute the summary tables from history (archive included) in one transaction."""
+        script = STATS_BACKFILL + (ARCHIVE_STATS_BACKFILL if self.attach_archive() else '')
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            for statement in split_statements(script):
+                self.conn.execute(statement)
+
+    # --- archival ---
+
+    def attach_archive(self, create=False):
+        """Attach the archive database as `archive`; False if there is none yet."""
+        if self.archive_attached:
+            return True
+        if not create and not os.path.exists(self.archive_file):
+            return False
+        self.conn.execute('ATTACH DATABASE ? AS archive', (self.archive_file,))
+        self.conn.execute('PRAGMA archive.journal_mode = WAL')
+        # The copy must be on disk before the rows leave the main database
+        self.conn.execute('PRAGMA archive.synchronous = FULL')
+        with self.conn:
+            for statement in split_statements(ARCHIVE_SCHEMA):
+                self.conn.execute(statement)
+        self.archive_attached = True
+        return True
+
+    def _archive(self, tables, ids):
+        # Copy first, in a transaction that only writes the archive...
+        with self.conn:
+            for table in tables:
+                self.conn.execute(SQL_ARCHIVE_COPY[table], (ids,))
+        # ...then delete from main in one that the stats triggers ignore
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.execute('INSERT INTO archiving (id) VALUES (1)')
+            for table in tables:
+                self.conn.execute(SQL_ARCHIVE_DELETE[table], (ids,))
+            self.conn.execute('DELETE FROM archiving')
+
+    def archive_sessions(self, before_ts, batch=ARCHIVE_BATCH):
+        """Move up to `batch` paid sessions that exited before `before_ts`, with their payments.
+
+        Returns how many moved. Their share of the summary tables stays, so
+        the stats endpoints keep covering them.
+        """
+        self.attach_archive(create=True)
+        nos = [row[0] for row in self.conn.execute(SQL_ARCHIVABLE_SESSIONS, (int(before_ts), batch))]
+        if nos:
+            self._archive(('entries', 'payments'), json.dumps(nos))
+        return len(nos)
+
+    def archive_violations(self, before_ts, batch=ARCHIVE_BATCH):
+        """Move up to `batch` violations logged before `before_ts`; returns how many moved."""
+        self.attach_archive(create=True)
+        ids = [row[0] for row in self.conn.execute(SQL_ARCHIVABLE_VIOLATIONS, (epoch_text(before_ts), batch))]
+        if ids:
+            self._archive(('violations',), json.dumps(ids))
+        return len(ids)
+
+    def compact(self, full=False):
+        """Give free pages back to the filesystem and refresh the planner's statistics.
+
+        Uses incremental vacuum, which needs auto_vacuum=INCREMENTAL; `full`
+        switches an older file over with a one-off VACUUM (which blocks
+        writers while it rewrites the file). Returns the pages released, or
+        None if the file cannot shrink without `full`.
+        """
+        pages = self.conn.execute('PRAGMA page_count').fetchone()[0]
+        if full:
+            self.conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            self.conn.execute('VACUUM')
+        elif self.conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            self.conn.execute('PRAGMA incremental_vacuum').fetchall()
+        else:
+            pages = None
+        self.conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+        self.conn.execute('ANALYZE')
+        self.conn.commit()
+        if pages is None:
+            return None
+        return pages - self.conn.execute('PRAGMA page_count').fetchone()[0]
+
+    def active_entries(self, **params):
+        return self.page('entries', **params)
+
+    def exits(self, **params):
+        return self.page('exits', **params)
+
+    def payments(self, **params):
+        return self.page('payments', **params)
+
+    def violations(self, **params):
+        return self.page('violations', **params)
+
+    def close(self):
+        self.conn.close()
@@ -4,21 +4,97 @@
 #define RST_PIN 9
 #define SS_PIN 10
 
+// Framed host protocol (see hardware/protocol.py):
+//   SOF | version | type | seq | length | payload | CRC16 (CCITT-FALSE, big-endian)
+#define SOF 0xA5
+#define PROTOCOL_VERSION 1
+#define MAX_PAYLOAD 64
+
+#define MSG_WRITE_BALANCE 0x10
+#define MSG_DENY 0x11
+#define MSG_PING 0x7F
+#define MSG_ACK 0x80
+#define MSG_NACK 0x81
+#define MSG_CARD 0x91
+#define MSG_READY 0x92
+#define MSG_WRITE_DONE 0x93
+#define MSG_WRITE_FAILED 0x94
+#define MSG_LOG 0xA0
+
+#define NACK_BAD_CRC 1
+#define NACK_UNKNOWN_TYPE 2
+#define NACK_BAD_STATE 3
+
+#define WRITE_CARD_FAILED 1
+#define WRITE_BAD_BALANCE 2
+
 MFRC522 mfrc522(SS_PIN, RST_PIN);
 MFRC522::MIFARE_Key key;
 MFRC522::StatusCode card_status;
 
 bool awaitingUpdate = false;
-bool sentReady = false;
 String currentPlate = "";
 long currentBalance = 0;
 
+// Last command handled, so a retransmission is acked without repeating it
+int lastSeq = -1;
+byte lastType = 0;
+
 // Timeout variables
 unsigned long readySentTime = 0;
 const unsigned long RESPONSE_TIMEOUT = 10000; // 10 seconds
 
+// Frame decoder state
+byte rxFrame[5 + MAX_PAYLOAD + 2];
+byte rxLength = 0;
+
+uint16_t crc16(const byte *data, byte length) {
+    uint16_t crc = 0xFFFF;
+    for (byte i = 0; i < length; i++) {
+        crc ^= (uint16_t)data[i] << 8;
+        for (byte b = 0; b < 8; b++) {
+            crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+        }
+    }
+    return crc;
+}
+
+void sendFrame(byte type, byte seq, const byte *payload, byte length) {
+    byte frame[5 + MAX_PAYLOAD + 2];
+    frame[0] = SOF;
+    frame[1] = PROTOCOL_VERSION;
+    frame[2] = type;
+    frame[3] = seq;
+    frame[4] = length;
+    memcpy(frame + 5, payload, length);
+    uint16_t crc = crc16(frame + 1, 4 + length);
+    frame[5 + length] = crc >> 8;
+    frame[6 + length] = crc & 0xFF;
+    Serial.write(frame, 7 + length);
+}
+
+void sendLog(const String &text) {
+    byte length = min(text.length(), (unsigned int)MAX_PAYLOAD);
+    sendFrame(MSG_LOG, 0, (const byte *)text.c_str(), length);
+}
+
+void sendStatus(byte type, byte seq, byte status) {
+    sendFrame(type, seq, &status, 1);
+}
+
+void putInt32(byte *out, long value) {
+    out[0] = (value >> 24) & 0xFF;
+    out[1] = (value >> 16) & 0xFF;
+    out[2] = (value >> 8) & 0xFF;
+    out[3] = value & 0xFF;
+}
+
+long getInt32(const byte *in) {
+    return ((long)in[0] << 24) | ((long)in[1] << 16) | ((long)in[2] << 8) | (long)in[3];
+}
+
 void setup() {
-    Serial.begin(9600);
+    Serial.begin(115200);
     SPI.begin();
     mfrc522.PCD_Init();
 
@@ -26,11 +102,18 @@ void setup() {
         key.keyByte[i] = 0xFF;
     }
 
-    Serial.println(F("==== PAYMENT MODE RFID ===="));
-    Serial.println(F("Place your card near the reader..."));
+    sendLog(F("PAYMENT MODE RFID ready"));
+}
+
+void releaseCard() {
+    awaitingUpdate = false;
+    mfrc522.PICC_HaltA();
+    mfrc522.PCD_StopCrypto1();
 }
 
 void loop() {
+    pollSerial();
+
     if (!awaitingUpdate) {
         if (!mfrc522.PICC_IsNewCardPresent() || !mfrc522.PICC_ReadCardSerial()) return;
 
@@ -39,7 +122,7 @@ void loop() {
 
         // Validate data before proceeding
         if (currentPlate.startsWith("[") || balanceStr.startsWith("[")) {
-            Serial.println(F("⚠️ Invalid card data. Try again."));
+            sendLog(F("Invalid card data. Try again."));
             mfrc522.PICC_HaltA();
             mfrc522.PCD_StopCrypto1();
             delay(2000);
@@ -47,71 +130,104 @@ void loop() {
         }
 
         currentBalance = balanceStr.toInt();
-        Serial.print(currentPlate);
-        Serial.print(",");
-        Serial.println(balanceStr);
 
-        awaitingUpdate = true;
-        sentReady = false;
-    }
+        byte payload[4 + 16];
+        putInt32(payload, currentBalance);
+        byte plateLength = min(currentPlate.length(), (unsigned int)16);
+        memcpy(payload + 4, currentPlate.c_str(), plateLength);
+        sendFrame(MSG_CARD, 0, payload, 4 + plateLength);
+        sendFrame(MSG_READY, 0, NULL, 0);
 
-    if (awaitingUpdate && !sentReady) {
-        Serial.println("READY");
-        sentReady = true;
+        awaitingUpdate = true;
         readySentTime = millis();  // Start the timeout
     }
 
-    if (awaitingUpdate && sentReady) {
-        // Timeout handling
-        if (millis() - readySentTime > RESPONSE_TIMEOUT) {
-            Serial.println("[TIMEOUT] No response from PC. Resetting.");
-            awaitingUpdate = false;
-            sentReady = false;
-            mfrc522.PICC_HaltA();
-            mfrc522.PCD_StopCrypto1();
-            delay(1000);
-            return;
-        }
-
-        if (Serial.available()) {
-            String response = Serial.readStringUntil('\n');
-            response.trim();
+    // Timeout handling
+    if (awaitingUpdate && millis() - readySentTime > RESPONSE_TIMEOUT) {
+        sendLog(F("Timeout: no response from PC. Resetting."));
+        releaseCard();
+        delay(1000);
+    }
+}
 
-            Serial.print("[RECEIVED FROM PC]: ");
-            Serial.println(response);
+// Feed received bytes through the frame decoder
+void pollSerial() {
+    while (Serial.available()) {
+        byte b = Serial.read();
+        if (rxLength == 0 && b != SOF) continue;  // hunt for start of frame
+        rxFrame[rxLength++] = b;
 
-            if (response == "I") {
-                Serial.println("[DENIED] Insufficient balance");
+        if (rxLength == 5 && (rxFrame[1] != PROTOCOL_VERSION || rxFrame[4] > MAX_PAYLOAD)) {
+            rxLength = 0;
+            continue;
+        }
+        if (rxLength >= 5 && rxLength == 7 + rxFrame[4]) {
+            byte length = rxFrame[4];
+            uint16_t crc = ((uint16_t)rxFrame[5 + length] << 8) | rxFrame[6 + length];
+            if (crc != crc16(rxFrame + 1, 4 + length)) {
+                sendStatus(MSG_NACK, rxFrame[3], NACK_BAD_CRC);
             } else {
-                Serial.print("[DEBUG] Cleaned response: '");
-                Serial.print(response);
-                Serial.println("'");
-
-                response.trim();  // Right before toInt()
-                long newBalance = response.toInt();
-                Serial.print(newBalance);
+                handleFrame(rxFrame[2], rxFrame[3], rxFrame + 5, length);
+            }
+            rxLength = 0;
+        }
+    }
+}
 
+void handleFrame(byte type, byte seq, const byte *payload, byte length) {
+    // Retransmission of the command we already handled: ack again, do nothing
+    if (seq == lastSeq && type == lastType) {
+        sendStatus(MSG_ACK, seq, 0);
+        return;
+    }
 
+    switch (type) {
+        case MSG_PING:
+            sendStatus(MSG_ACK, seq, 0);
+            break;
 
-                if (newBalance >= 0) {
-                    Serial.println("[WRITING] New balance to card...");
-                    writeBlockData(4, String(newBalance));
-                    Serial.println("DONE");
-                    Serial.print("[UPDATED] New Balance: ");
-                    Serial.println(newBalance);
-                } else {
-                    Serial.println("[ERROR] Invalid new balance received.");
-                }
+        case MSG_DENY:
+            if (!awaitingUpdate) {
+                sendStatus(MSG_NACK, seq, NACK_BAD_STATE);
+                return;
             }
+            sendStatus(MSG_ACK, seq, 0);
+            sendLog(F("Denied: insufficient balance"));
+            releaseCard();
+            delay(2000);
+            break;
 
-            awaitingUpdate = false;
-            sentReady = false;
+        case MSG_WRITE_BALANCE: {
+            if (!awaitingUpdate || length != 4) {
+                sendStatus(MSG_NACK, seq, NACK_BAD_STATE);
+                return;
+            }
+            long newBalance = getInt32(payload);
+            sendStatus(MSG_ACK, seq, 0);
 
-            mfrc522.PICC_HaltA();
-            mfrc522.PCD_StopCrypto1();
+            // The host records the payment only on MSG_WRITE_DONE
+            if (newBalance < 0) {
+                sendLog(F("Invalid new balance received."));
+                sendStatus(MSG_WRITE_FAILED, 0, WRITE_BAD_BALANCE);
+            } else if (writeBlockData(4, String(newBalance))) {
+                byte done[4];
+                putInt32(done, newBalance);
+                sendFrame(MSG_WRITE_DONE, 0, done, 4);
+            } else {
+                sendStatus(MSG_WRITE_FAILED, 0, WRITE_CARD_FAILED);
+            }
+            releaseCard();
             delay(2000);
+            break;
         }
+
+        default:
+            sendStatus(MSG_NACK, seq, NACK_UNKNOWN_TYPE);
+            return;
     }
+
+    lastSeq = seq;
+    lastType = type;
 }
 
 String readBlockData(byte blockNumber, String label){
@@ -120,15 +236,13 @@ String readBlockData(byte blockNumber, String label){
 
     card_status = mfrc522.PCD_Authenticate(MFRC522::PICC_CMD_MF_AUTH_KEY_A, blockNumber, &key, &(mfrc522.uid));
     if (card_status != MFRC522::STATUS_OK) {
-        Serial.print("❌ Auth failed for ");
-        Serial.println(label);
+        sendLog("Auth failed for " + label);
         return "[Auth Fail]";
     }
 
     card_status = mfrc522.MIFARE_Read(blockNumber, buffer, &bufferSize);
     if (card_status != MFRC522::STATUS_OK) {
-        Serial.print("❌ Read failed for ");
-        Serial.println(label);
+        sendLog("Read failed for " + label);
         return "[Read Fail]";
     }
 
@@ -140,7 +254,7 @@ String readBlockData(byte blockNumber, String label){
     return data;
 }
 
-void writeBlockData(byte blockNumber, String data) {
+bool writeBlockData(byte blockNumber, String data) {
     byte buffer[16];
     data.trim();
     while (data.length() < 16) data += ' ';
@@ -148,12 +262,14 @@ void writeBlockData(byte blockNumber, String data) {
 
     card_status = mfrc522.PCD_Authenticate(MFRC522::PICC_CMD_MF_AUTH_KEY_A, blockNumber, &key, &(mfrc522.uid));
     if (card_status != MFRC522::STATUS_OK) {
-        Serial.println("❌ Auth failed on write");
-        return;
+        sendLog(F("Auth failed on write"));
+        return false;
     }
 
     card_status = mfrc522.MIFARE_Write(blockNumber, buffer, 16);
     if (card_status != MFRC522::STATUS_OK) {
-        Serial.println("❌ Write failed");
+        sendLog(F("Write failed"));
+        return false;
     }
+    return true;
 }
@@ -0,0 +1,361 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+import serial
+
+import protocol
+from db_writer import DbWriter
+from device_manager import RUN_DIR
+from parking_db import DB_FILE, ParkingDB
+from process_payment import amount_due, card_balance
+from serial_transport import SerialTransport
+
+logger = logging.getLogger('Payments')
+
+BAUD_RATE = 9600     # legacy text protocol; framed kiosks run at protocol.BAUD_RATE
+READY_TIMEOUT = 5    # seconds for the kiosk to report READY after a card read
+DONE_TIMEOUT = 10    # seconds for the card write to be confirmed
+
+# Kiosk protocol states
+IDLE = 'idle'                # waiting for "plate,balance" from a card tap
+AWAIT_READY = 'await_ready'  # amount computed, waiting for the kiosk's READY
+AWAIT_DONE = 'await_done'    # new balance sent, waiting for DONE
+SETTLING = 'settling'        # card written, ledger transaction queued
+
+
+def parse_card_line(line):
+    """'RAB123C,1500' -> ('RAB123C', 1500); (None, None) for anything else."""
+    parts = line.strip().split(',')
+    if len(parts) != 2:
+        return None, None
+    balance = ''.join(c for c in parts[1] if c.isdigit())
+    if not parts[0].strip() or not balance:
+        return None, None
+    return parts[0].strip(), int(balance)
+
+
+class KioskSession:
+    """Protocol state machine for one payment Arduino.
+
+    Lines from the kiosk (delivered on its transport's reader thread) are
+    handed to the event loop through an asyncio.Queue; the session walks
+    card read -> READY -> new balance -> DONE for each tap and queues the
+    settlement on the shared DB writer, so no kiosk ever waits on another.
+    """
+
+    def __init__(self, name, transport, service):
+        self.name = name
+        self.transport = transport
+        self.service = service
+        self.state = IDLE
+        self.lines = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        transport.subscribe(lambda line: loop.call_soon_threadsafe(self.lines.put_nowait, line))
+
+    async def _expect(self, text, timeout, fail=None):
+        """Next line containing `text` (or `fail`) within `timeout` seconds, or None."""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                line = await asyncio.wait_for(self.lines.get(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            if text in line or (fail and fail in line):
+                return line
+            logger.debug(f"{self.name}: ignored '{line}' while {self.state}")
+
+    async def run(self):
+        while True:
+            self.state = IDLE
+            line = await self.lines.get()
+            plate, balance = parse_card_line(line)
+            if plate is None:
+                continue
+            started = time.perf_counter()
+            try:
+                outcome = await self.handle_card(plate, balance)
+            except Exception:
+                # A failed tap (serial write, DB error) must not stop this kiosk
+                # or, through gather(), the others; the card was not settled
+                logger.exception(f"{self.name}: tap for {plate} failed, waiting for the next card")
+                outcome = 'error'
+            self.service.record(outcome, (time.perf_counter() - started) * 1000)
+
+    async def handle_card(self, plate, balance):
+        db = self.service.db
+        session = db.open_session(plate)
+        if not session:
+            logger.info(f"{self.name}: {plate} not found or already paid")
+            return 'not_found'
+
+        due = amount_due(session['entry_ts'])
+        if balance < due:
+            logger.info(f"{self.name}: insufficient balance for {plate}")
+            self.transport.write(b'I\n')
+            return 'insufficient'
+
+        new_balance = card_balance(balance, due)
+        charged = balance - new_balance
+        self.state = AWAIT_READY
+        if await self._expect("READY", READY_TIMEOUT) is None:
+            logger.warning(f"{self.name}: timeout waiting for READY")
+            return 'timeout'
+
+        self.state = AWAIT_DONE
+        self.transport.write(f"{new_balance}\r\n".encode())
+        reply = await self._expect("DONE", DONE_TIMEOUT, fail="WRITE FAILED")
+        if reply is None:
+            logger.warning(f"{self.name}: timeout waiting for confirmation")
+            return 'timeout'
+        if "WRITE FAILED" in reply:
+            logger.warning(f"{self.name}: card write failed for {plate}, payment not recorded")
+            return 'write_failed'
+
+        self.state = SETTLING
+        future = db.record_payment(session['no'], plate, charged, balance, new_balance, sync=False)
+        payment_id = await asyncio.wrap_future(future)
+        if payment_id is None:
+            logger.info(f"{self.name}: session for {plate} was already settled")
+            return 'already_settled'
+        logger.info(f"{self.name}: payment #{payment_id} of {charged:.2f} for {plate}")
+        return 'paid'
+
+
+class PaymentService:
+    """Runs one KioskSession per payment Arduino over a shared DB writer."""
+
+    def __init__(self, db_file=DB_FILE):
+        self.writer = DbWriter(db_file)
+        self.db = ParkingDB(db_file, writer=self.writer)
+        self.kiosks = []
+        self.outcomes = {}
+        self.latencies = []
+
+    def add_kiosk(self, name, transport):
+        kiosk = KioskSession(name, transport, self)
+        self.kiosks.append(kiosk)
+        return kiosk
+
+    def record(self, outcome, latency_ms):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        self.latencies.append(latency_ms)
+
+    async def run(self):
+        await asyncio.gather(*(kiosk.run() for kiosk in self.kiosks))
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+
+        def pick(q):
+            return round(latencies[min(int(len(latencies) * q), len(latencies) - 1)], 1) if latencies else None
+
+        return {
+            'kiosks': len(self.kiosks),
+            'outcomes': self.outcomes,
+            'latency_p50_ms': pick(0.5),
+            'latency_p95_ms': pick(0.95),
+            'writer': self.writer.metrics(),
+        }
+
+    def close(self):
+        self.writer.close()
+        self.db.close()
+
+
+class SimulatedKiosk:
+    """In-process stand-in for a payment Arduino, for load tests.
+
+    Taps each card in turn: sends "plate,balance", reports READY after
+    `ready_delay`, and answers a new balance with DONE after `done_delay`
+    (an 'I' reply ends the tap). Same subscribe()/write() surface as
+    SerialTransport.
+    """
+
+    def __init__(self, name, cards, ready_delay=0.3, done_delay=0.2):
+        self.name = name
+        self.cards = cards
+        self.ready_delay = ready_delay
+        self.done_delay = done_delay
+        self._subscribers = []
+        self._tap_done = None
+        self._loop = None
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def _send(self, line):
+        for callback in self._subscribers:
+            callback(line)
+
+    def write(self, data):
+        reply = data.decode().strip()
+        if reply == 'I':
+            self._loop.call_soon(self._finish_tap)
+        else:
+            self._loop.call_later(self.done_delay, lambda: (self._send("DONE"), self._finish_tap()))
+
+    def _finish_tap(self):
+        if self._tap_done and not self._tap_done.done():
+            self._tap_done.set_result(None)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        for plate, balance in self.cards:
+            self._tap_done = self._loop.create_future()
+            self._send(f"{plate},{balance}")
+            self._loop.call_later(self.ready_delay, self._send, "READY")
+            try:
+                await asyncio.wait_for(self._tap_done, READY_TIMEOUT + DONE_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+
+    def close(self):
+        pass
+
+
+class FramedKiosk:
+    """Presents a kiosk on the framed protocol to KioskSession.
+
+    MSG_CARD / MSG_READY / MSG_WRITE_DONE / MSG_WRITE_FAILED frames become
+    the text protocol's lines, and the two host replies become MSG_DENY / MSG_WRITE_BALANCE
+    commands sent with ack-and-retry, so the session's state machine is
+    the same for both protocols.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.name = transport.name
+
+    def subscribe(self, callback):
+        def on_frame(frame):
+            if frame.type == protocol.MSG_CARD:
+                plate, balance = protocol.decode_card(frame.payload)
+                callback(f"{plate},{balance}")
+            elif frame.type == protocol.MSG_READY:
+                callback("READY")
+            elif frame.type == protocol.MSG_WRITE_DONE:
+                callback("DONE")
+            elif frame.type == protocol.MSG_WRITE_FAILED:
+                callback(f"WRITE FAILED {frame.payload.hex()}")
+        self.transport.subscribe(on_frame)
+
+    def write(self, data):
+        reply = data.decode().strip()
+        if reply == 'I':
+            command = self.transport.request_async(protocol.MSG_DENY)
+        else:
+            command = self.transport.request_async(protocol.MSG_WRITE_BALANCE,
+                                                   protocol.encode_balance(int(reply)))
+        asyncio.get_running_loop().create_task(command)
+
+    def close(self):
+        self.transport.close()
+
+
+def seed_sessions(db_file, kiosks, cards, seed=1):
+    """Open one unpaid session per simulated card; returns the cards per kiosk."""
+    rng = random.Random(seed)
+    db = ParkingDB(db_file)
+    now = time.time()
+    per_kiosk = []
+    for k in range(kiosks):
+        taps = []
+        for c in range(cards):
+            plate = f"RA{chr(65 + k % 26)}{c % 1000:03d}{chr(65 + k // 26 % 26)}"
+            db.add_entry(plate, now - rng.randint(5, 600) * 60)
+            # Most cards can pay, a few are short
+            taps.append((plate, 100000 if rng.random() > 0.05 else 10))
+        per_kiosk.append(taps)
+    db.close()
+    return per_kiosk
+
+
+async def run_simulation(db_file, kiosks, cards, ready_delay, done_delay):
+    service = PaymentService(db_file)
+    virtual = [SimulatedKiosk(f"sim{k}", taps, ready_delay, done_delay)
+               for k, taps in enumerate(seed_sessions(db_file, kiosks, cards))]
+    for kiosk in virtual:
+        service.add_kiosk(kiosk.name, kiosk)
+
+    started = time.perf_counter()
+    sessions = asyncio.ensure_future(service.run())
+    await asyncio.gather(*(kiosk.run() for kiosk in virtual))
+    # Let the last taps finish settling
+    while any(k.state != IDLE or not k.lines.empty() for k in service.kiosks):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    sessions.cancel()
+
+    service.writer.flush()
+    report = service.metrics()
+    report['elapsed_s'] = round(elapsed, 2)
+    report['taps_per_s'] = round(sum(service.outcomes.values()) / elapsed, 1)
+    service.close()
+    return report
+
+
+async def run_ports(db_file, ports, framed=False):
+    service = PaymentService(db_file)
+    transports = []
+    try:
+        for port in ports:
+            ser = serial.Serial(port, protocol.BAUD_RATE if framed else BAUD_RATE, timeout=1)
+            if not port.startswith(RUN_DIR):
+                await asyncio.sleep(2)  # Arduino resets on open; device manager ptys are already up
+            ser.reset_input_buffer()
+            if framed:
+                transport = protocol.FramedTransport(ser, name=port)
+                service.add_kiosk(port, FramedKiosk(transport))
+            else:
+                transport = SerialTransport(ser, name=port)
+                service.add_kiosk(port, transport)
+            transports.append(transport.start())
+            logger.info(f"Kiosk connected on {port}")
+        await service.run()
+    finally:
+        for transport in transports:
+            transport.close()
+        logger.info(f"Metrics: {service.metrics()}")
+        service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Payment service for several RFID kiosks')
+    parser.add_argument('--port', action='append', default=[], help='Kiosk serial port (repeatable)')
+    parser.add_argument('--db', default=DB_FILE, help='SQLite database')
+    parser.add_argument('--framed', action='store_true', help='Kiosks run the framed binary protocol')
+    parser.add_argument('--simulate', type=int, metavar='KIOSKS', help='Run N virtual kiosks on a scratch DB')
+    parser.add_argument('--cards', type=int, default=50, help='Card taps per virtual kiosk')
+    parser.add_argument('--ready-delay', type=float, default=0.3, help='Virtual kiosk READY delay (s)')
+    parser.add_argument('--done-delay', type=float, default=0.2, help='Virtual kiosk DONE delay (s)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if not args.simulate else logging.WARNING,
+                        format='[%(name)s] %(message)s')
+
+    if args.simulate:
+        with tempfile.TemporaryDirectory(prefix='parking-payments-') as tmp:
+            report = asyncio.run(run_simulation(os.path.join(tmp, 'parking.db'), args.simulate,
+                                                args.cards, args.ready_delay, args.done_delay))
+        print(json.dumps(report, indent=2))
+        return
+
+    if not args.port:
+        parser.error("give at least one --port, or --simulate N")
+    try:
+        asyncio.run(run_ports(args.db, args.port, args.framed))
+    except KeyboardInterrupt:
+        print("[EXIT] Payment service stopped")
+
+
+if __name__ == "__main__":
+    main()
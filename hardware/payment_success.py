@@ -1,36 +1,23 @@
-import csv
-import os
+from parking_db import ParkingDB
 
-csv_file = 'db.csv'
+DB_FILE = 'parking.db'
 
 def mark_payment_success(plate_number):
-    if not os.path.exists(csv_file):
-        print("[ERROR] Log file does not exist.")
-        return
+    db = ParkingDB(DB_FILE)
+    try:
+        # Match the plate's open, unpaid session (indexed lookup)
+        session = db.open_session(plate_number)
+        if not session:
+            print(f"[INFO] No unpaid record found for {plate_number}")
+            return
 
-    updated = False
-    rows = []
-
-    # Read existing data
-    with open(csv_file, 'r') as f:
-        reader = csv.reader(f)
-        header = next(reader)
-        for row in reader:
-            # Match the plate with unpaid status
-            if row[0] == plate_number and row[1] == '0':
-                row[1] = '1'  # Mark as paid
-                updated = True
-            rows.append(row)
-
-    if updated:
-        # Write back updated data
-        with open(csv_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(header)
-            writer.writerows(rows)
+        # Mark as paid and add a manual ledger row in one transaction
+        if db.record_payment(session['no'], plate_number, 0.0, method='manual') is None:
+            print(f"[INFO] No unpaid record found for {plate_number}")
+            return
         print(f"[UPDATED] Payment status set to 1 for {plate_number}")
-    else:
-        print(f"[INFO] No unpaid record found for {plate_number}")
+    finally:
+        db.close()
 
 # ==== TESTING USAGE ====
 if __name__ == "__main__":
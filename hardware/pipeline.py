@@ -0,0 +1,278 @@
+import logging
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from ocr_engine import OcrEnginePool
+from replay import ReplaySource
+from tracker import PlateTracker
+
+logger = logging.getLogger('Pipeline')
+
+STOP = None  # sentinel pushed through the queues on shutdown
+RESET = 'reset'  # sent on the decided queue when a new vehicle arrives
+
+
+class FrameRing:
+    """Fixed set of frame slots in one shared memory block.
+
+    Processes pass slot indexes through queues instead of pickled frames.
+    A slot is handed out from `free`, filled by capture, and returned once
+    the last reader has released it (tracked in `refs`).
+    """
+
+    def __init__(self, slots, slot_bytes, name=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+    @classmethod
+    def create(cls, slots, slot_bytes):
+        """Allocate the ring and the shared bookkeeping used by every stage."""
+        ring = cls(slots, slot_bytes)
+        ring.shapes = mp.Array('i', slots * 3)
+        ring.refs = mp.Array('i', slots)
+        ring.free = mp.Queue(slots)
+        for slot in range(slots):
+            ring.free.put(slot)
+        return ring
+
+    def handle(self):
+        """Picklable description used to attach from another process."""
+        return (self.shm.name, self.slots, self.slot_bytes, self.shapes, self.refs, self.free)
+
+    @classmethod
+    def attach(cls, handle):
+        name, slots, slot_bytes, shapes, refs, free = handle
+        ring = cls(slots, slot_bytes, name=name)
+        ring.shapes, ring.refs, ring.free = shapes, refs, free
+        return ring
+
+    def write(self, slot, frame):
+        """Copy a frame into a slot, shrinking it first if it does not fit."""
+        if frame.nbytes > self.slot_bytes:
+            scale = (self.slot_bytes / frame.nbytes) ** 0.5
+            frame = cv2.resize(frame, (int(frame.shape[1] * scale), int(frame.shape[0] * scale)))
+        height, width, channels = frame.shape
+        self.shapes[slot * 3:slot * 3 + 3] = [height, width, channels]
+        self.view(slot)[:] = frame
+
+    def view(self, slot):
+        """Zero-copy numpy view of the frame stored in a slot."""
+        height, width, channels = self.shapes[slot * 3:slot * 3 + 3]
+        return np.ndarray((height, width, channels), dtype=np.uint8,
+                          buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def retain(self, slot, count):
+        with self.refs.get_lock():
+            self.refs[slot] = count
+        if count == 0:
+            self.free.put(slot)
+
+    def release(self, slot):
+        """Drop one reference to a slot; the last reader returns it to the ring."""
+        with self.refs.get_lock():
+            self.refs[slot] -= 1
+            last = self.refs[slot] == 0
+        if last:
+            self.free.put(slot)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def open_source(config):
+    if config.get('replay_source'):
+        return ReplaySource(config['replay_source'])
+    cap = cv2.VideoCapture(config['camera_device'])
+    if config['camera_width'] and config['camera_height']:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, config['camera_width'])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config['camera_height'])
+    return cap
+
+
+def capture_worker(config, ring_handle, detect_queue, active, stop):
+    """Grab frames into free ring slots while a vehicle is in range."""
+    ring = FrameRing.attach(ring_handle)
+    cap = open_source(config)
+    frame_no = 0
+    try:
+        while not stop.is_set():
+            ok, frame = cap.read()
+            if not ok:
+                if config.get('replay_source'):
+                    break
+                time.sleep(0.1)
+                continue
+            if not active.value:
+                continue
+
+            # No free slot means downstream is behind: drop the frame
+            try:
+                slot = ring.free.get_nowait()
+            except queue.Empty:
+                continue
+
+            frame_no += 1
+            ring.write(slot, frame)
+            detect_queue.put((slot, frame_no))
+    finally:
+        detect_queue.put(STOP)
+        cap.release()
+        ring.close()
+
+
+def detect_worker(config, ring_handle, detect_queue, ocr_queue, decided_queue, workers):
+    """Run YOLO and tracking on each slot and fan undecided plates out to OCR."""
+    from ultralytics import YOLO
+
+    ring = FrameRing.attach(ring_handle)
+    model = YOLO(config['model_path'])
+    tracker = PlateTracker()
+    decided = set()
+    try:
+        while True:
+            item = detect_queue.get()
+            if item is STOP:
+                break
+            slot, frame_no = item
+
+            while True:
+                try:
+                    track_id = decided_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if track_id == RESET:
+                    tracker.reset()
+                    decided.clear()
+                else:
+                    decided.add(track_id)
+
+            results = model(ring.view(slot), verbose=False)[0]
+            boxes = [tuple(map(int, box.xyxy[0])) for box in results.boxes]
+            jobs = [
+                (slot, frame_no, track.id, box)
+                for track, box in zip(tracker.update(boxes), boxes)
+                if track.id not in decided and box[2] > box[0] and box[3] > box[1]
+            ]
+
+            ring.retain(slot, len(jobs))
+            for job in jobs:
+                ocr_queue.put(job)
+    finally:
+        for _ in range(workers):
+            ocr_queue.put(STOP)
+        ring.close()
+
+
+def ocr_worker(config, ring_handle, ocr_queue, result_queue, preprocess):
+    """Read plate crops straight out of the ring and OCR them."""
+    ring = FrameRing.attach(ring_handle)
+    ocr = OcrEnginePool(config['tesseract_config'], backend=config['ocr_backend'])
+    try:
+        while True:
+            item = ocr_queue.get()
+            if item is STOP:
+                break
+            slot, frame_no, track_id, (x1, y1, x2, y2) = item
+            try:
+                crop = ring.view(slot)[y1:y2, x1:x2].copy()
+            finally:
+                ring.release(slot)
+
+            processed = preprocess(crop)
+            chars = ocr.recognize_chars(processed) if processed is not None else []
+            result_queue.put((track_id, frame_no, (x1, y1, x2, y2), chars))
+    finally:
+        result_queue.put(STOP)
+        ocr.close()
+        ring.close()
+
+
+class StagedPipeline:
+    """Capture, detection and an OCR worker pool in separate processes.
+
+    Frames travel through a FrameRing in shared memory; the bounded queues
+    only carry slot indexes and boxes, so a slow stage applies backpressure
+    (capture drops frames) instead of growing memory.
+    """
+
+    def __init__(self, config, preprocess):
+        self.config = config
+        self.workers = max(1, config['ocr_processes'])
+        slot_bytes = config['camera_width'] * config['camera_height'] * 3
+        self.ring = FrameRing.create(config['ring_slots'], slot_bytes)
+
+        self.detect_queue = mp.Queue(config['ring_slots'])
+        self.ocr_queue = mp.Queue(config['ring_slots'] * 4)
+        self.result_queue = mp.Queue()
+        self.decided_queue = mp.Queue()
+        self.active = mp.Value('b', 0)
+        self.stop = mp.Event()
+        handle = self.ring.handle()
+
+        self.processes = [
+            mp.Process(target=capture_worker, name='capture',
+                       args=(config, handle, self.detect_queue, self.active, self.stop)),
+            mp.Process(target=detect_worker, name='detect',
+                       args=(config, handle, self.detect_queue, self.ocr_queue,
+                             self.decided_queue, self.workers)),
+        ]
+        self.processes += [
+            mp.Process(target=ocr_worker, name=f'ocr-{i}',
+                       args=(config, handle, self.ocr_queue, self.result_queue, preprocess))
+            for i in range(self.workers)
+        ]
+        self.running_workers = self.workers
+
+    def start(self):
+        for process in self.processes:
+            process.daemon = True
+            process.start()
+        logger.info(f"Pipeline started: capture, detect, {self.workers} OCR worker(s), "
+                    f"{self.ring.slots} ring slots")
+
+    def set_active(self, active):
+        """Enable or pause capture (e.g. from the distance sensor)."""
+        self.active.value = 1 if active else 0
+
+    def mark_decided(self, track_id):
+        """Tell the detector to stop sending this track to OCR."""
+        self.decided_queue.put(track_id)
+
+    def reset_tracks(self):
+        """Tell the detector a new vehicle has arrived: drop its tracks and decided ids."""
+        self.decided_queue.put(RESET)
+
+    def get_result(self, timeout=0.05):
+        """Next (track_id, frame_no, box, chars) or None; raises EOFError when drained."""
+        while True:
+            try:
+                item = self.result_queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            if item is not STOP:
+                return item
+            self.running_workers -= 1
+            if self.running_workers == 0:
+                raise EOFError("pipeline finished")
+
+    def close(self):
+        self.stop.set()
+        for process in self.processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        self.ring.close()
+        logger.info("Pipeline stopped")
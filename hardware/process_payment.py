@@ -1,28 +1,15 @@
-import csv
-import serial
+import queue
 import time
-import serial.tools.list_ports
-import platform
-from datetime import datetime
-
-CSV_FILE = 'db.csv'
-RATE_PER_MINUTE = 8.33  # Amount charged per minute
 
+from device_manager import open_role
+from parking_db import ParkingDB
+from serial_transport import SerialTransport
 
-def detect_arduino_port():
-    ports = list(serial.tools.list_ports.comports())
-    system = platform.system()
-    for port in ports:
-        if system == "Linux":
-            if "ttyUSB" in port.device or "ttyACM" in port.device:
-                return port.device
-        elif system == "Darwin":
-            if "usbmodem" in port.device or "usbserial" in port.device:
-                return port.device
-        elif system == "Windows":
-            if "COM" in port.device:
-                return port.device
-    return None
+# Text protocol of the reading_on_rfid.ino firmware. payment.ino speaks the
+# framed protocol (protocol.py): run payment_service.py --framed for it.
+DB_FILE = 'parking.db'
+BAUD_RATE = 9600        # reading_on_rfid.ino
+RATE_PER_MINUTE = 8.33  # Amount charged per minute
 
 
 def parse_arduino_data(line):
@@ -47,116 +34,103 @@ def parse_arduino_data(line):
         return None, None
 
 
-def process_payment(plate, balance, ser):
+def amount_due(entry_ts, now=None):
+    minutes_spent = int(((now or time.time()) - entry_ts) / 60) + 1
+    return minutes_spent * RATE_PER_MINUTE
+
+
+def card_balance(balance, due):
+    """Balance left after paying `due`, rounded to the whole units a card holds.
+
+    This is the value written to the card and recorded as balance_after;
+    the ledger amount is what was actually taken, balance - card_balance().
+    """
+    return round(balance - due)
+
+
+def process_payment(db, plate, balance, transport, ready):
     try:
-        with open(CSV_FILE, 'r') as f:
-            rows = list(csv.reader(f))
-
-        header = rows[0]
-        entries = rows[1:]
-        found = False
-
-        for i, row in enumerate(entries):
-            if row[3] == plate and row[5] == '0':
-                found = True
-                entry_time_str = row[1]
-                entry_time = datetime.strptime(entry_time_str, '%Y-%m-%d %H:%M:%S')
-                exit_time = datetime.now()
-                minutes_spent = int((exit_time - entry_time).total_seconds() / 60) + 1
-                amount_due = minutes_spent * RATE_PER_MINUTE
-
-                entries[i][2] = exit_time.strftime('%Y-%m-%d %H:%M:%S')
-                entries[i][4] = str(amount_due)
-
-                if balance < amount_due:
-                    print("[PAYMENT] Insufficient balance")
-                    ser.write(b'I\n')
-                    return
-                else:
-                    new_balance = balance - amount_due
-
-                    # Wait for Arduino to send "READY"
-                    print("[WAIT] Waiting for Arduino to be READY...")
-                    start_time = time.time()
-                    while True:
-                        if ser.in_waiting:
-                            arduino_response = ser.readline().decode().strip()
-                            print(f"[ARDUINO] {arduino_response}")
-                            if arduino_response == "READY":
-                                break
-                        if time.time() - start_time > 5:
-                            print("[ERROR] Timeout waiting for Arduino READY")
-                            return
-
-                    # Send new balance
-                    ser.write(f"{new_balance}\r\n".encode())  # more universal
-                    print(f"[PAYMENT] Sent new balance {new_balance}")
-
-                    # Wait for confirmation with timeout
-                    start_time = time.time()
-                    print("[WAIT] Waiting for Arduino confirmation...")
-                    while True:
-                        if ser.in_waiting:
-                            confirm = ser.readline().decode().strip()
-                            print(f"[ARDUINO] {confirm}")
-                            if "DONE" in confirm:
-                                print("[ARDUINO] Write confirmed")
-                                entries[i][5] = '1'
-                                break
-
-                        # Add timeout condition
-                        if time.time() - start_time > 10:
-                            print("[ERROR] Timeout waiting for confirmation")
-                            break
-
-                        # Small delay to avoid CPU spinning
-                        time.sleep(0.1)
-
-                break
-
-        if not found:
+        # Indexed lookup of the plate's open session
+        session = db.open_session(plate)
+        if not session:
             print("[PAYMENT] Plate not found or already paid.")
             return
 
-        with open(CSV_FILE, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(header)
-            writer.writerows(entries)
+        due = amount_due(session['entry_ts'])
+
+        if balance < due:
+            print("[PAYMENT] Insufficient balance")
+            transport.write(b'I\n')
+            return
+
+        new_balance = card_balance(balance, due)
+        charged = balance - new_balance
+
+        # Wait for Arduino to send "READY" (waiter registered with the card line)
+        print("[WAIT] Waiting for Arduino to be READY...")
+        if transport.wait(ready, timeout=5) is None:
+            print("[ERROR] Timeout waiting for Arduino READY")
+            return
+
+        # Send new balance and wait for confirmation
+        print(f"[PAYMENT] Sending new balance {new_balance}, waiting for confirmation...")
+        confirm = transport.request(f"{new_balance}\r\n".encode(), "DONE", timeout=10)
+        if not confirm:
+            print("[ERROR] Timeout waiting for confirmation")
+            return
+
+        print("[ARDUINO] Write confirmed")
+        # Settle the session and append the ledger row atomically
+        payment_id = db.record_payment(session['no'], plate, charged, balance, new_balance)
+        if payment_id is None:
+            print(f"[PAYMENT] Session for {plate} was already settled")
+        else:
+            print(f"[PAYMENT] Recorded payment #{payment_id} of {charged:.2f} for {plate}")
 
     except Exception as e:
         print(f"[ERROR] Payment processing failed: {e}")
 
 
 def main():
-    port = detect_arduino_port()
-    if not port:
+    # Warm pty from the device manager if it runs, else the board (input already flushed)
+    ser, port = open_role('payment', BAUD_RATE)
+    if not ser:
         print("[ERROR] Arduino not found")
         return
 
+    transport = None
+    db = ParkingDB(DB_FILE)
     try:
-        ser = serial.Serial(port, 9600, timeout=1)
         print(f"[CONNECTED] Listening on {port}")
-        time.sleep(2)
+        transport = SerialTransport(ser, name=port)
+        payments = queue.Queue()
+
+        def on_line(line):
+            print(f"[SERIAL] Received: {line}")
+            plate, balance = parse_arduino_data(line)
+            if plate and balance is not None:
+                # Register for READY before the reader thread sees the next line
+                payments.put((plate, balance, transport.expect("READY")))
 
-        # Flush any previous data
-        ser.reset_input_buffer()
+        transport.subscribe(on_line)
+        transport.start()
 
+        # Blocks until a card is tapped; no polling
         while True:
-            if ser.in_waiting:
-                line = ser.readline().decode().strip()
-                print(f"[SERIAL] Received: {line}")
-                plate, balance = parse_arduino_data(line)
-                if plate and balance is not None:
-                    process_payment(plate, balance, ser)
+            plate, balance, ready = payments.get()
+            process_payment(db, plate, balance, transport, ready)
 
     except KeyboardInterrupt:
         print("[EXIT] Program terminated")
     except Exception as e:
         print(f"[ERROR] {e}")
     finally:
-        if 'ser' in locals():
+        if transport:
+            transport.close()
+        elif 'ser' in locals():
             ser.close()
+        db.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
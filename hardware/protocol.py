@@ -0,0 +1,287 @@
+import asyncio
+import itertools
+import logging
+import struct
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, TimeoutError
+
+logger = logging.getLogger('Protocol')
+
+# Frame layout (all integers big-endian):
+#   SOF(0xA5) | version | type | seq | length | payload[length] | CRC16
+# The CRC (CRC-16/CCITT-FALSE) covers version..payload, so a corrupted
+# frame is dropped instead of being parsed into a wrong balance.
+SOF = 0xA5
+VERSION = 1
+MAX_PAYLOAD = 64
+HEADER = struct.Struct('>BBBBB')
+CRC = struct.Struct('>H')
+BAUD_RATE = 115200  # one rate for the gate and payment boards
+
+# Host -> device commands (each is answered by ACK/NACK carrying its seq)
+MSG_GATE_OPEN = 0x01
+MSG_GATE_CLOSE = 0x02
+MSG_ALARM_ON = 0x03
+MSG_ALARM_OFF = 0x04
+MSG_WRITE_BALANCE = 0x10   # payload: int32 new balance
+MSG_DENY = 0x11            # insufficient balance, release the card
+MSG_PING = 0x7F
+
+# Device -> host
+MSG_ACK = 0x80             # payload: uint8 status (0 = ok)
+MSG_NACK = 0x81            # payload: uint8 reason (NACK_*)
+MSG_DISTANCE = 0x90        # payload: uint16 distance in mm
+MSG_CARD = 0x91            # payload: int32 balance + plate (ASCII)
+MSG_READY = 0x92           # card read, waiting for the host's decision
+MSG_WRITE_DONE = 0x93      # payload: int32 balance written to the card
+MSG_WRITE_FAILED = 0x94    # payload: uint8 reason (WRITE_*); the card was not changed
+MSG_LOG = 0xA0             # payload: UTF-8 debug text
+
+NACK_BAD_CRC = 1
+NACK_UNKNOWN_TYPE = 2
+NACK_BAD_STATE = 3
+
+WRITE_CARD_FAILED = 1
+WRITE_BAD_BALANCE = 2
+
+Frame = namedtuple('Frame', 'type seq payload')
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        table.append(crc & 0xFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(data, crc=0xFFFF):
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+
+def encode_frame(msg_type, seq, payload=b''):
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"payload of {len(payload)} bytes exceeds {MAX_PAYLOAD}")
+    body = bytes((VERSION, msg_type, seq & 0xFF, len(payload))) + payload
+    return bytes((SOF,)) + body + CRC.pack(crc16(body))
+
+
+class FrameDecoder:
+    """Incremental decoder: feed() raw bytes, get back complete, valid frames.
+
+    Bytes before a start-of-frame are skipped; a frame with a bad CRC,
+    version or length is dropped and the search resumes one byte after its
+    SOF, so one corrupted byte costs one frame rather than the stream.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.crc_errors = 0
+        self.dropped_bytes = 0
+
+    def feed(self, data):
+        self.buffer.extend(data)
+        frames = []
+        while True:
+            start = self.buffer.find(SOF)
+            if start < 0:
+                self.dropped_bytes += len(self.buffer)
+                self.buffer.clear()
+                return frames
+            if start:
+                self.dropped_bytes += start
+                del self.buffer[:start]
+            if len(self.buffer) < HEADER.size:
+                return frames
+
+            _, version, msg_type, seq, length = HEADER.unpack_from(self.buffer)
+            if version != VERSION or length > MAX_PAYLOAD:
+                self._resync()
+                continue
+            end = HEADER.size + length + CRC.size
+            if len(self.buffer) < end:
+                return frames
+
+            body = bytes(self.buffer[1:HEADER.size + length])
+            (crc,) = CRC.unpack_from(self.buffer, HEADER.size + length)
+            if crc != crc16(body):
+                self.crc_errors += 1
+                self._resync()
+                continue
+            frames.append(Frame(msg_type, seq, bytes(self.buffer[HEADER.size:HEADER.size + length])))
+            del self.buffer[:end]
+
+    def _resync(self):
+        self.dropped_bytes += 1
+        del self.buffer[:1]
+
+
+# --- payloads ---
+
+def encode_card(plate, balance):
+    return struct.pack('>i', balance) + plate.encode('ascii')
+
+
+def decode_card(payload):
+    """MSG_CARD payload -> (plate, balance)."""
+    (balance,) = struct.unpack_from('>i', payload)
+    return payload[4:].decode('ascii', errors='replace').strip(), balance
+
+
+def encode_balance(balance):
+    """Cards hold whole units; a fractional balance is refused rather than truncated."""
+    if balance != int(balance):
+        raise ValueError(f"balance {balance} is not a whole amount")
+    return struct.pack('>i', int(balance))
+
+
+def decode_balance(payload):
+    return struct.unpack('>i', payload)[0]
+
+
+def decode_distance(payload):
+    """MSG_DISTANCE payload -> centimetres."""
+    return struct.unpack('>H', payload)[0] / 10
+
+
+class FramedTransport:
+    """SerialTransport counterpart for the framed protocol.
+
+    A reader thread decodes frames; ACK/NACK frames resolve the pending
+    request with the same sequence number, so several commands can be in
+    flight at once, and every other frame goes to the subscribers. A NACK
+    (e.g. the device saw a bad CRC) or a lost ack is retried with the same
+    sequence number, which the device treats as a duplicate.
+    """
+
+    framed = True
+
+    def __init__(self, port, name=None):
+        self.port = port
+        self.name = name or getattr(port, 'port', 'serial')
+        self.decoder = FrameDecoder()
+        self.retries = 0
+        self._pending = {}
+        self._subscribers = []
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._read_loop, name=f'framed-{self.name}', daemon=True)
+        self._thread.start()
+        return self
+
+    def _read_loop(self):
+        while self._running:
+            try:
+                data = self.port.read(self.port.in_waiting or 1)
+            except Exception as e:
+                if self._running:
+                    logger.error(f"Read from {self.name} failed: {e}")
+                    self._fail_pending(e)
+                break
+            if data:
+                for frame in self.decoder.feed(data):
+                    self._dispatch(frame)
+
+    def _dispatch(self, frame):
+        if frame.type in (MSG_ACK, MSG_NACK):
+            with self._lock:
+                future = self._pending.pop(frame.seq, None)
+            if future and not future.done():
+                future.set_result(frame)
+            return
+        if frame.type == MSG_LOG:
+            logger.debug(f"{self.name}: {frame.payload.decode('utf-8', errors='replace')}")
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(frame)
+            except Exception as e:
+                logger.error(f"Frame handler failed on {self.name}: {e}")
+
+    def _fail_pending(self, error):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def subscribe(self, callback):
+        """Call `callback(frame)` on the reader thread for every non-ack frame."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def next_seq(self):
+        seq = next(self._seq) & 0xFF
+        return seq or (next(self._seq) & 0xFF)  # seq 0 is reserved for unsolicited frames
+
+    def send(self, msg_type, payload=b'', seq=None):
+        """Write one frame; returns a Future resolved with its ACK/NACK frame."""
+        seq = self.next_seq() if seq is None else seq
+        future = Future()
+        with self._lock:
+            self._pending[seq] = future
+        with self._write_lock:
+            self.port.write(encode_frame(msg_type, seq, payload))
+            self.port.flush()
+        return future
+
+    def request(self, msg_type, payload=b'', timeout=1.0, retries=2):
+        """Send a command and wait for its ACK; returns the ACK frame or None."""
+        seq = self.next_seq()
+        for attempt in range(retries + 1):
+            if attempt:
+                self.retries += 1
+            future = self.send(msg_type, payload, seq)
+            try:
+                frame = future.result(timeout)
+            except TimeoutError:
+                with self._lock:
+                    self._pending.pop(seq, None)
+                continue
+            if frame.type == MSG_ACK:
+                return frame
+            logger.warning(f"{self.name}: NACK {frame.payload.hex()} for type {msg_type:#04x}")
+        return None
+
+    async def request_async(self, msg_type, payload=b'', timeout=1.0, retries=2):
+        """asyncio flavour of request()."""
+        seq = self.next_seq()
+        for attempt in range(retries + 1):
+            if attempt:
+                self.retries += 1
+            future = self.send(msg_type, payload, seq)
+            try:
+                frame = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self._pending.pop(seq, None)
+                continue
+            if frame.type == MSG_ACK:
+                return frame
+        return None
+
+    def stats(self):
+        return {'crc_errors': self.decoder.crc_errors, 'dropped_bytes': self.decoder.dropped_bytes,
+                'retries': self.retries}
+
+    def close(self):
+        self._running = False
+        self._fail_pending(ConnectionError(f"{self.name} closed"))
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self.port.close()
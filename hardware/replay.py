@@ -0,0 +1,70 @@
+import os
+
+import cv2
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class ReplaySource:
+    """Drop-in stand-in for cv2.VideoCapture that replays a file or image folder.
+
+    A video file is decoded frame by frame; a directory is read as a sorted
+    sequence of still images, each returned `repeat` times so the tracker
+    and consensus see a vehicle dwell in front of the camera.
+    """
+
+    def __init__(self, path, repeat=1, loop=False):
+        self.path = path
+        self.repeat = max(1, repeat)
+        self.loop = loop
+        self.video = None
+        self.images = []
+        self.index = 0
+        self.frame_no = 0
+        self.name = None  # image path of the last frame read
+
+        if os.path.isdir(path):
+            self.images = sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        else:
+            self.video = cv2.VideoCapture(path)
+
+    def isOpened(self):
+        if self.video is not None:
+            return self.video.isOpened()
+        return bool(self.images)
+
+    def read(self):
+        """Return (ok, frame) like cv2.VideoCapture.read()."""
+        if self.video is not None:
+            ok, frame = self.video.read()
+            if not ok and self.loop:
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, frame = self.video.read()
+            if ok:
+                self.frame_no += 1
+            return ok, frame
+
+        while True:
+            if self.index >= len(self.images) * self.repeat:
+                if not self.loop or not self.images:
+                    return False, None
+                self.index = 0
+
+            self.name = self.images[self.index // self.repeat]
+            self.index += 1
+            frame = cv2.imread(self.name)
+            if frame is not None:
+                self.frame_no += 1
+                return True, frame
+
+    def set(self, prop, value):
+        if self.video is not None:
+            return self.video.set(prop, value)
+        return False
+
+    def release(self):
+        if self.video is not None:
+            self.video.release()
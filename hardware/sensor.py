@@ -0,0 +1,128 @@
+import logging
+import math
+import statistics
+import threading
+import time
+from collections import deque
+
+import protocol
+
+logger = logging.getLogger('Sensor')
+
+EMPTY = 'empty'
+PRESENT = 'present'
+
+
+def simulated_distance(t, period=30.0):
+    """Scripted stand-in for the ultrasonic sensor: a car arrives, waits, leaves.
+
+    The bay is empty for the first half of each period and occupied for the
+    rest, with a little sensor noise, so runs without an Arduino behave
+    like a real gate instead of firing inference at random.
+    """
+    phase = t % period
+    noise = 1.5 * math.sin(t * 7.3)
+    if phase < period / 2:
+        return 120.0 + noise
+    return 12.0 + noise
+
+
+class UltrasonicSampler:
+    """Keeps a median-filtered distance from the gate Arduino's stream.
+
+    Distance lines arrive from a SerialTransport subscription (the transport's
+    reader thread always drains the port, so samples are never stale); other
+    lines are ignored here and left to the transport's waiters. On a
+    FramedTransport the samples are MSG_DISTANCE frames instead. Filtered
+    samples drive an empty/present state machine with hysteresis (arrive
+    below arrive_distance, depart above depart_distance, each for `confirm`
+    consecutive samples). Without a transport, distances are simulated.
+    """
+
+    def __init__(self, transport=None, arrive_distance=20, depart_distance=30,
+                 window=5, confirm=3, sample_interval=0.1):
+        self.transport = transport
+        self.arrive_distance = arrive_distance
+        self.depart_distance = depart_distance
+        self.confirm = confirm
+        self.sample_interval = sample_interval
+
+        self.samples = deque(maxlen=window)
+        self.distance = None
+        self.state = EMPTY
+        self.arrival = threading.Event()
+        self._streak = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def present(self):
+        return self.state == PRESENT
+
+    @property
+    def simulated(self):
+        return self.transport is None
+
+    def start(self):
+        if self.transport is not None:
+            framed = getattr(self.transport, 'framed', False)
+            self.transport.subscribe(self.on_frame if framed else self.on_line)
+            return
+        self._thread = threading.Thread(target=self._simulate, name='ultrasonic-sim', daemon=True)
+        self._thread.start()
+
+    def _simulate(self):
+        started = time.time()
+        while not self._stop_event.wait(self.sample_interval):
+            self.add_sample(simulated_distance(time.time() - started))
+
+    def on_line(self, line):
+        """Transport callback: keep numeric lines as distance samples."""
+        try:
+            value = float(line)
+        except ValueError:
+            return
+        self.add_sample(value)
+
+    def on_frame(self, frame):
+        """FramedTransport callback: keep MSG_DISTANCE frames as samples."""
+        if frame.type == protocol.MSG_DISTANCE:
+            self.add_sample(protocol.decode_distance(frame.payload))
+
+    def add_sample(self, value):
+        """Feed one raw distance (cm) through the filter and state machine."""
+        with self._lock:
+            self.samples.append(value)
+            self.distance = statistics.median(self.samples)
+
+            if self.state == EMPTY:
+                self._streak = self._streak + 1 if self.distance <= self.arrive_distance else 0
+                if self._streak >= self.confirm:
+                    self.state, self._streak = PRESENT, 0
+                    self.arrival.set()
+                    logger.info(f"Vehicle arrived ({self.distance:.1f}cm)")
+            else:
+                self._streak = self._streak + 1 if self.distance > self.depart_distance else 0
+                if self._streak >= self.confirm:
+                    self.state, self._streak = EMPTY, 0
+                    logger.info(f"Vehicle departed ({self.distance:.1f}cm)")
+
+    def consume_arrival(self):
+        """Return True once per arrival; the vision loop's wake-up signal."""
+        if self.arrival.is_set():
+            self.arrival.clear()
+            return True
+        return False
+
+    def wait_for_arrival(self, timeout=None):
+        """Block until a vehicle arrives (or timeout); returns True on arrival."""
+        arrived = self.arrival.wait(timeout)
+        if arrived:
+            self.arrival.clear()
+        return arrived
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+
+logger = logging.getLogger('Serial')
+
+
+class LineWaiter(Future):
+    """Future resolved with the first incoming line that contains `expected`.
+
+    Being a concurrent Future it can be waited on from threads
+    (`result(timeout)`) or awaited from asyncio (`asyncio.wrap_future`).
+    """
+
+    def __init__(self, expected):
+        super().__init__()
+        self.expected = expected
+
+    def matches(self, line):
+        if callable(self.expected):
+            return self.expected(line)
+        return self.expected in line
+
+
+class SerialTransport:
+    """One reader thread per serial port that splits the byte stream into lines.
+
+    Each line is handed to pending LineWaiters (register with expect() before
+    writing the command that triggers the reply) and then to every
+    subscriber. The thread blocks in the OS read, so an idle port costs no
+    CPU and replies are delivered as soon as the line terminator arrives.
+    """
+
+    def __init__(self, port, name=None):
+        self.port = port
+        self.name = name or getattr(port, 'port', 'serial')
+        self._waiters = []
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._read_loop, name=f'serial-{self.name}', daemon=True)
+        self._thread.start()
+        return self
+
+    def _read_loop(self):
+        buffer = bytearray()
+        while self._running:
+            try:
+                # Blocks for up to the port timeout when nothing is pending
+                data = self.port.read(self.port.in_waiting or 1)
+            except Exception as e:
+                if self._running:
+                    logger.error(f"Read from {self.name} failed: {e}")
+                    self._fail_waiters(e)
+                break
+            if not data:
+                continue
+
+            buffer.extend(data)
+            while b'\n' in buffer:
+                raw, _, rest = bytes(buffer).partition(b'\n')
+                buffer = bytearray(rest)
+                line = raw.decode('utf-8', errors='replace').strip()
+                if line:
+                    self._dispatch(line)
+
+    def _dispatch(self, line):
+        with self._lock:
+            waiters = [w for w in self._waiters if not w.done() and w.matches(line)]
+            self._waiters = [w for w in self._waiters if not w.done() and w not in waiters]
+            subscribers = list(self._subscribers)
+
+        for waiter in waiters:
+            waiter.set_result(line)
+        for callback in subscribers:
+            try:
+                callback(line)
+            except Exception as e:
+                logger.error(f"Line handler failed on {self.name}: {e}")
+
+    def _fail_waiters(self, error):
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(error)
+
+    def expect(self, expected):
+        """Register a waiter for the next line containing `expected` (or matching a predicate)."""
+        waiter = LineWaiter(expected)
+        with self._lock:
+            self._waiters.append(waiter)
+        return waiter
+
+    def subscribe(self, callback):
+        """Call `callback(line)` on the reader thread for every line."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def subscribe_queue(self):
+        """Return a queue.Queue that receives every line."""
+        lines = queue.Queue()
+        self.subscribe(lines.put)
+        return lines
+
+    def write(self, data):
+        with self._write_lock:
+            self.port.write(data)
+            self.port.flush()
+
+    def wait(self, waiter, timeout):
+        """Block on a waiter; returns the line, or None on timeout."""
+        try:
+            return waiter.result(timeout=timeout)
+        except TimeoutError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            waiter.cancel()
+            return None
+
+    def request(self, data, expected, timeout=2.0):
+        """Write a command and wait for the reply line; returns it or None."""
+        waiter = self.expect(expected)
+        self.write(data)
+        return self.wait(waiter, timeout)
+
+    async def request_async(self, data, expected, timeout=2.0):
+        """asyncio flavour of request()."""
+        waiter = self.expect(expected)
+        self.write(data)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(waiter), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self._running = False
+        self._fail_waiters(ConnectionError(f"{self.name} closed"))
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self.port.close()
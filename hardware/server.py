@@ -1,55 +1,244 @@
-from flask import Flask, jsonify, send_file
-import sqlite3
-from datetime import datetime
+from flask import Flask, Response, jsonify, request, send_file
+import queue
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from urllib.parse import urlencode
 from flask_cors import CORS
 
+from change_feed import OVERFLOW, RESET, ChangeFeed, format_event
+import export
+import stats
+from parking_db import EXPORTS, ParkingDB, parse_time
+
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['ETag', 'Link', 'X-Change-Id', 'X-Next-Before', 'X-Version'])
+
+# Reused connections keep their prepared statements cached across requests
+_pool = queue.LifoQueue()
+
+STREAM_HEARTBEAT = 15  # seconds; also how soon a closed browser tab is noticed
+
+# One change_log reader shared by every /api/stream client, started on first use
+_feed = None
+_feed_lock = threading.Lock()
 
-def get_db_connection():
-    conn = sqlite3.connect('parking.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+@contextmanager
+def get_db():
+    try:
+        db = _pool.get_nowait()
+    except queue.Empty:
+        db = ParkingDB(check_same_thread=False)
+    try:
+        yield db
+    finally:
+        _pool.put(db)
 
 @app.route('/')
 def index():
     return send_file('index.html')
 
+# Query parameters accepted by the listing endpoints -> ParkingDB.page() arguments
+PAGE_PARAMS = {'limit': 'limit', 'before': 'before', 'from': 'since', 'to': 'until',
+               'plate': 'plate', 'gate': 'gate', 'status': 'status'}
+
+def listing_etag(name, version):
+    """Entity tag for a listing's state: its filters at a change version.
+
+    Paging and delta arguments are left out, so a client polling for
+    deltas presents the tag of the state it holds.
+    """
+    args = sorted((k, v) for k, v in request.args.items() if k not in ('since', 'limit', 'before'))
+    return f"{name}-{version}-{zlib.crc32(repr(args).encode()):08x}"
+
+def api_page(name):
+    """One keyset page as a JSON array, or with ?since=<version> the changes since then.
+
+    Every response carries the listing's change version (X-Version) and an
+    ETag; a request whose If-None-Match still matches gets 304 after one
+    index probe, without querying or serializing rows. A delta is
+    {"version", "upserts", "removed"}; 410 means the client is too far
+    behind and should reload the listing. X-Change-Id is the /api/stream
+    event id to resume from so that no later change is missed.
+    """
+    params = {arg: request.args[key] for key, arg in PAGE_PARAMS.items() if request.args.get(key)}
+    if 'plate' in params:
+        params['plate'] = params['plate'].upper()
+    with get_db() as db:
+        change_id = db.change_range()[1]
+        version = db.listing_version(name)
+        etag = listing_etag(name, version)
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            try:
+                if request.args.get('since'):
+                    params.pop('limit', None)
+                    params.pop('before', None)
+                    delta = db.delta(name, int(request.args['since']), **params)
+                    if delta is None:
+                        return jsonify({'error': 'change log no longer covers this version; reload'}), 410
+                    response = jsonify(delta)
+                else:
+                    rows, cursor = db.page(name, **params)
+                    response = jsonify(rows)
+                    if cursor:
+                        args = request.args.to_dict()
+                        args['before'] = cursor
+                        response.headers['X-Next-Before'] = cursor
+                        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+    response.set_etag(etag)
+    response.headers['X-Version'] = str(version)
+    # Position in the event stream this response is at least as new as
+    response.headers['X-Change-Id'] = str(change_id)
+    return response
+
 @app.route('/api/entries', methods=['GET'])
 def get_entries():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM entries WHERE exit_time = "" ORDER BY entry_time DESC')
-    entries = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(entries)
+    return api_page('entries')
 
 @app.route('/api/exits', methods=['GET'])
 def get_exits():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM entries WHERE exit_time != "" AND payment_status = 1 ORDER BY exit_time DESC')
-    exits = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(exits)
+    return api_page('exits')
 
 @app.route('/api/payments', methods=['GET'])
 def get_payments():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM entries WHERE payment_status = 1 AND due_payment IS NOT NULL ORDER BY exit_time DESC')
-    payments = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(payments)
+    return api_page('payments')
 
 @app.route('/api/violations', methods=['GET'])
 def get_violations():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM violations ORDER BY timestamp DESC')
-    violations = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(violations)
+    return api_page('violations')
+
+# Summary statistics, read from the trigger-maintained stats_* tables: each
+# endpoint touches a bounded number of rows however large the history is.
+
+def stats_range(default_hours):
+    """[from, to) epoch bounds from ?from=&to= (default: the last `default_hours`)."""
+    until = parse_time(request.args['to']) if request.args.get('to') else time.time() + stats.HOUR
+    since = parse_time(request.args['from']) if request.args.get('from') else until - default_hours * stats.HOUR
+    return since, until
+
+@app.route('/api/stats/occupancy', methods=['GET'])
+def get_occupancy():
+    with get_db() as db:
+        return jsonify({**db.lot_status(), 'as_of': int(time.time())})
+
+@app.route('/api/stats/today', methods=['GET'])
+def get_today():
+    now = time.time()
+    with get_db() as db:
+        return jsonify(stats.summary(db, stats.day_start(now), now + stats.HOUR))
+
+@app.route('/api/stats/hourly', methods=['GET'])
+def get_hourly():
+    try:
+        since, until = stats_range(24)
+        with get_db() as db:
+            return jsonify(stats.hourly(db, since, until))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/stats/peak', methods=['GET'])
+def get_peak():
+    try:
+        since, until = stats_range(7 * 24)
+        if until - since > stats.MAX_HOURS * stats.HOUR:
+            raise ValueError(f"range is limited to {stats.MAX_HOURS} hours")
+        with get_db() as db:
+            return jsonify(stats.peak_hours(db, since, until))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/stats/gates', methods=['GET'])
+def get_gate_stats():
+    with get_db() as db:
+        return jsonify(db.gate_violation_stats())
+
+@app.route('/api/export/<name>', methods=['GET'])
+def get_export(name):
+    """Stream entries, payments or violations as CSV or JSONL, oldest first, archive included.
+
+    ?format=csv|jsonl, ?from=&to= bound the date ([from, to)), ?gzip=1
+    sends a .gz file. Rows are written a batch at a time as they are read,
+    so memory use does not depend on the size of the export.
+    """
+    if name not in EXPORTS:
+        return jsonify({'error': f"no export '{name}'"}), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(export.FORMATS)}"}), 400
+    gzip = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    try:
+        since = parse_time(request.args['from']) if request.args.get('from') else None
+        until = parse_time(request.args['to']) if request.args.get('to') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def body():
+        # The connection is held only while the download runs
+        with get_db() as db:
+            yield from export.stream(db, name, fmt, since, until, gzip)
+
+    return Response(body(), mimetype='application/gzip' if gzip else export.FORMATS[fmt][0],
+                    headers={'Content-Disposition': f'attachment; filename="{export.filename(name, fmt, gzip)}"',
+                             'Cache-Control': 'no-store'})
+
+def get_feed():
+    global _feed
+    with _feed_lock:
+        if _feed is None:
+            _feed = ChangeFeed().start()
+        return _feed
+
+@app.route('/api/stream', methods=['GET'])
+def stream():
+    """Server-Sent Events: entry, exit, payment, violation and removed events as they commit.
+
+    Each event's id is its change_log id; a reconnecting EventSource sends
+    it back as Last-Event-ID (or a fresh page load passes ?last_id= from
+    X-Change-Id) and gets what it missed first. A `reset` event means that
+    position is gone and the client should reload the listings.
+    """
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+    if last_id is not None:
+        try:
+            last_id = int(last_id)
+        except ValueError:
+            return jsonify({'error': f"bad event id '{last_id}'"}), 400
+
+    feed = get_feed()
+    with get_db() as db:
+        sub = feed.subscribe(last_id, db)
+
+    def events():
+        try:
+            yield 'retry: 2000\n\n'
+            while True:
+                event = sub.get(STREAM_HEARTBEAT)
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                # Send everything already queued in one write
+                batch = []
+                while event is not None:
+                    if event is RESET:
+                        batch.append('event: reset\ndata: {}\n\n')
+                        yield ''.join(batch)
+                        return
+                    if event is OVERFLOW:
+                        yield ''.join(batch)
+                        return
+                    batch.append(format_event(event))
+                    event = sub.get(0) if len(batch) < 100 else None
+                yield ''.join(batch)
+        finally:
+            feed.unsubscribe(sub)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,175 @@
+import logging
+import time
+
+logger = logging.getLogger('Sessions')
+
+RECENT_PAID_WINDOW = 24 * 3600  # seconds of paid exits kept in memory
+CHANGE_LOG_KEEP = 10000         # change_log rows retained for lagging processes
+PRUNE_INTERVAL = 300            # seconds between change_log prunes while running
+
+
+class ActiveSessions:
+    """In-memory view of the sessions the gates decide on, keyed by plate.
+
+    Holds every unpaid session and each plate's latest paid exit, so "inside",
+    "unpaid" and "recently paid" are dictionary lookups. Writes go through
+    ParkingDB first and are then applied locally. Other processes' writes are
+    picked up by refresh(): PRAGMA data_version tells whether anyone else
+    committed, and the trigger-filled change_log says which entries to
+    re-read. A process that falls further behind than the retained log
+    reloads from scratch.
+    """
+
+    def __init__(self, db, recent_window=RECENT_PAID_WINDOW):
+        self.db = db
+        self.recent_window = recent_window
+        self.unpaid = {}      # plate -> {no: (entry_ts, exit_ts)}
+        self.last_paid = {}   # plate -> epoch of latest paid exit
+        self._plate_of = {}   # no -> plate, for unpaid sessions
+        self.lot = {'inside': 0, 'capacity': None, 'headroom': None}
+        self._last_change = 0
+        self._data_version = None
+        self._next_prune = 0
+        self.load()
+
+    def load(self):
+        """(Re)build the cache from the entries table."""
+        self.unpaid.clear()
+        self.last_paid.clear()
+        self._plate_of.clear()
+
+        self._data_version = self.db.data_version()
+        self._last_change = self.db.change_range()[1]
+        self.lot = self.db.lot_status()
+        for row in self.db.unpaid_sessions():
+            self._apply(row)
+        for row in self.db.recent_paid_exits(time.time() - self.recent_window):
+            self.last_paid[row['car_plate']] = row['exit_ts']
+
+        self._prune()
+        logger.info(f"Loaded {len(self._plate_of)} unpaid sessions, {len(self.last_paid)} recent exits")
+
+    def _apply(self, row):
+        """Fold one entries row into the cache (idempotent)."""
+        no, plate = row['no'], row['car_plate']
+        self._forget(no)
+        if row['payment_status'] == 0:
+            self.unpaid.setdefault(plate, {})[no] = (row['entry_ts'], row['exit_ts'])
+            self._plate_of[no] = plate
+            return
+
+        exit_ts = row['exit_ts']
+        if exit_ts and exit_ts > self.last_paid.get(plate, 0):
+            self.last_paid[plate] = exit_ts
+
+    def _forget(self, no):
+        plate = self._plate_of.pop(no, None)
+        if plate is None:
+            return
+        sessions = self.unpaid[plate]
+        sessions.pop(no, None)
+        if not sessions:
+            del self.unpaid[plate]
+
+    def _prune(self):
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL
+        self.db.prune_changes(CHANGE_LOG_KEEP)
+
+    def refresh(self):
+        """Pick up commits made by other processes; cheap when there are none."""
+        # Every process appends to change_log, so each one trims it now and then
+        if time.monotonic() >= self._next_prune:
+            self._prune()
+
+        version = self.db.data_version()
+        if version == self._data_version:
+            return
+        self._data_version = version
+        # Trigger-maintained counter: one primary-key read per foreign commit
+        self.lot = self.db.lot_status()
+
+        first_id, last_id = self.db.change_range()
+        if first_id > self._last_change + 1:
+            logger.info("Change log pruned past our position, reloading")
+            self.load()
+            return
+
+        for change in self.db.changes_since(self._last_change):
+            self._last_change = change['id']
+            if change['tbl'] != 'entries':
+                continue
+            row = self.db.entry(change['row_id'])
+            if row is None:
+                self._forget(change['row_id'])
+            else:
+                self._apply(row)
+
+    # --- lookups ---
+
+    def has_unpaid(self, plate):
+        return plate in self.unpaid
+
+    def open_session(self, plate):
+        """(no, entry_ts) of the plate's latest unpaid session still inside, or None."""
+        inside = [(entry_ts, no) for no, (entry_ts, exit_ts) in self.unpaid.get(plate, {}).items()
+                  if exit_ts is None]
+        if not inside:
+            return None
+        entry_ts, no = max(inside)
+        return no, entry_ts
+
+    def is_inside(self, plate):
+        return self.open_session(plate) is not None
+
+    def is_full(self):
+        """True when the lot is at capacity (as of the last refresh)."""
+        return self.lot['capacity'] is not None and self.lot['inside'] >= self.lot['capacity']
+
+    def recently_paid(self, plate, window):
+        """Epoch of the plate's paid exit within the last `window` seconds, else None."""
+        since = time.time() - window
+        if window > self.recent_window:
+            # Older than what the cache holds: one indexed range probe
+            row = self.db.recent_paid_exit(plate, since)
+            return row['exit_ts'] if row else None
+        exit_ts = self.last_paid.get(plate)
+        return exit_ts if exit_ts and exit_ts >= since else None
+
+    # --- write-through ---
+
+    def add_entry(self, plate, entry_ts=None):
+        """Durably insert a session (its number is needed) and cache it.
+
+        The insert re-checks capacity in its own transaction, so a lot
+        filled by another gate since the last refresh returns None.
+        """
+        entry_ts = int(entry_ts or time.time())
+        no = self.db.admit_entry(plate, entry_ts, sync=True)
+        if no is None:
+            self.lot = self.db.lot_status()
+            return None
+        self._apply({'no': no, 'car_plate': plate, 'entry_ts': entry_ts,
+                     'exit_ts': None, 'payment_status': 0})
+        self._count_inside(+1)
+        return no
+
+    def record_exit(self, no, due_payment, exit_ts=None, sync=False):
+        plate = self._plate_of.get(no)
+        exit_ts = int(exit_ts or time.time())
+        # An uncached session is re-read below, so its write must have landed
+        self.db.record_exit(no, due_payment, exit_ts, sync=sync or plate is None)
+        if plate is None:
+            row = self.db.entry(no)
+            if row is not None:
+                self._apply(row)
+            return
+        self._apply({'no': no, 'car_plate': plate, 'entry_ts': None,
+                     'exit_ts': exit_ts, 'payment_status': 1})
+        self._count_inside(-1)
+
+    def _count_inside(self, delta):
+        # Mirror our own write until the next refresh re-reads the counter
+        lot = dict(self.lot, inside=max(self.lot['inside'] + delta, 0))
+        if lot['capacity'] is not None:
+            lot['headroom'] = max(lot['capacity'] - lot['inside'], 0)
+        self.lot = lot
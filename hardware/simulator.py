@@ -0,0 +1,460 @@
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import select
+import tempfile
+import threading
+import time
+import tty
+
+import serial
+
+import protocol
+from sensor import simulated_distance
+
+logger = logging.getLogger('Simulator')
+
+
+class VirtualDevice:
+    """A fake Arduino behind a pseudo-terminal.
+
+    `port` is a real tty path, so the host opens it with pyserial exactly
+    like a board and exercises the same SerialTransport/FramedTransport
+    code. Replies are delayed by `latency` +/- `jitter` seconds (keeping
+    their order, as a UART would) and each outgoing line or frame has a
+    `corrupt` chance of one flipped byte.
+    """
+
+    def __init__(self, name, latency=0.0, jitter=0.0, corrupt=0.0, framed=False, seed=None):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.corrupt = corrupt
+        self.framed = framed
+        self.rng = random.Random(seed)
+        self.stats = {'sent': 0, 'received': 0, 'corrupted': 0}
+
+        self.master, self._slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+
+        self.decoder = protocol.FrameDecoder()
+        self._buffer = bytearray()
+        self._outbox = []
+        self._order = itertools.count()
+        self._last_due = 0.0
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads = []
+
+    def start(self):
+        self._running = True
+        for target in (self._read_loop, self._write_loop, self.run):
+            thread = threading.Thread(target=target, name=f'{self.name}-{target.__name__}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def run(self):
+        """Device main loop (override for devices that stream on their own)."""
+
+    # --- outgoing ---
+
+    def send(self, data):
+        if self.corrupt and self.rng.random() < self.corrupt:
+            data = bytearray(data)
+            data[self.rng.randrange(len(data))] ^= 1 << self.rng.randrange(8)
+            data = bytes(data)
+            self.stats['corrupted'] += 1
+        delay = max(self.latency + self.rng.uniform(-self.jitter, self.jitter), 0.0)
+        with self._cond:
+            due = max(time.monotonic() + delay, self._last_due)
+            self._last_due = due
+            heapq.heappush(self._outbox, (due, next(self._order), data))
+            self._cond.notify()
+
+    def send_line(self, text):
+        self.send(f"{text}\r\n".encode())
+
+    def send_frame(self, msg_type, seq=0, payload=b''):
+        self.send(protocol.encode_frame(msg_type, seq, payload))
+
+    def _write_loop(self):
+        with self._cond:
+            while self._running:
+                if not self._outbox:
+                    self._cond.wait()
+                    continue
+                due, _, data = self._outbox[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._outbox)
+                try:
+                    os.write(self.master, data)
+                    self.stats['sent'] += 1
+                except OSError:
+                    return
+
+    # --- incoming ---
+
+    def _read_loop(self):
+        while self._running:
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+            if self.framed:
+                for frame in self.decoder.feed(data):
+                    self.stats['received'] += 1
+                    self.on_frame(frame)
+            else:
+                self.on_bytes(data)
+
+    def on_bytes(self, data):
+        """Text protocol: split host input into lines."""
+        self._buffer.extend(data)
+        while b'\n' in self._buffer:
+            raw, _, rest = bytes(self._buffer).partition(b'\n')
+            self._buffer = bytearray(rest)
+            line = raw.decode(errors='replace').strip()
+            if line:
+                self.stats['received'] += 1
+                self.on_line(line)
+
+    def on_line(self, line):
+        pass
+
+    def on_frame(self, frame):
+        pass
+
+    def ack(self, frame):
+        self.send_frame(protocol.MSG_ACK, frame.seq, b'\x00')
+
+    def close(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=1)
+        os.close(self.master)
+        os.close(self._slave)
+
+
+class GateSimulator(VirtualDevice):
+    """Gate controller: ultrasonic distance stream plus barrier/buzzer commands.
+
+    Text firmware: one distance line per sample, single-byte commands
+    '1' (open), '0' (close / silence), '2' (alarm) answered with the
+    "[GATE] ..." / "[ALERT] ..." lines the host waits for. Framed firmware:
+    MSG_DISTANCE frames and acked MSG_GATE_* / MSG_ALARM_* commands.
+    """
+
+    def __init__(self, rate=10.0, period=30.0, **kwargs):
+        super().__init__('gate', **kwargs)
+        self.rate = rate
+        self.period = period
+        self.gate_open = False
+        self.buzzer_on = False
+
+    def run(self):
+        started = time.monotonic()
+        interval = 1.0 / self.rate
+        next_sample = started
+        while self._running:
+            distance = simulated_distance(time.monotonic() - started, self.period)
+            if self.framed:
+                mm = max(min(int(distance * 10), 0xFFFF), 0)
+                self.send_frame(protocol.MSG_DISTANCE, 0, mm.to_bytes(2, 'big'))
+            else:
+                self.send_line(f"{distance:.1f}")
+            next_sample += interval
+            time.sleep(max(next_sample - time.monotonic(), 0))
+
+    def on_bytes(self, data):
+        for command in data.decode(errors='replace'):
+            if command in '\r\n':
+                continue
+            self.stats['received'] += 1
+            if command == '1':
+                self.gate_open = True
+                self.send_line("[GATE] Opened")
+            elif command == '2':
+                self.buzzer_on = True
+                self.send_line("[ALERT] Unpaid vehicle detected")
+            elif command == '0':
+                if self.buzzer_on:
+                    self.buzzer_on = False
+                    self.send_line("[ALERT] Cleared")
+                if self.gate_open:
+                    self.gate_open = False
+                    self.send_line("[GATE] Closed")
+
+    def on_frame(self, frame):
+        if frame.type == protocol.MSG_GATE_OPEN:
+            self.gate_open = True
+        elif frame.type == protocol.MSG_GATE_CLOSE:
+            self.gate_open = False
+        elif frame.type == protocol.MSG_ALARM_ON:
+            self.buzzer_on = True
+        elif frame.type == protocol.MSG_ALARM_OFF:
+            self.buzzer_on = False
+        elif frame.type != protocol.MSG_PING:
+            self.send_frame(protocol.MSG_NACK, frame.seq, bytes([protocol.NACK_UNKNOWN_TYPE]))
+            return
+        self.ack(frame)
+
+
+class PaymentSimulator(VirtualDevice):
+    """RFID payment reader: taps each card, then waits for the host's reply.
+
+    Text firmware: "plate,balance", READY after `ready_delay`, then a new
+    balance line is answered with DONE after `write_delay` ('I' denies).
+    Framed firmware: MSG_CARD + MSG_READY, acked MSG_WRITE_BALANCE/MSG_DENY,
+    MSG_WRITE_DONE.
+    """
+
+    def __init__(self, cards, name='payment', ready_delay=0.05, write_delay=0.05,
+                 tap_interval=0.0, reply_timeout=10.0, **kwargs):
+        super().__init__(name, **kwargs)
+        self.cards = list(cards)
+        self.ready_delay = ready_delay
+        self.write_delay = write_delay
+        self.tap_interval = tap_interval
+        self.reply_timeout = reply_timeout
+        self.outcomes = {'done': 0, 'denied': 0, 'timeout': 0}
+        self.finished = threading.Event()
+        self._replied = threading.Event()
+        self._last_command = None
+
+    def run(self):
+        for plate, balance in self.cards:
+            if not self._running:
+                break
+            self._replied.clear()
+            if self.framed:
+                self.send_frame(protocol.MSG_CARD, 0, protocol.encode_card(plate, balance))
+            else:
+                self.send_line(f"{plate},{balance}")
+            time.sleep(self.ready_delay)
+            if self.framed:
+                self.send_frame(protocol.MSG_READY)
+            else:
+                self.send_line("READY")
+            if not self._replied.wait(self.reply_timeout):
+                self.outcomes['timeout'] += 1
+            time.sleep(self.tap_interval)
+        self.finished.set()
+
+    def _write_balance(self, balance):
+        time.sleep(self.write_delay)
+        if self.framed:
+            self.send_frame(protocol.MSG_WRITE_DONE, 0, protocol.encode_balance(balance))
+        else:
+            self.send_line("DONE")
+        self.outcomes['done'] += 1
+        self._replied.set()
+
+    def on_line(self, line):
+        if line == 'I':
+            self.outcomes['denied'] += 1
+            self._replied.set()
+            return
+        try:
+            balance = float(line)
+        except ValueError:
+            return
+        threading.Thread(target=self._write_balance, args=(balance,), daemon=True).start()
+
+    def on_frame(self, frame):
+        # A retransmission (same seq and type) is acked again but not repeated
+        if (frame.seq, frame.type) == self._last_command:
+            self.ack(frame)
+            return
+        if frame.type == protocol.MSG_DENY:
+            self.ack(frame)
+            self.outcomes['denied'] += 1
+            self._replied.set()
+        elif frame.type == protocol.MSG_WRITE_BALANCE:
+            self.ack(frame)
+            threading.Thread(target=self._write_balance, args=(protocol.decode_balance(frame.payload),),
+                             daemon=True).start()
+        elif frame.type == protocol.MSG_PING:
+            self.ack(frame)
+        else:
+            self.send_frame(protocol.MSG_NACK, frame.seq, bytes([protocol.NACK_UNKNOWN_TYPE]))
+            return
+        self._last_command = (frame.seq, frame.type)
+
+
+# --- load tests through the real host code ---
+
+def open_port(device):
+    return serial.Serial(device.port, protocol.BAUD_RATE, timeout=0.1)
+
+
+def bench_gate(args):
+    """Stream distances into the sampler and time gate command acks (GateActuator's request path)."""
+    from sensor import UltrasonicSampler
+    from serial_transport import SerialTransport
+
+    device = GateSimulator(rate=args.rate, period=args.period, latency=args.latency,
+                           jitter=args.jitter, corrupt=args.corrupt, framed=args.framed).start()
+    ser = open_port(device)
+    transport = (protocol.FramedTransport if args.framed else SerialTransport)(ser, name=device.port).start()
+    sampler = UltrasonicSampler(transport)
+    sampler.start()
+    samples = []
+    transport.subscribe(lambda item: samples.append(time.monotonic()))
+
+    latencies, lost = [], 0
+    started = time.monotonic()
+    for i in range(args.commands):
+        command = ('open', 'close')[i % 2]
+        sent = time.monotonic()
+        if args.framed:
+            ok = transport.request(protocol.MSG_GATE_OPEN if command == 'open' else protocol.MSG_GATE_CLOSE,
+                                   timeout=args.ack_timeout)
+        else:
+            data, ack = {'open': (b'1', "[GATE] Opened"), 'close': (b'0', "[GATE] Closed")}[command]
+            ok = transport.request(data, ack, timeout=args.ack_timeout)
+        if ok:
+            latencies.append((time.monotonic() - sent) * 1000)
+        else:
+            lost += 1
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    report = {
+        'framed': args.framed,
+        'commands': args.commands,
+        'commands_per_s': round(args.commands / elapsed, 1),
+        'ack_p50_ms': round(latencies[len(latencies) // 2], 2) if latencies else None,
+        'ack_p95_ms': round(latencies[math.ceil(len(latencies) * 0.95) - 1], 2) if latencies else None,
+        'lost_acks': lost,
+        'samples_per_s': round(len(samples) / elapsed, 1),
+        'sensor_state': sampler.state,
+        'device': device.stats,
+    }
+    if args.framed:
+        report['transport'] = transport.stats()
+    transport.close()
+    device.close()
+    return report
+
+
+def bench_payment(args):
+    """Run the asyncio payment service against several virtual kiosks."""
+    from payment_service import FramedKiosk, PaymentService, seed_sessions
+    from serial_transport import SerialTransport
+
+    async def run(db_file):
+        cards = seed_sessions(db_file, args.kiosks, args.cards)
+        devices = [PaymentSimulator(taps, name=f'kiosk{k}', latency=args.latency, jitter=args.jitter,
+                                    corrupt=args.corrupt, framed=args.framed, seed=k)
+                   for k, taps in enumerate(cards)]
+        service = PaymentService(db_file)
+        transports = []
+        for device in devices:
+            ser = open_port(device)
+            if args.framed:
+                transport = protocol.FramedTransport(ser, name=device.port)
+                service.add_kiosk(device.name, FramedKiosk(transport))
+            else:
+                transport = SerialTransport(ser, name=device.port)
+                service.add_kiosk(device.name, transport)
+            transports.append(transport.start())
+
+        started = time.monotonic()
+        sessions = asyncio.ensure_future(service.run())
+        for device in devices:
+            device.start()
+        while not all(device.finished.is_set() for device in devices):
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.2)  # let the last settlements land
+        elapsed = time.monotonic() - started
+        sessions.cancel()
+
+        service.writer.flush()
+        report = service.metrics()
+        report['elapsed_s'] = round(elapsed, 2)
+        report['taps_per_s'] = round(sum(len(taps) for taps in cards) / elapsed, 1)
+        report['kiosk_outcomes'] = {key: sum(d.outcomes[key] for d in devices) for key in devices[0].outcomes}
+        if args.framed:
+            report['retries'] = sum(t.retries for t in transports)
+        for transport in transports:
+            transport.close()
+        for device in devices:
+            device.close()
+        service.close()
+        return report
+
+    with tempfile.TemporaryDirectory(prefix='parking-sim-') as tmp:
+        return asyncio.run(run(os.path.join(tmp, 'parking.db')))
+
+
+def serve(args):
+    """Expose virtual boards on pty paths (plug in with PARKING_PORT_ENTRY_GATE=... etc.)."""
+    devices = []
+    if args.device in ('gate', 'all'):
+        devices.append(GateSimulator(rate=args.rate, period=args.period, latency=args.latency,
+                                     jitter=args.jitter, corrupt=args.corrupt, framed=args.framed))
+    if args.device in ('payment', 'all'):
+        rng = random.Random()
+        cards = [(f"RA{rng.choice('ABCDEFGH')}{rng.randint(0, 999):03d}{rng.choice('ABCDEFGH')}", 5000)
+                 for _ in range(args.cards)]
+        devices.append(PaymentSimulator(cards, tap_interval=args.tap_interval, latency=args.latency,
+                                        jitter=args.jitter, corrupt=args.corrupt, framed=args.framed))
+    for device in devices:
+        device.start()
+        print(f"[SIMULATOR] {device.name} on {device.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for device in devices:
+            print(f"[SIMULATOR] {device.name}: {device.stats}")
+            device.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Virtual gate and payment Arduinos on pseudo-terminals')
+    parser.add_argument('mode', choices=['serve', 'bench-gate', 'bench-payment'])
+    parser.add_argument('--device', choices=['gate', 'payment', 'all'], default='all', help='serve: boards to expose')
+    parser.add_argument('--framed', action='store_true', help='Speak the framed protocol instead of text lines')
+    parser.add_argument('--latency', type=float, default=0.002, help='Reply latency (s)')
+    parser.add_argument('--jitter', type=float, default=0.001, help='Latency jitter (s)')
+    parser.add_argument('--corrupt', type=float, default=0.0, help='Probability of a flipped byte per line/frame')
+    parser.add_argument('--rate', type=float, default=10.0, help='Distance samples per second')
+    parser.add_argument('--period', type=float, default=30.0, help='Simulated car arrival period (s)')
+    parser.add_argument('--commands', type=int, default=500, help='bench-gate: gate commands to send')
+    parser.add_argument('--ack-timeout', type=float, default=0.5, help='bench-gate: ack timeout (s)')
+    parser.add_argument('--kiosks', type=int, default=4, help='bench-payment: virtual kiosks')
+    parser.add_argument('--cards', type=int, default=50, help='Card taps per kiosk')
+    parser.add_argument('--tap-interval', type=float, default=5.0, help='serve: seconds between card taps')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='[%(name)s] %(message)s')
+    if args.mode == 'serve':
+        serve(args)
+        return
+    report = bench_gate(args) if args.mode == 'bench-gate' else bench_payment(args)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from parking_db import DB_FILE, ParkingDB
+
+HOUR = 3600
+MAX_HOURS = 31 * 24  # longest range /api/stats/hourly serves
+
+
+def day_start(ts=None):
+    """Epoch of local midnight on the day of `ts` (default today)."""
+    day = datetime.fromtimestamp(ts or time.time()).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(day.timestamp())
+
+
+def hourly(db, since_ts, until_ts):
+    """Every hour in [since_ts, until_ts) with its counts, zero-filled."""
+    since_ts = int(since_ts) // HOUR * HOUR
+    until_ts = int(until_ts)
+    if until_ts - since_ts > MAX_HOURS * HOUR:
+        raise ValueError(f"range is limited to {MAX_HOURS} hours")
+    stored = {row['hour_ts']: row for row in db.hourly_stats(since_ts, until_ts)}
+    empty = {'entries': 0, 'exits': 0, 'paid': 0, 'revenue': 0.0, 'violations': 0}
+    return [stored.get(hour, {'hour_ts': hour, **empty}) for hour in range(since_ts, until_ts, HOUR)]
+
+
+def summary(db, since_ts, until_ts):
+    """Totals over [since_ts, until_ts), summed from at most MAX_HOURS buckets."""
+    totals = {'entries': 0, 'exits': 0, 'paid': 0, 'revenue': 0.0, 'violations': 0}
+    for bucket in db.hourly_stats(int(since_ts) // HOUR * HOUR, until_ts):
+        for key in totals:
+            totals[key] += bucket[key]
+    totals['revenue'] = round(totals['revenue'], 2)
+    return {'from': int(since_ts), 'to': int(until_ts), **totals}
+
+
+def peak_hours(db, since_ts, until_ts):
+    """Busiest hour by entries, by exits and by revenue in the range."""
+    buckets = db.hourly_stats(int(since_ts) // HOUR * HOUR, until_ts)
+    peaks = {}
+    for key in ('entries', 'exits', 'revenue'):
+        best = max(buckets, key=lambda bucket: bucket[key], default=None)
+        peaks[key] = None if not best or not best[key] else {
+            'hour_ts': best['hour_ts'],
+            'hour': datetime.fromtimestamp(best['hour_ts']).strftime('%Y-%m-%d %H:00'),
+            key: round(best[key], 2),
+        }
+    return peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parking summary statistics')
+    parser.add_argument('command', choices=['backfill', 'show', 'capacity'])
+    parser.add_argument('spaces', nargs='?', help="capacity: number of spaces, or 'none' for no limit")
+    parser.add_argument('--db', default=DB_FILE, help='SQLite database')
+    args = parser.parse_args()
+
+    db = ParkingDB(args.db)
+    try:
+        if args.command == 'capacity':
+            if args.spaces is None:
+                parser.error("capacity needs a number of spaces or 'none'")
+            db.set_capacity(None if args.spaces.lower() == 'none' else int(args.spaces))
+            print(f"[STATS] Capacity set to {args.spaces}")
+        elif args.command == 'backfill':
+            started = time.perf_counter()
+            db.rebuild_stats()
+            print(f"[STATS] Rebuilt summary tables in {time.perf_counter() - started:.2f}s")
+        now = time.time()
+        week_ago = datetime.fromtimestamp(now) - timedelta(days=7)
+        print(json.dumps({
+            'lot': db.lot_status(),
+            'today': summary(db, day_start(now), now + HOUR),
+            'peak_this_week': peak_hours(db, week_ago.timestamp(), now + HOUR),
+            'gates': db.gate_violation_stats(),
+        }, indent=2))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
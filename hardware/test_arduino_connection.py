@@ -1,33 +1,34 @@
 import serial
 import time
 
-def read_float(serial_port):
+from serial_transport import SerialTransport
+
+
+def read_float(line):
     """
-    Reads a line from the given serial port and returns it as a float.
-    Returns None if the line is empty or not a valid float.
+    Parses a line received from the serial port as a float.
+    Returns None if the line is not a valid float.
     """
-    if serial_port.in_waiting > 0:
-        try:
-            line = serial_port.readline().decode('utf-8').strip()
-            value = float(line)
-            return value
-        except ValueError:
-            # Invalid float received
-            return None
-    return None
+    try:
+        return float(line)
+    except ValueError:
+        # Invalid float received
+        return None
 
 # Set up the serial connection
 ser = serial.Serial('/dev/ttyACM0', 9600, timeout=1)
 time.sleep(2)  # Give the connection time to initialize
+transport = SerialTransport(ser).start()
+lines = transport.subscribe_queue()
 
 print("Reading float values from Arduino. Press Ctrl+C to stop.\n")
 
 try:
     while True:
-        value = read_float(ser)
+        value = read_float(lines.get())
         if value is not None:
             print(f"Received: {value}")
 except KeyboardInterrupt:
     print("\nStopped by user.")
 finally:
-    ser.close()
+    transport.close()
\ No newline at end of file
@@ -0,0 +1,72 @@
+import bulk_import
+from parking_db import connect
+
+
+def write_csv(path, text):
+    path.write_bytes(text.encode())
+    return str(path)
+
+
+def test_quoted_field_spanning_lines_stays_one_record(tmp_path):
+    path = write_csv(tmp_path / 'violations.csv', (
+        'timestamp,car_plate,gate_location,reason\n'
+        '2024-01-01 08:00:00,RAB123C,Entry,"Unpaid\nentry attempt"\n'
+        '2024-01-01 09:00:00,RAB124C,Exit,No active entry found\n'
+        '2024-01-01 10:00:00,RAB125C,Exit,"two\nline\nbreaks"\n'
+    ))
+    conn = connect(str(tmp_path / 'parking.db'))
+    try:
+        # A batch of 2 lines would cut the first record in half without the quote check
+        counts = bulk_import.import_file(conn, path, batch=2)
+        rows = conn.execute('SELECT car_plate, reason FROM violations ORDER BY timestamp').fetchall()
+    finally:
+        conn.close()
+
+    assert counts == {'read': 3, 'imported': 3, 'rejected': 0}
+    assert [tuple(row) for row in rows] == [
+        ('RAB123C', 'Unpaid\nentry attempt'),
+        ('RAB124C', 'No active entry found'),
+        ('RAB125C', 'two\nline\nbreaks'),
+    ]
+
+
+def entries_csv(first, count):
+    return ''.join(f'2024-01-01 {8 + n // 60:02d}:{n % 60:02d}:00,,RAB{n:03d}C,,0\n' for n in range(first, first + count))
+
+
+def test_interrupted_import_resumes_without_duplicates(tmp_path, monkeypatch, capsys):
+    path = write_csv(tmp_path / 'db.csv', 'entry_time,exit_time,car_plate,due_payment,payment_status\n'
+                     + entries_csv(0, 10))
+    conn = connect(str(tmp_path / 'parking.db'))
+    parse_batches = bulk_import.parse_batches
+
+    def interrupted(*args):
+        batches = parse_batches(*args)
+        yield next(batches)
+        raise KeyboardInterrupt
+
+    try:
+        monkeypatch.setattr(bulk_import, 'parse_batches', interrupted)
+        try:
+            bulk_import.import_file(conn, path, batch=4)
+        except KeyboardInterrupt:
+            pass
+        assert conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] == 4
+        monkeypatch.setattr(bulk_import, 'parse_batches', parse_batches)
+
+        counts = bulk_import.import_file(conn, path, batch=4)
+        assert counts == {'read': 6, 'imported': 6, 'rejected': 0}
+        assert 'resuming after line 5' in capsys.readouterr().out
+
+        # Lines appended since: only those are read
+        with open(path, 'a') as f:
+            f.write(entries_csv(10, 3))
+        assert bulk_import.import_file(conn, path, batch=4) == {'read': 3, 'imported': 3, 'rejected': 0}
+
+        # Reading everything again finds nothing new
+        assert bulk_import.import_file(conn, path, batch=4, restart=True) == {'read': 13, 'imported': 0, 'rejected': 0}
+        plates = [row[0] for row in conn.execute('SELECT car_plate FROM entries ORDER BY no')]
+    finally:
+        conn.close()
+
+    assert plates == [f'RAB{n:03d}C' for n in range(13)]
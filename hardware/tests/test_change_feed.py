@@ -0,0 +1,66 @@
+import sqlite3
+
+import change_feed
+from change_feed import RESET, ChangeFeed
+from parking_db import ParkingDB
+
+
+def next_event(sub):
+    event = sub.get(timeout=5)
+    assert event is not None, 'no event within 5 s'
+    return event
+
+
+def test_feed_survives_a_failed_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_feed, 'MIN_BACKOFF', 0.01)
+    db_file = str(tmp_path / 'parking.db')
+    writer = ParkingDB(db_file)
+    feed = ChangeFeed(db_file, interval=0.01).start()
+    try:
+        sub = feed.subscribe()
+        failures = []
+        change_events = ParkingDB.change_events
+
+        def flaky(self, after_id, *args):
+            if not failures:
+                failures.append(after_id)
+                raise sqlite3.OperationalError('database is locked')
+            return change_events(self, after_id, *args)
+
+        monkeypatch.setattr(ParkingDB, 'change_events', flaky)
+        writer.log_violation('RAB123C', 'Entry', 'test', sync=True)
+
+        event = next_event(sub)
+        assert event['table'] == 'violations' and event['row']['car_plate'] == 'RAB123C'
+        assert feed.stats['errors'] == 1
+    finally:
+        feed.close()
+        writer.close()
+
+
+def test_feed_resets_clients_when_the_log_was_pruned_meanwhile(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_feed, 'MIN_BACKOFF', 0.01)
+    db_file = str(tmp_path / 'parking.db')
+    writer = ParkingDB(db_file)
+    feed = ChangeFeed(db_file, interval=0.01).start()
+    try:
+        sub = feed.subscribe()
+        data_version = ParkingDB.data_version
+        down = [True]
+
+        def unavailable(self):
+            if down[0]:
+                raise sqlite3.OperationalError('database is locked')
+            return data_version(self)
+
+        monkeypatch.setattr(ParkingDB, 'data_version', unavailable)
+        for i in range(5):
+            writer.log_violation(f'RAB12{i}C', 'Entry', 'test', sync=True)
+        writer.prune_changes(1)
+        down[0] = False
+
+        assert next_event(sub) is RESET
+        assert feed.stats['resets'] == 1
+    finally:
+        feed.close()
+        writer.close()
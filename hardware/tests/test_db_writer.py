@@ -0,0 +1,43 @@
+import threading
+from concurrent.futures import wait
+
+import pytest
+
+from db_writer import DbWriter
+from parking_db import ParkingDB
+
+
+def test_writes_racing_close_all_resolve(tmp_path):
+    db_file = str(tmp_path / 'parking.db')
+    ParkingDB(db_file).close()
+    for _ in range(20):
+        writer = DbWriter(db_file, interval=0.001)
+        futures, start = [], threading.Event()
+
+        def submit():
+            start.wait()
+            for i in range(50):
+                try:
+                    futures.append(writer.submit('INSERT INTO violations (car_plate) VALUES (?)', (f'P{i}',)))
+                except RuntimeError:
+                    return
+
+        threads = [threading.Thread(target=submit) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        writer.close()
+        for thread in threads:
+            thread.join()
+        # Every accepted write is either committed or failed, none left waiting
+        done, pending = wait(futures, timeout=5)
+        assert not pending
+
+
+def test_submit_after_close_raises(tmp_path):
+    writer = DbWriter(str(tmp_path / 'parking.db'))
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.submit('SELECT 1')
+    with pytest.raises(RuntimeError):
+        writer.flush(timeout=1)
@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+
+import main
+
+
+class FakeBox:
+    def __init__(self, xyxy):
+        self.xyxy = [xyxy]
+
+
+class FakeResult:
+    def __init__(self, frame):
+        self.frame = frame
+        self.boxes = [FakeBox([10, 10, 90, 40])]
+
+    def plot(self):
+        return self.frame
+
+
+class FakeOcr:
+    backend = 'fake'
+
+    def __init__(self):
+        self.calls = 0
+
+    def recognize_chars(self, image):
+        self.calls += 1
+        return [(char, 1.0) for char in 'RAB123C']
+
+    def close(self):
+        pass
+
+
+def test_replay_reads_every_image(tmp_path, monkeypatch):
+    frames = tmp_path / 'frames'
+    frames.mkdir()
+    for i in range(3):
+        cv2.imwrite(str(frames / f'{i}.png'), np.full((60, 100, 3), 40 * i, np.uint8))
+
+    ocr = FakeOcr()
+    monkeypatch.setattr(main.PlateRecognitionSystem, 'load_model',
+                        lambda self: setattr(self, 'model', lambda frame: [FakeResult(frame)]))
+    monkeypatch.setattr(main.PlateRecognitionSystem, 'init_ocr', lambda self: setattr(self, 'ocr', ocr))
+    config = {
+        'model_path': None, 'camera_device': 0, 'replay_source': str(frames), 'headless': True,
+        'camera_width': 0, 'camera_height': 0, 'use_arduino': False, 'debug_mode': False,
+        'save_plate_images': False, 'save_dir': str(tmp_path / 'plates'),
+        'csv_file': str(tmp_path / 'db.csv'), 'log_file': str(tmp_path / 'logs' / 'main.log'),
+        'detection_distance': 50, 'distance_hysteresis': 10, 'entry_cooldown': 300,
+        'gate_open_duration': 15, 'consensus_confidence': 0.99, 'max_consensus_frames': 12,
+        'plate_regex': r'(RA[A-Z]\d{3}[A-Z])', 'pipeline': False, 'ocr_processes': 1,
+        'ring_slots': 2, 'ocr_backend': 'auto', 'ocr_workers': 1, 'tesseract_config': '',
+    }
+
+    # The simulated sensor reports an empty bay at first; a replay must not wait for it
+    system = main.PlateRecognitionSystem(config)
+    system.run()
+
+    assert ocr.calls == 3
+    assert system.last_saved_plate == 'RAB123C'
@@ -0,0 +1,48 @@
+import time
+
+from parking_db import MIGRATIONS, connect, migrate
+
+
+def local_epoch(text):
+    return int(time.mktime(time.strptime(text, '%Y-%m-%d %H:%M:%S')))
+
+
+def test_epoch_columns_are_backfilled_from_text_times(tmp_path):
+    conn = connect(str(tmp_path / 'parking.db'), migrate_schema=False)
+    try:
+        # A database from before migration 4, holding an open and a paid session
+        assert migrate(conn, target=3) == 3
+        with conn:
+            conn.execute("INSERT INTO entries (entry_time, exit_time, car_plate, due_payment, payment_status) "
+                         "VALUES ('2024-03-01 08:15:00', '', 'RAB123C', NULL, 0)")
+            conn.execute("INSERT INTO entries (entry_time, exit_time, car_plate, due_payment, payment_status) "
+                         "VALUES ('2024-03-01 09:00:00', '2024-03-01 11:30:00', 'RAB124C', 2.5, 1)")
+
+        assert migrate(conn) == len(MIGRATIONS)
+        rows = conn.execute('SELECT car_plate, entry_ts, exit_ts FROM entries ORDER BY no').fetchall()
+        assert [tuple(row) for row in rows] == [
+            ('RAB123C', local_epoch('2024-03-01 08:15:00'), None),
+            ('RAB124C', local_epoch('2024-03-01 09:00:00'), local_epoch('2024-03-01 11:30:00')),
+        ]
+        # Summary tables are backfilled from the same history
+        assert conn.execute('SELECT inside FROM stats_occupancy').fetchone()[0] == 1
+
+        # Writers that only fill the text columns still get epochs, through the trigger
+        with conn:
+            conn.execute("INSERT INTO entries (entry_time, exit_time, car_plate, payment_status) "
+                         "VALUES ('2024-03-02 07:00:00', '', 'RAB125C', 0)")
+        row = conn.execute("SELECT entry_ts, exit_ts FROM entries WHERE car_plate = 'RAB125C'").fetchone()
+        assert tuple(row) == (local_epoch('2024-03-02 07:00:00'), None)
+    finally:
+        conn.close()
+
+
+def test_migrating_twice_is_a_no_op(tmp_path):
+    db_file = str(tmp_path / 'parking.db')
+    connect(db_file).close()
+    conn = connect(db_file)
+    try:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == len(MIGRATIONS)
+        assert migrate(conn) == len(MIGRATIONS)
+    finally:
+        conn.close()
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from db_writer import DbWriter
+from parking_db import ParkingDB
+from process_payment import amount_due, card_balance
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / 'parking.db')
+
+
+def payments(db):
+    return [dict(row) for row in db.conn.execute(
+        'SELECT entry_no, amount, balance_before, balance_after FROM payments ORDER BY id')]
+
+
+def test_second_settlement_of_a_session_is_refused(db_file):
+    db = ParkingDB(db_file)
+    now = int(time.time())
+    no = db.add_entry('RAB123C', now - 600)
+
+    balance = 1000
+    due = amount_due(now - 600, now)
+    new_balance = card_balance(balance, due)
+    charged = balance - new_balance
+    assert db.record_payment(no, 'RAB123C', charged, balance, new_balance, paid_ts=now) is not None
+
+    entry = dict(db.entry(no))
+    stats = db.hourly_stats(now - 7200, now + 3600)
+    assert db.record_payment(no, 'RAB123C', charged, balance, new_balance, paid_ts=now + 5) is None
+
+    assert dict(db.entry(no)) == entry
+    assert db.hourly_stats(now - 7200, now + 3600) == stats
+    assert stats[-1]['paid'] == 1 and stats[-1]['revenue'] == pytest.approx(charged)
+    # The ledger adds up: what was taken is what the card lost
+    assert payments(db) == [{'entry_no': no, 'amount': charged,
+                             'balance_before': balance, 'balance_after': new_balance}]
+    assert db.open_session('RAB123C') is None
+    db.close()
+
+
+def test_concurrent_settlements_through_the_writer_record_one_payment(db_file):
+    writer = DbWriter(db_file, interval=0.05)
+    kiosks = [ParkingDB(db_file, writer=writer) for _ in range(2)]
+    no = kiosks[0].add_entry('RAB123C')
+
+    futures = [kiosk.record_payment(no, 'RAB123C', 100, 1000, 900, sync=False) for kiosk in kiosks]
+    results = [future.result(timeout=5) for future in futures]
+    assert results.count(None) == 1
+    assert len(payments(kiosks[0])) == 1
+
+    writer.close()
+    for kiosk in kiosks:
+        kiosk.close()
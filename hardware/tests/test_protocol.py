@@ -0,0 +1,52 @@
+import pytest
+
+import protocol
+from protocol import FrameDecoder, encode_frame
+
+
+def test_round_trip_in_pieces():
+    data = encode_frame(protocol.MSG_CARD, 0, protocol.encode_card('RAB123C', 1500))
+    decoder = FrameDecoder()
+    frames = []
+    for byte in data:
+        frames += decoder.feed(bytes([byte]))
+    assert len(frames) == 1
+    assert frames[0].type == protocol.MSG_CARD
+    assert protocol.decode_card(frames[0].payload) == ('RAB123C', 1500)
+
+
+def test_noise_before_a_frame_is_skipped():
+    decoder = FrameDecoder()
+    frames = decoder.feed(b'boot\r\n' + encode_frame(protocol.MSG_READY, 0))
+    assert [f.type for f in frames] == [protocol.MSG_READY]
+    assert decoder.dropped_bytes == 6
+
+
+def test_bad_crc_costs_one_frame_only():
+    good = encode_frame(protocol.MSG_WRITE_DONE, 0, protocol.encode_balance(1490))
+    corrupted = bytearray(encode_frame(protocol.MSG_WRITE_DONE, 0, protocol.encode_balance(9999)))
+    corrupted[6] ^= 0x01  # flip a payload bit
+    decoder = FrameDecoder()
+    frames = decoder.feed(bytes(corrupted) + good)
+    assert decoder.crc_errors == 1
+    assert [protocol.decode_balance(f.payload) for f in frames] == [1490]
+
+
+def test_false_start_of_frame_resyncs():
+    # An SOF byte with a bad version in front of a real frame
+    decoder = FrameDecoder()
+    frames = decoder.feed(bytes([protocol.SOF, 99]) + encode_frame(protocol.MSG_ACK, 7, b'\x00'))
+    assert [(f.type, f.seq) for f in frames] == [(protocol.MSG_ACK, 7)]
+
+
+def test_oversized_length_is_not_waited_for():
+    decoder = FrameDecoder()
+    header = bytes([protocol.SOF, protocol.VERSION, protocol.MSG_LOG, 0, protocol.MAX_PAYLOAD + 1])
+    frames = decoder.feed(header + encode_frame(protocol.MSG_READY, 0))
+    assert [f.type for f in frames] == [protocol.MSG_READY]
+
+
+def test_fractional_balance_is_refused():
+    assert protocol.decode_balance(protocol.encode_balance(1490.0)) == 1490
+    with pytest.raises(ValueError):
+        protocol.encode_balance(1490.5)
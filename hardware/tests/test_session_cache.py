@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from parking_db import ParkingDB
+from session_cache import ActiveSessions
+
+
+@pytest.fixture
+def dbs(tmp_path):
+    """Two connections to one file: the cache's and another process's."""
+    db_file = str(tmp_path / 'parking.db')
+    ours, theirs = ParkingDB(db_file), ParkingDB(db_file)
+    yield ours, theirs
+    theirs.close()
+    ours.close()
+
+
+def test_refresh_sees_another_writers_entries_and_exits(dbs):
+    ours, theirs = dbs
+    sessions = ActiveSessions(ours)
+    assert not sessions.is_inside('RAB123C')
+
+    now = int(time.time())
+    no = theirs.add_entry('RAB123C', now - 600)
+    sessions.refresh()
+    assert sessions.open_session('RAB123C') == (no, now - 600)
+    assert sessions.lot['inside'] == 1
+
+    theirs.record_exit(no, 5.0, now)
+    sessions.refresh()
+    assert not sessions.is_inside('RAB123C')
+    assert not sessions.has_unpaid('RAB123C')
+    assert sessions.recently_paid('RAB123C', 60) == now
+    assert sessions.lot['inside'] == 0
+
+
+def test_reloads_when_change_log_was_pruned_past_its_position(dbs):
+    ours, theirs = dbs
+    sessions = ActiveSessions(ours)
+    numbers = [theirs.add_entry(plate) for plate in ('RAB123C', 'RAB124C', 'RAB125C')]
+    # Only the last insert is left in the log; the first two are seen by reloading
+    theirs.prune_changes(1)
+
+    sessions.refresh()
+    assert {sessions.open_session(plate)[0] for plate in ('RAB123C', 'RAB124C', 'RAB125C')} == set(numbers)
+
+
+def test_repeated_exit_changes_nothing(dbs):
+    ours, _ = dbs
+    sessions = ActiveSessions(ours)
+    now = int(time.time())
+    no = sessions.add_entry('RAB123C', now - 600)
+    sessions.record_exit(no, 5.0, now, sync=True)
+
+    row = dict(ours.entry(no))
+    stats = ours.hourly_stats(now - 7200, now + 3600)
+    lot = ours.lot_status()
+
+    sessions.record_exit(no, 5.0, now, sync=True)
+    sessions.refresh()
+    assert dict(ours.entry(no)) == row
+    assert ours.hourly_stats(now - 7200, now + 3600) == stats
+    assert ours.lot_status() == lot == {'inside': 0, 'capacity': None, 'headroom': None}
+    assert sessions.lot['inside'] == 0
+    assert not sessions.is_inside('RAB123C')
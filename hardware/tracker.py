@@ -0,0 +1,116 @@
+from itertools import count
+
+from consensus import PlateConsensus
+
+
+def iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2) boxes."""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+def centroid_distance(a, b):
+    """Distance between box centres, relative to the size of box a."""
+    ax, ay = (a[0] + a[2]) / 2, (a[1] + a[3]) / 2
+    bx, by = (b[0] + b[2]) / 2, (b[1] + b[3]) / 2
+    scale = max(a[2] - a[0], a[3] - a[1], 1)
+    return ((ax - bx) ** 2 + (ay - by) ** 2) ** 0.5 / scale
+
+
+class Track:
+    """A plate followed across frames, with its own consensus vote."""
+
+    def __init__(self, track_id, box, consensus):
+        self.id = track_id
+        self.box = box
+        self.missed = 0
+        self.consensus = consensus
+
+    @property
+    def plate(self):
+        return self.consensus.plate
+
+    @property
+    def decided(self):
+        """True once this track has reached consensus; no more OCR needed."""
+        return self.consensus.plate is not None
+
+    @property
+    def frames(self):
+        """Number of OCR reads the current decision took."""
+        return self.consensus.frames
+
+    def vote(self, chars):
+        """Feed one OCR read [(char, confidence)]; returns the plate once decided."""
+        return self.consensus.add(chars)
+
+
+class PlateTracker:
+    """Greedy IoU tracker giving each detected plate a stable track id.
+
+    Boxes are matched to live tracks by IoU, falling back to centroid distance
+    for small fast-moving boxes; tracks unseen for max_missed updates expire.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_distance=0.5, max_missed=15,
+                 confidence=0.99, max_frames=12):
+        self.confidence = confidence
+        self.max_frames = max_frames
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.tracks = {}
+        self._ids = count(1)
+
+    def reset(self):
+        """Forget every track, e.g. when a new vehicle arrives at the gate.
+
+        Tracks only age while update() runs, and it only runs while a vehicle
+        is present; without a reset the next car stopping at the same spot
+        would inherit the previous car's decided track. Ids keep counting up.
+        """
+        self.tracks.clear()
+
+    def update(self, boxes):
+        """Match this frame's boxes to tracks; returns one Track per box, in order."""
+        candidates = []
+        for i, box in enumerate(boxes):
+            for track in self.tracks.values():
+                overlap = iou(track.box, box)
+                if overlap >= self.iou_threshold:
+                    candidates.append((1.0 + overlap, i, track.id))
+                else:
+                    distance = centroid_distance(track.box, box)
+                    if distance <= self.max_distance:
+                        candidates.append((1.0 - distance, i, track.id))
+
+        assigned = [None] * len(boxes)
+        used = set()
+        for _, i, track_id in sorted(candidates, reverse=True):
+            if assigned[i] is None and track_id not in used:
+                assigned[i] = self.tracks[track_id]
+                used.add(track_id)
+
+        for i, box in enumerate(boxes):
+            track = assigned[i]
+            if track is None:
+                track = Track(next(self._ids), box, PlateConsensus(self.confidence, self.max_frames))
+                self.tracks[track.id] = track
+                assigned[i] = track
+            track.box = box
+            track.missed = 0
+
+        seen = {track.id for track in assigned}
+        for track in list(self.tracks.values()):
+            if track.id not in seen:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    del self.tracks[track.id]
+
+        return assigned